@@ -0,0 +1,102 @@
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import revocation
+from .tokens import FAMILY_CLAIMS
+
+
+class FamilyTokenUser(TokenUser):
+    """A request user built from token claims, including the family ones."""
+
+    @cached_property
+    def family_id(self):
+        return self.token.get('family_id')
+
+    @cached_property
+    def membership_id(self):
+        return self.token.get('membership_id')
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+
+def carries_family_claims(validated_token):
+    return all(claim in validated_token for claim in FAMILY_CLAIMS)
+
+
+class FamilyJWTAuthentication(JWTAuthentication):
+    """
+    Tokens issued by budget.tokens carry the user's flags and family claims,
+    so the user is built from the token without a query. Older tokens
+    without those claims still load the User row. Revoked tokens are turned
+    away by the in-memory denylist (see budget.revocation).
+    """
+
+    def authenticate(self, request):
+        revocation.denylist.refresh()
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        revocation.check(validated_token)
+        return validated_token
+
+    def get_user(self, validated_token):
+        if carries_family_claims(validated_token):
+            return FamilyTokenUser(validated_token)
+        return super().get_user(validated_token)
+
+
+class FamilyJWTScheme(SimpleJWTScheme):
+    target_class = 'budget.authentication.FamilyJWTAuthentication'
+
+
+class AsyncJWTAuthentication(FamilyJWTAuthentication):
+    """
+    FamilyJWTAuthentication for async views. Header parsing and token
+    validation are CPU-only and reused as is; the fallback user lookup goes
+    through the async ORM.
+    """
+
+    async def aauthenticate(self, request):
+        await revocation.denylist.arefresh()
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if carries_family_claims(validated_token):
+            return FamilyTokenUser(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
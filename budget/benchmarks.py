@@ -0,0 +1,172 @@
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import checkpoints, rollups
+from .categories import attach
+from .models import BudgetCategory, Family, FamilyMembership, Transaction
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+@contextmanager
+def scratch_ledger(rows, categories=10):
+    """Yield the membership of a throwaway family with ``rows`` transactions; everything is rolled back on exit."""
+    with rolled_back():
+        user = User.objects.create(username=f'bench-{time.time_ns()}')
+        family = Family.objects.create(name='Benchmark', created_by=user)
+        membership = FamilyMembership.objects.create(user=user, family=family, role='owner')
+        category_rows = BudgetCategory.objects.bulk_create(
+            [BudgetCategory(user=user, name=f'Category {index}') for index in range(categories)]
+        )
+        attach(category_rows)
+        category_ids = [category.pk for category in category_rows]
+        start = date(2000, 1, 1)
+        batch = []
+        for index in range(rows):
+            batch.append(Transaction(
+                amount=Decimal(index % 10000) / 100, date=start + timedelta(days=index // 100),
+                description=f'row {index}', category_id=category_ids[index % categories],
+                member=membership, family=family, user=user,
+                type=Transaction.INCOME if index % 5 == 0 else Transaction.EXPENSE,
+            ))
+            if len(batch) == 10000:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        Transaction.objects.bulk_create(batch)
+        yield membership
+
+
+CATEGORY_NAMES = (
+    'Продукты', 'Транспорт', 'Коммунальные услуги', 'Кафе и рестораны', 'Здоровье', 'Одежда',
+    'Развлечения', 'Связь', 'Образование', 'Подарки', 'Дом', 'Путешествия', 'Зарплата', 'Подработка',
+)
+INCOME_CATEGORIES = ('Зарплата', 'Подработка')
+EXPENSE_DESCRIPTIONS = (
+    'Пятёрочка', 'Перекрёсток', 'ВкусВилл', 'Яндекс Такси', 'Метро', 'Аптека', 'Кофейня', 'Ozon',
+    'Wildberries', 'ЖКХ', 'Мобильная связь', 'Интернет', 'Кинотеатр', 'АЗС', 'Coffee', 'Pharmacy',
+)
+INCOME_DESCRIPTIONS = ('Зарплата', 'Аванс', 'Премия', 'Фриланс', 'Кэшбэк')
+
+
+def zipf_counts(total, buckets, skew):
+    """Split ``total`` over ``buckets`` with weights 1/(i+1)**skew; skew 0 is uniform."""
+    weights = [1 / (index + 1) ** skew for index in range(buckets)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for index in range(total - sum(counts)):
+        counts[index % buckets] += 1
+    return counts
+
+
+def seed(families, members, transactions, categories=len(CATEGORY_NAMES), skew=1.0, seed_value=0,
+         start=date(2020, 1, 1), days=4 * 365, prefix='seed', password='password', batch_size=5000, log=None):
+    """
+    Insert a deterministic synthetic dataset: ``families`` families of 1..``members``
+    users, each owner with ``categories`` categories, and ``transactions`` rows
+    spread over the families by a Zipf distribution with exponent ``skew``.
+    Everything goes through ``bulk_create``; rollups are rebuilt at the end.
+    Returns the created family ids, largest ledger first.
+    """
+    rng = random.Random(seed_value)
+    hashed = make_password(password)
+    names = CATEGORY_NAMES[:categories] + tuple(
+        f'Категория {index}' for index in range(len(CATEGORY_NAMES), categories)
+    )
+
+    with transaction.atomic():
+        sizes = [rng.randint(1, members) for _ in range(families)]
+        users = User.objects.bulk_create(
+            [
+                User(username=f'{prefix}-{family}-{member}', email=f'{prefix}-{family}-{member}@example.com',
+                     password=hashed)
+                for family, size in enumerate(sizes) for member in range(size)
+            ],
+            batch_size=batch_size,
+        )
+        family_users, offset = [], 0
+        for size in sizes:
+            family_users.append(users[offset:offset + size])
+            offset += size
+
+        family_rows = Family.objects.bulk_create(
+            [Family(name=f'Семья {index}', created_by=group[0]) for index, group in enumerate(family_users)],
+            batch_size=batch_size,
+        )
+        memberships = FamilyMembership.objects.bulk_create(
+            [
+                FamilyMembership(user=user, family=family, role='owner' if position == 0 else 'member')
+                for family, group in zip(family_rows, family_users) for position, user in enumerate(group)
+            ],
+            batch_size=batch_size,
+        )
+        category_rows = BudgetCategory.objects.bulk_create(
+            [BudgetCategory(user=group[0], name=name) for group in family_users for name in names],
+            batch_size=batch_size,
+        )
+        attach(category_rows)
+
+        by_family, offset = [], 0
+        for family, group in zip(family_rows, family_users):
+            by_family.append((family, memberships[offset:offset + len(group)]))
+            offset += len(group)
+        positions = range(len(names))
+        category_weights = list(itertools.accumulate(1 / (index + 1) for index in positions))
+        income_positions = [index for index, name in enumerate(names) if name in INCOME_CATEGORIES]
+
+        inserted, batch = 0, []
+        counts = zipf_counts(transactions, families, skew)
+        for index, ((family, family_memberships), count) in enumerate(zip(by_family, counts)):
+            family_categories = category_rows[index * len(names):(index + 1) * len(names)]
+            for _ in range(count):
+                member = rng.choice(family_memberships)
+                position = rng.choices(positions, cum_weights=category_weights)[0]
+                if position in income_positions:
+                    type_, amount = Transaction.INCOME, rng.lognormvariate(11, 0.4)
+                    description = rng.choice(INCOME_DESCRIPTIONS)
+                else:
+                    type_, amount = Transaction.EXPENSE, rng.lognormvariate(6.5, 1.1)
+                    description = rng.choice(EXPENSE_DESCRIPTIONS)
+                batch.append(Transaction(
+                    amount=Decimal(min(amount, 99999999)).quantize(Decimal('0.01')),
+                    date=start + timedelta(days=rng.randrange(days)),
+                    description=description, category_id=family_categories[position].pk, type=type_,
+                    member_id=member.pk, user_id=member.user_id, family_id=family.pk,
+                ))
+                if len(batch) == batch_size:
+                    Transaction.objects.bulk_create(batch)
+                    inserted += len(batch)
+                    batch = []
+                    if log:
+                        log(inserted)
+        if batch:
+            Transaction.objects.bulk_create(batch)
+            inserted += len(batch)
+            if log:
+                log(inserted)
+
+        family_ids = [family.pk for family in family_rows]
+        for offset in range(0, len(family_ids), 500):
+            rollups.rebuild(family_ids[offset:offset + 500])
+            checkpoints.refresh(family_ids[offset:offset + 500], rollups.month_start(date.today()))
+    return family_ids
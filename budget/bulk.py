@@ -0,0 +1,145 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .ledger import current_state, make_state, send_changes
+from .models import BudgetCategory, FamilyMembership, Transaction
+from .serializers_bulk import BulkTransactionItemSerializer
+
+UPDATE_FIELDS = ['amount', 'currency', 'description', 'date', 'category', 'type']
+
+REPEATED = {'id': ['This transaction is listed more than once in update and delete.']}
+
+
+class BulkResult:
+
+    def __init__(self):
+        self.results = {'create': [], 'update': [], 'delete': []}
+        self.failed = False
+
+    def ok(self, section, index, pk, status=200):
+        self.results[section].append({'index': index, 'id': pk, 'status': status})
+
+    def error(self, section, index, status, errors, pk=None):
+        self.failed = True
+        self.results[section].append({'index': index, 'id': pk, 'status': status, 'errors': errors})
+
+
+def _family_category_ids(family_id):
+    member_user_ids = FamilyMembership.objects.filter(family_id=family_id).values('user_id')
+    return set(BudgetCategory.objects.filter(user__in=member_user_ids).values_list('pk', flat=True))
+
+
+def _validate(item, category_ids, partial):
+    serializer = BulkTransactionItemSerializer(data=item, partial=partial)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    data = serializer.validated_data
+    if 'category' in data and data['category'] not in category_ids:
+        return None, {'category': ['Category not found in your family.']}
+    return data, None
+
+
+def apply_bulk(membership, user, create=(), update=(), delete=(), all_or_nothing=False):
+    """
+    Validate and write a batch of transactions with a fixed number of queries:
+    one for the family's categories, one for the rows being changed and one
+    write per operation type. Updates and deletes keep IsOwnerOrReadOnly
+    semantics: only the transaction's author may change it. An id listed
+    more than once across update and delete fails at every occurrence, since
+    each would send its own ledger change from the same loaded row.
+    """
+    result = BulkResult()
+    category_ids = _family_category_ids(membership.family_id)
+
+    to_create = []
+    for index, item in enumerate(create):
+        data, errors = _validate(item, category_ids, partial=False)
+        if errors:
+            result.error('create', index, 400, errors)
+            continue
+        data.pop('id', None)
+        to_create.append((index, Transaction(
+            amount=data['amount'],
+            description=data.get('description', ''),
+            date=data['date'],
+            category_id=data['category'],
+            type=data['type'],
+            currency=data['currency'],
+            member_id=membership.pk,
+            family_id=membership.family_id,
+            user_id=user.pk,
+        )))
+
+    listed = Counter(item.get('id') for item in update if isinstance(item.get('id'), int))
+    listed.update(delete)
+    target_ids = set(listed)
+    existing = {
+        obj.pk: obj
+        for obj in Transaction.objects.filter(family_id=membership.family_id, pk__in=target_ids)
+    }
+
+    to_update = []
+    for index, item in enumerate(update):
+        pk = item.get('id')
+        obj = existing.get(pk)
+        if listed[pk] > 1:
+            result.error('update', index, 400, REPEATED, pk)
+            continue
+        if obj is None:
+            result.error('update', index, 404, {'detail': 'Not found.'}, pk)
+            continue
+        if obj.user_id != user.pk:
+            result.error('update', index, 403, {'detail': 'You do not have permission to perform this action.'}, pk)
+            continue
+        data, errors = _validate(item, category_ids, partial=True)
+        if errors:
+            result.error('update', index, 400, errors, pk)
+            continue
+        old = make_state(obj._loaded_values)
+        for field in UPDATE_FIELDS:
+            if field in data:
+                setattr(obj, 'category_id' if field == 'category' else field, data[field])
+        to_update.append((index, obj, old))
+
+    to_delete = []
+    for index, pk in enumerate(delete):
+        obj = existing.get(pk)
+        if listed[pk] > 1:
+            result.error('delete', index, 400, REPEATED, pk)
+        elif obj is None:
+            result.error('delete', index, 404, {'detail': 'Not found.'}, pk)
+        elif obj.user_id != user.pk:
+            result.error('delete', index, 403, {'detail': 'You do not have permission to perform this action.'}, pk)
+        else:
+            to_delete.append((index, obj))
+
+    if all_or_nothing and result.failed:
+        return result
+
+    with transaction.atomic():
+        changes = []
+        created = Transaction.objects.bulk_create([obj for _, obj in to_create], batch_size=500)
+        changes += [(None, current_state(obj)) for obj in created]
+
+        Transaction.objects.bulk_update([obj for _, obj, _ in to_update], UPDATE_FIELDS, batch_size=500)
+        changes += [(old, current_state(obj)) for _, obj, old in to_update]
+
+        if to_delete:
+            # Nothing references Transaction, so a plain DELETE matches what the
+            # collector would do; ledger_changed below replaces post_delete.
+            doomed = Transaction.objects.filter(pk__in=[obj.pk for _, obj in to_delete])
+            doomed._raw_delete(doomed.db)
+            changes += [(make_state(obj._loaded_values), None) for _, obj in to_delete]
+
+        send_changes(changes)
+
+    for index, obj in to_create:
+        result.ok('create', index, obj.pk, status=201)
+    for index, obj, _ in to_update:
+        result.ok('update', index, obj.pk)
+    for index, obj in to_delete:
+        result.ok('delete', index, obj.pk, status=204)
+    for section in result.results.values():
+        section.sort(key=lambda entry: entry['index'])
+    return result
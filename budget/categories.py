@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from . import fx
+from .models import BudgetCategory, CategoryClosure, FamilyMembership, MonthlyRollup, Transaction
+
+
+def subtree(category_id):
+    """Ids of ``category_id`` and all its descendants, as a subquery on the closure's unique index."""
+    return CategoryClosure.objects.filter(ancestor_id=category_id).values('descendant_id')
+
+
+def attach(categories):
+    """
+    Write the closure rows of new categories: the one to itself, and one to
+    every ancestor of its parent, a level deeper. Parents must be attached
+    already, as after post_save or a bulk_create of roots.
+    """
+    categories = list(categories)
+    parent_ids = {category.parent_id for category in categories if category.parent_id is not None}
+    ancestors = defaultdict(list)
+    if parent_ids:
+        links = CategoryClosure.objects.filter(descendant_id__in=parent_ids).values_list(
+            'descendant_id', 'ancestor_id', 'depth',
+        )
+        for parent_id, ancestor_id, depth in links:
+            ancestors[parent_id].append((ancestor_id, depth))
+
+    rows = []
+    for category in categories:
+        rows.append(CategoryClosure(ancestor_id=category.pk, descendant_id=category.pk, depth=0))
+        rows += [
+            CategoryClosure(ancestor_id=ancestor_id, descendant_id=category.pk, depth=depth + 1)
+            for ancestor_id, depth in ancestors[category.parent_id]
+        ]
+    CategoryClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+def move(category):
+    """
+    Re-hang the subtree of ``category`` under its current parent: one delete
+    of the links to the old ancestors, one insert of the new ones, whatever
+    the subtree's size.
+    """
+    with transaction.atomic():
+        members = subtree(category.pk)
+        CategoryClosure.objects.filter(descendant__in=members).exclude(ancestor__in=members).delete()
+        if category.parent_id is None:
+            return
+        nodes = list(CategoryClosure.objects.filter(ancestor_id=category.pk).values_list('descendant_id', 'depth'))
+        ancestors = CategoryClosure.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth')
+        CategoryClosure.objects.bulk_create(
+            [
+                CategoryClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=above + below + 1)
+                for ancestor_id, above in ancestors
+                for descendant_id, below in nodes
+            ],
+            batch_size=1000,
+        )
+
+
+def is_descendant(category_id, ancestor_id):
+    return CategoryClosure.objects.filter(ancestor_id=ancestor_id, descendant_id=category_id).exists()
+
+
+def _period(queryset, start, end, field):
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lt': (end + timedelta(days=32)).replace(day=1)})
+    return queryset
+
+
+def tree_totals(family_id, base, start=None, end=None, category_id=None):
+    """
+    Own and subtree income/expense of the family's categories for the months
+    ``start``..``end``, in ``base``. Each rollup bucket is joined to every
+    ancestor of its category and summed per ancestor in one query; foreign
+    currency buckets are converted from their transactions in a second one.
+    Returns {category id: {type: [own, subtree]}} and the number of rows
+    left out for want of an exchange rate.
+    """
+    own = Q(category__ancestor_links__depth=0)
+    buckets = _period(MonthlyRollup.objects.filter(family_id=family_id), start, end, 'month')
+    if category_id is not None:
+        buckets = buckets.filter(category_id__in=subtree(category_id))
+    rows = (
+        buckets
+        .values('category__ancestor_links__ancestor_id', 'type', 'currency')
+        .annotate(own_total=Sum('total', filter=own), subtree_total=Sum('total'))
+        .order_by()
+    )
+
+    zero = Decimal('0')
+    totals = defaultdict(lambda: {
+        Transaction.INCOME: [zero, zero], Transaction.EXPENSE: [zero, zero],
+    })
+    foreign = set()
+    for row in rows:
+        if row['currency']:
+            foreign.add(row['currency'])
+            continue
+        entry = totals[row['category__ancestor_links__ancestor_id']][row['type']]
+        entry[0] += row['own_total'] or zero
+        entry[1] += row['subtree_total']
+
+    unconverted = 0
+    if foreign:
+        ledger = _period(
+            Transaction.objects.filter(family_id=family_id, currency__in=sorted(foreign)), start, end, 'date',
+        )
+        if category_id is not None:
+            ledger = ledger.filter(category_id__in=subtree(category_id))
+        converted = (
+            ledger
+            .annotate(amount_in_base=fx.in_base(base))
+            .values('category__ancestor_links__ancestor_id', 'type')
+            .annotate(
+                own_total=Sum('amount_in_base', filter=own),
+                subtree_total=Sum('amount_in_base'),
+                unconverted=Count('id', filter=own & Q(amount_in_base__isnull=True)),
+            )
+            .order_by()
+        )
+        for row in converted:
+            entry = totals[row['category__ancestor_links__ancestor_id']][row['type']]
+            entry[0] += (row['own_total'] or zero).quantize(fx.CENT)
+            entry[1] += (row['subtree_total'] or zero).quantize(fx.CENT)
+            unconverted += row['unconverted']
+    return totals, unconverted
+
+
+def family_categories(family_id, category_id=None):
+    member_user_ids = FamilyMembership.objects.filter(family_id=family_id).values('user_id')
+    queryset = BudgetCategory.objects.filter(user__in=member_user_ids)
+    if category_id is not None:
+        queryset = queryset.filter(pk__in=subtree(category_id))
+    return queryset.order_by('id').values_list('id', 'name', 'parent_id')
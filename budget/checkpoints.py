@@ -0,0 +1,207 @@
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from . import fx
+from .models import BalanceCheckpoint, Family, Transaction
+from .rollups import month_start
+from .series import signed_in_base
+
+
+def next_month(day):
+    return (day + timedelta(days=32)).replace(day=1)
+
+
+def _monthly(queryset, base, group=()):
+    """Net amount in ``base`` and row count per month (and ``group`` fields)."""
+    return (
+        queryset
+        .annotate(month=TruncMonth('date'), amount_in_base=fx.in_base(base))
+        .values(*group, 'month')
+        .annotate(net=Sum(signed_in_base()), count=Count('id'))
+        .order_by()
+    )
+
+
+def _boundaries(start, months, until):
+    """
+    (as_of, balance, count) of every month start after ``start`` up to
+    ``until``. ``start`` is the (as_of, balance, count) of the latest
+    checkpoint, or None to begin after the first month in ``months``, which
+    maps month starts to their (net, count).
+    """
+    if start is None:
+        if not months:
+            return []
+        start = (min(months), Decimal('0'), 0)
+    current, balance, count = start
+    points = []
+    while current < until:
+        net, rows = months.get(current, (Decimal('0'), 0))
+        balance, count = balance + net, count + rows
+        current = next_month(current)
+        points.append((current, balance, count))
+    return points
+
+
+def _latest(family_ids, until):
+    """The latest checkpoint up to ``until`` per (family, member) key."""
+    last = {
+        (row['family_id'], row['member_id']): row['last']
+        for row in (
+            BalanceCheckpoint.objects
+            .filter(family_id__in=family_ids, as_of__lte=until)
+            .values('family_id', 'member_id')
+            .annotate(last=Max('as_of'))
+            .order_by()
+        )
+    }
+    if not last:
+        return {}
+    rows = (
+        BalanceCheckpoint.objects
+        .filter(family_id__in=family_ids, as_of__in=set(last.values()))
+        .values_list('family_id', 'member_id', 'as_of', 'balance', 'count')
+    )
+    return {
+        (family_id, member_id): (as_of, balance, count)
+        for family_id, member_id, as_of, balance, count in rows
+        if last.get((family_id, member_id)) == as_of
+    }
+
+
+def refresh(family_ids, until):
+    """
+    Write the missing checkpoints up to the month start ``until`` for the
+    families and each of their members. A family is read from its latest
+    family-wide checkpoint on: invalidation drops a family's checkpoints
+    together with those of the members involved, so no member key starts
+    earlier. Returns the number of checkpoints written.
+    """
+    family_ids = list(family_ids)
+    latest = _latest(family_ids, until)
+    by_base = defaultdict(list)
+    for family_id, base in Family.objects.filter(pk__in=family_ids).values_list('pk', 'base_currency'):
+        by_base[base].append(family_id)
+
+    months = defaultdict(dict)
+    for base, ids in by_base.items():
+        scopes = [
+            Q(family_id=family_id, date__gte=latest[family_id, None][0])
+            for family_id in ids if (family_id, None) in latest
+        ]
+        fresh = [family_id for family_id in ids if (family_id, None) not in latest]
+        if fresh:
+            scopes.append(Q(family_id__in=fresh))
+        rows = _monthly(
+            Transaction.objects.filter(reduce(or_, scopes), date__lt=until), base, ('family_id', 'member_id'),
+        )
+        for row in rows:
+            net, count = row['net'] or Decimal('0'), row['count']
+            for key in ((row['family_id'], None), (row['family_id'], row['member_id'])):
+                total = months[key].get(row['month'], (Decimal('0'), 0))
+                months[key][row['month']] = (total[0] + net, total[1] + count)
+
+    checkpoints = []
+    for key in set(months) | set(latest):
+        start = latest.get(key)
+        since = start[0] if start else None
+        key_months = {month: value for month, value in months[key].items() if since is None or month >= since}
+        checkpoints += [
+            BalanceCheckpoint(
+                family_id=key[0], member_id=key[1], as_of=as_of, balance=balance, count=count,
+            )
+            for as_of, balance, count in _boundaries(start, key_months, until)
+        ]
+    BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=1000, ignore_conflicts=True)
+    return len(checkpoints)
+
+
+def balance_on(family_id, day, member_id=None, base=None):
+    """
+    Balance at the end of ``day`` in the family's base currency, for the
+    family or one member: the nearest checkpoint plus the transactions after
+    it. When those include whole months before the current one, the
+    checkpoints in between are missing (never written, or dropped by a
+    back-dated change) and are written for next time.
+    Returns (balance, as_of of the checkpoint used or None).
+    """
+    base = base or fx.base_currency(family_id)
+    end = day + timedelta(days=1)
+    checkpoint = (
+        BalanceCheckpoint.objects
+        .filter(family_id=family_id, member_id=member_id, as_of__lte=end)
+        .order_by('-as_of')
+        .values_list('as_of', 'balance')
+        .first()
+    )
+    ledger = Transaction.objects.filter(family_id=family_id, date__lt=end)
+    if member_id is not None:
+        ledger = ledger.filter(member_id=member_id)
+    if checkpoint is not None:
+        ledger = ledger.filter(date__gte=checkpoint[0])
+
+    rows = list(_monthly(ledger, base))
+    balance = (checkpoint[1] if checkpoint else Decimal('0')) + sum(
+        (row['net'] or Decimal('0') for row in rows), Decimal('0'),
+    )
+    until = min(month_start(end), month_start(date.today()))
+    if any(row['month'] < until for row in rows):
+        refresh([family_id], until)
+    return balance, checkpoint[0] if checkpoint else None
+
+
+def drop_after(changes):
+    """
+    Drop the checkpoints that back-dated changes made wrong: the family's
+    and the involved members' ones after the earliest changed date. Changes
+    dated in the current month touch no checkpoint.
+    """
+    cutoff = month_start(date.today())
+    earliest, members = {}, defaultdict(set)
+    for pair in changes:
+        for state in pair:
+            if state is None or state.family_id is None or state.date >= cutoff:
+                continue
+            earliest[state.family_id] = min(state.date, earliest.get(state.family_id, state.date))
+            members[state.family_id].add(state.member_id)
+    for family_id, day in earliest.items():
+        (
+            BalanceCheckpoint.objects
+            .filter(family_id=family_id, as_of__gt=day)
+            .filter(Q(member__isnull=True) | Q(member_id__in=members[family_id]))
+            .delete()
+        )
+
+
+@dataclass
+class CheckpointReport:
+    families: int = 0
+    written: int = 0
+    elapsed: float = 0.0
+
+
+def write(until=None, chunk_size=500, family_ids=None, log=None):
+    """Write the checkpoints of every family up to the month start ``until`` (default: this month)."""
+    until = month_start(until or date.today())
+    started = time.perf_counter()
+    families = Family.objects.order_by('pk')
+    if family_ids is not None:
+        families = families.filter(pk__in=family_ids)
+    families = list(families.values_list('pk', flat=True))
+    report = CheckpointReport(families=len(families))
+    for index in range(0, len(families), chunk_size):
+        with transaction.atomic():
+            report.written += refresh(families[index:index + chunk_size], until)
+        if log:
+            log(report)
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,183 @@
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import membership, sync, versioning
+from .ledger import STATE_FIELDS, make_state, send_changes
+from .models import (
+    BalanceCheckpoint, BudgetAlert, BudgetCategory, CategoryClosure, ChangeLog, Family, FamilyMembership,
+    InviteCode, MonthlyRollup, RecurringTransaction, Transaction,
+)
+
+# Rows removed per statement and per transaction.
+BATCH_SIZE = 500
+
+
+@dataclass
+class DeletionReport:
+    # Rows deleted per model label, as QuerySet.delete() counts them.
+    deleted: Counter = field(default_factory=Counter)
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def total(self):
+        return sum(self.deleted.values())
+
+    def as_dict(self):
+        return {'deleted': self.total, 'rows': dict(self.deleted), 'batches': self.batches, 'elapsed': self.elapsed}
+
+
+def _raw_delete(batch):
+    return batch._raw_delete(batch.db)
+
+
+def _ledger_delete(batch):
+    # Transactions of families that stay: their rollups, checkpoints and
+    # change log follow through ledger_changed, as post_delete would do.
+    states = [make_state(values) for values in batch.values(*STATE_FIELDS)]
+    deleted = _raw_delete(batch)
+    send_changes([(state, None) for state in states])
+    return deleted
+
+
+def _membership_delete(batch, record):
+    memberships = list(batch)
+    deleted = _raw_delete(batch)
+    membership.invalidate(*{item.user_id for item in memberships})
+    versioning.bump(*{item.family_id for item in memberships})
+    if record:
+        for item in memberships:
+            sync.record_membership(item, deleted=True)
+    return deleted
+
+
+def _drain(queryset, report, batch_size, log, delete=_raw_delete, before=None):
+    """
+    Delete the rows of ``queryset`` ``batch_size`` at a time, each batch by
+    primary key in its own short transaction. ``before(ids)`` clears what
+    still points at a batch, the way SET_NULL would.
+    """
+    model = queryset.model
+    ids_query = queryset.order_by().values_list('pk', flat=True)
+    while True:
+        with transaction.atomic():
+            ids = list(ids_query[:batch_size])
+            if not ids:
+                return
+            if before:
+                before(ids)
+            deleted = delete(model.objects.filter(pk__in=ids))
+        report.deleted[model._meta.label] += deleted
+        report.batches += 1
+        if log:
+            log(report)
+
+
+def _delete_root(queryset, report):
+    # Only the row itself and small relations (sessions, admin log, jobs)
+    # are left for the collector, which also sends the row's post_delete.
+    with transaction.atomic():
+        _, per_model = queryset.delete()
+    report.deleted.update(per_model)
+
+
+def _unlink_recurring(ids):
+    Transaction.objects.filter(recurring_id__in=ids).update(recurring=None)
+
+
+def _delete_family(family_id, report, batch_size, log):
+    # Transaction.family is a copy of member.family, so the family's rows
+    # cover those of its memberships too. All of the family's derived data
+    # goes with it, so no ledger_changed is sent.
+    _drain(BalanceCheckpoint.objects.filter(family_id=family_id), report, batch_size, log)
+    _drain(BudgetAlert.objects.filter(family_id=family_id), report, batch_size, log)
+    _drain(MonthlyRollup.objects.filter(family_id=family_id), report, batch_size, log)
+    _drain(Transaction.objects.filter(family_id=family_id), report, batch_size, log)
+    _drain(
+        RecurringTransaction.objects.filter(family_id=family_id), report, batch_size, log, before=_unlink_recurring,
+    )
+    _drain(InviteCode.objects.filter(family_id=family_id), report, batch_size, log)
+    _drain(
+        FamilyMembership.objects.filter(family_id=family_id), report, batch_size, log,
+        delete=lambda batch: _membership_delete(batch, record=False),
+    )
+    _delete_root(Family.objects.filter(pk=family_id), report)
+    # Entries of a deleted family would be orphans; compaction drops those too.
+    _drain(ChangeLog.objects.filter(family_id=family_id), report, batch_size, log)
+
+
+def delete_family(family_id, batch_size=BATCH_SIZE, log=None):
+    """
+    Delete a family and everything that cascades from it in batches of raw
+    DELETEs, children before parents, instead of one collector pass that
+    loads every row. ``log(report)`` is called after each batch. Leaves the
+    same rows behind as ``Family.delete()``.
+    """
+    started = time.perf_counter()
+    report = DeletionReport()
+    _delete_family(family_id, report, batch_size, log)
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def _detach_children(category_ids):
+    # on_delete of BudgetCategory.parent for the categories of other users
+    # hanging under the deleted ones (see models.detach_children).
+    children = BudgetCategory.objects.filter(parent__in=category_ids).exclude(pk__in=category_ids)
+    subtree = CategoryClosure.objects.filter(ancestor__in=children).values('descendant_id')
+    links = CategoryClosure.objects.filter(descendant__in=subtree).exclude(ancestor__in=subtree)
+    links._raw_delete(links.db)
+
+
+def delete_user(user_id, batch_size=BATCH_SIZE, log=None):
+    """
+    Delete a user the way ``delete_family`` deletes a family: the family
+    they own, then their rows in the families they belong to, sending
+    ledger_changed for those so the families' rollups stay right, then
+    their categories and the user. Leaves the same rows behind as
+    ``User.delete()``.
+    """
+    started = time.perf_counter()
+    report = DeletionReport()
+    family_id = Family.objects.filter(created_by_id=user_id).values_list('pk', flat=True).first()
+    if family_id is not None:
+        _delete_family(family_id, report, batch_size, log)
+
+    membership_ids = list(FamilyMembership.objects.filter(user_id=user_id).values_list('pk', flat=True))
+    categories = BudgetCategory.objects.filter(user_id=user_id)
+    category_ids = categories.values('pk')
+    for ledger in (
+        Transaction.objects.filter(member_id__in=membership_ids),
+        Transaction.objects.filter(user_id=user_id),
+        Transaction.objects.filter(category_id__in=category_ids),
+    ):
+        _drain(ledger, report, batch_size, log, delete=_ledger_delete)
+    for templates in (
+        RecurringTransaction.objects.filter(member_id__in=membership_ids),
+        RecurringTransaction.objects.filter(user_id=user_id),
+        RecurringTransaction.objects.filter(category_id__in=category_ids),
+    ):
+        _drain(templates, report, batch_size, log, before=_unlink_recurring)
+    _drain(BalanceCheckpoint.objects.filter(member_id__in=membership_ids), report, batch_size, log)
+    # Logs the tombstones of the user's categories too, so it goes first.
+    _drain(
+        FamilyMembership.objects.filter(pk__in=membership_ids), report, batch_size, log,
+        delete=lambda batch: _membership_delete(batch, record=True),
+    )
+
+    _drain(MonthlyRollup.objects.filter(category_id__in=category_ids), report, batch_size, log)
+    _drain(BudgetAlert.objects.filter(category_id__in=category_ids), report, batch_size, log)
+    _detach_children(category_ids)
+    _drain(CategoryClosure.objects.filter(ancestor_id__in=category_ids), report, batch_size, log)
+    _drain(CategoryClosure.objects.filter(descendant_id__in=category_ids), report, batch_size, log)
+    _drain(
+        categories, report, batch_size, log,
+        before=lambda ids: BudgetCategory.objects.filter(parent_id__in=ids).update(parent=None),
+    )
+    _delete_root(User.objects.filter(pk=user_id), report)
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+from .categories import subtree
+from .models import Transaction
+
+COLUMNS = (
+    ('id', 'id'),
+    ('date', 'date'),
+    ('type', 'type'),
+    ('amount', 'amount'),
+    ('currency', 'currency'),
+    ('category', 'category_id'),
+    ('category_name', 'category__name'),
+    ('description', 'description'),
+    ('member', 'member_id'),
+    ('user', 'user_id'),
+    ('user_name', 'user__username'),
+)
+HEADER = [name for name, _ in COLUMNS]
+CHUNK_ROWS = 2000
+
+
+def export_queryset(family_id, date_from=None, date_to=None, category=None, type=None):
+    queryset = Transaction.objects.filter(family_id=family_id)
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to)
+    if category is not None:
+        queryset = queryset.filter(category_id__in=subtree(category))
+    if type is not None:
+        queryset = queryset.filter(type=type)
+    return queryset.order_by('date', 'id')
+
+
+def iter_rows(queryset):
+    # iterator() streams from a server-side cursor on PostgreSQL and fetchmany()
+    # elsewhere, so memory stays bounded by CHUNK_ROWS regardless of ledger size.
+    return queryset.values_list(*(lookup for _, lookup in COLUMNS)).iterator(chunk_size=CHUNK_ROWS)
+
+
+def _format(row):
+    row = list(row)
+    row[1] = row[1].isoformat()
+    row[3] = format(row[3], 'f')
+    return row
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(_format(row))
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(HEADER, _format(row))), ensure_ascii=False))
+        if len(lines) == CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_chunks),
+    'ndjson': ('application/x-ndjson; charset=utf-8', ndjson_chunks),
+}
@@ -0,0 +1,16 @@
+from django_filters import rest_framework as filters
+
+from .categories import subtree
+from .models import BudgetCategory, Transaction
+
+
+class TransactionFilter(filters.FilterSet):
+    # A category matches its whole subtree.
+    category = filters.ModelChoiceFilter(queryset=BudgetCategory.objects.all(), method='filter_category')
+
+    class Meta:
+        model = Transaction
+        fields = ['amount', 'date', 'category']
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(category_id__in=subtree(value.pk))
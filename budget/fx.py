@@ -0,0 +1,167 @@
+import csv
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from . import versioning
+from .models import BalanceCheckpoint, ExchangeRate, Family, MonthlyRollup, Transaction, currency_code
+
+# Currency every ExchangeRate.rate is quoted against; its own rate is 1.
+PIVOT = getattr(settings, 'BUDGET_FX_PIVOT', 'EUR')
+
+CENT = Decimal('0.01')
+
+
+def base_currency(family_id):
+    return Family.objects.filter(pk=family_id).values_list('base_currency', flat=True).first()
+
+
+async def abase_currency(family_id):
+    return await Family.objects.filter(pk=family_id).values_list('base_currency', flat=True).afirst()
+
+
+def rate_on(currency, day):
+    """
+    The latest rate of ``currency`` on or before ``day`` as a subquery; either
+    may be an OuterRef. Weekends and holidays fall back to the last quoted
+    day through the (currency, date) unique index.
+    """
+    if currency == PIVOT:
+        return Value(Decimal('1'))
+    return Subquery(
+        ExchangeRate.objects
+        .filter(currency=currency, date__lte=day)
+        .order_by('-date')
+        .values('rate')[:1]
+    )
+
+
+def in_base(base):
+    """
+    A transaction's amount in ``base``, converted at the rate of its date;
+    NULL when either rate is missing. Base currency rows never reach the
+    rate subqueries.
+    """
+    source_rate = Case(
+        When(currency=PIVOT, then=Value(Decimal('1'))),
+        default=rate_on(OuterRef('currency'), OuterRef('date')),
+    )
+    return Case(
+        When(Q(currency='') | Q(currency=base), then=F('amount')),
+        default=F('amount') * rate_on(base, OuterRef('date')) / source_rate,
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+def converted_totals(family_id, base, currencies, start=None, end=None, category_ids=None):
+    """
+    Totals per (month, category, type) of the family's ``currencies``
+    transactions in ``base``, converted row by row at each transaction's
+    date inside the database. Rows without a usable rate are left out of
+    ``total`` and counted in ``unconverted``. ``category_ids`` may be a
+    list or a subquery.
+    """
+    queryset = Transaction.objects.filter(family_id=family_id, currency__in=currencies)
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lt=(end + timedelta(days=32)).replace(day=1))
+    if category_ids is not None:
+        queryset = queryset.filter(category_id__in=category_ids)
+
+    return (
+        queryset
+        .annotate(month=TruncMonth('date'), amount_in_base=in_base(base))
+        .values('month', 'category_id', 'category__name', 'type')
+        .annotate(
+            total=Sum('amount_in_base'),
+            unconverted=Count('id', filter=Q(amount_in_base__isnull=True)),
+        )
+        .order_by('month', 'category_id')
+    )
+
+
+def convert(amount, currency, base, day):
+    """``amount`` of ``currency`` in ``base`` at the rate of ``day``, or None without a rate."""
+    if not currency or currency == base:
+        return amount
+    rates = {
+        code: Decimal('1') if code == PIVOT else (
+            ExchangeRate.objects
+            .filter(currency=code, date__lte=day)
+            .order_by('-date')
+            .values_list('rate', flat=True)
+            .first()
+        )
+        for code in (currency, base)
+    }
+    if rates[currency] is None or rates[base] is None:
+        return None
+    return (amount * rates[base] / rates[currency]).quantize(CENT)
+
+
+def _parse_rate(row):
+    try:
+        day = date.fromisoformat((row['date'] or '').strip())
+    except ValueError:
+        raise ValueError(f'Invalid date {row["date"]!r}')
+    currency = (row['currency'] or '').strip().upper()
+    try:
+        currency_code(currency)
+    except ValidationError:
+        raise ValueError(f'Invalid currency {row["currency"]!r}')
+    try:
+        rate = Decimal((row['rate'] or '').strip())
+    except InvalidOperation:
+        rate = None
+    if rate is None or not rate.is_finite() or rate <= 0:
+        raise ValueError(f'Invalid rate {row["rate"]!r}')
+    return ExchangeRate(date=day, currency=currency, rate=rate)
+
+
+def _upsert(rates):
+    # One row per key: an upsert may not touch the same row twice.
+    rates = list({(rate.currency, rate.date): rate for rate in rates}.values())
+    ExchangeRate.objects.bulk_create(
+        rates, update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['rate'],
+    )
+    return len(rates)
+
+
+def load_rates(stream, batch_size=5000):
+    """
+    Insert or replace rates from a ``date,currency,rate`` CSV (ISO dates,
+    units of the currency per one PIVOT). Returns the number of rows written
+    and the rejected (line, error) pairs.
+    """
+    reader = csv.DictReader(stream)
+    missing = {'date', 'currency', 'rate'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f'Missing required column(s): {", ".join(sorted(missing))}')
+
+    written, rejects, batch, earliest = 0, [], [], None
+    for row in reader:
+        try:
+            rate = _parse_rate(row)
+        except ValueError as error:
+            rejects.append((reader.line_num, str(error)))
+            continue
+        batch.append(rate)
+        earliest = min(rate.date, earliest or rate.date)
+        if len(batch) >= batch_size:
+            written += _upsert(batch)
+            batch = []
+    if batch:
+        written += _upsert(batch)
+
+    if written:
+        # Summaries and balances of families with foreign currency
+        # transactions are stale now.
+        foreign = MonthlyRollup.objects.exclude(currency='').values_list('family_id', flat=True).distinct()
+        BalanceCheckpoint.objects.filter(family_id__in=foreign, as_of__gt=earliest).delete()
+        versioning.bump(*foreign)
+    return written, rejects
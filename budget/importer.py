@@ -0,0 +1,260 @@
+import csv
+import hashlib
+import io
+import time
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from . import sync
+from .categories import attach
+from .ledger import STATE_FIELDS, current_state, make_state, send_changes
+from .models import BudgetCategory, FamilyMembership, Transaction, currency_code
+
+FIELDS = ('amount', 'date', 'description', 'type', 'category', 'currency')
+DEFAULT_CATEGORY = 'Uncategorized'
+MAX_REPORTED_REJECTS = 1000
+
+TYPE_ALIASES = {
+    'income': Transaction.INCOME,
+    'доход': Transaction.INCOME,
+    'credit': Transaction.INCOME,
+    'expense': Transaction.EXPENSE,
+    'расход': Transaction.EXPENSE,
+    'debit': Transaction.EXPENSE,
+}
+
+COPY_COLUMNS = (
+    'amount', 'description', 'date', 'category_id', 'member_id', 'family_id', 'user_id', 'type', 'currency',
+    'import_hash',
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejects = []
+        self.categories_created = 0
+        self.elapsed = 0.0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({'line': line, 'error': reason})
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed) if self.elapsed else 0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'categories_created': self.categories_created,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+            'rejects': self.rejects,
+        }
+
+
+class TransactionImporter:
+    """
+    Streams a bank statement CSV into a family's ledger in batches.
+
+    ``columns`` maps model fields (amount, date, description, type, category,
+    currency) to CSV headers; rows without a currency are in the family's
+    base currency.
+    Without a type column the sign of the amount decides between income and
+    expense. Each row is identified by a hash of its content plus its
+    occurrence number within the file, so re-importing a statement skips the
+    rows that are already there while genuinely repeated rows inside one
+    statement are kept.
+    """
+
+    def __init__(self, membership, user, columns=None, date_format='%Y-%m-%d', delimiter=',', batch_size=5000):
+        self.membership = membership
+        self.user = user
+        self.columns = {field: field for field in FIELDS}
+        self.columns.update(columns or {})
+        self.date_formats = [date_format] if isinstance(date_format, str) else list(date_format)
+        self.delimiter = delimiter
+        self.batch_size = batch_size
+        self.occurrences = Counter()
+        self.categories = None
+
+    def run(self, stream):
+        report = ImportReport()
+        started = time.perf_counter()
+        self.categories = self._family_categories()
+
+        reader = csv.DictReader(stream, delimiter=self.delimiter)
+        missing = [
+            header for field, header in self.columns.items()
+            if field in ('amount', 'date') and header not in (reader.fieldnames or [])
+        ]
+        if missing:
+            raise RowError(f'Missing required column(s): {", ".join(missing)}')
+
+        batch = []
+        for row in reader:
+            report.rows += 1
+            try:
+                batch.append(self._parse(row))
+            except RowError as error:
+                report.reject(reader.line_num, str(error))
+            if len(batch) >= self.batch_size:
+                self._flush(batch, report)
+                batch = []
+        self._flush(batch, report)
+
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _family_categories(self):
+        member_user_ids = FamilyMembership.objects.filter(family_id=self.membership.family_id).values('user_id')
+        categories = {}
+        for pk, name in BudgetCategory.objects.filter(user__in=member_user_ids).order_by('pk').values_list('pk', 'name'):
+            categories.setdefault(name.strip().lower(), pk)
+        return categories
+
+    def _value(self, row, field):
+        header = self.columns.get(field)
+        return (row.get(header) or '').strip() if header else ''
+
+    def _parse(self, row):
+        raw_amount = self._value(row, 'amount').replace('\xa0', '').replace(' ', '').replace(',', '.')
+        try:
+            amount = Decimal(raw_amount)
+        except InvalidOperation:
+            raise RowError(f'Invalid amount {raw_amount!r}')
+        if not amount.is_finite():
+            raise RowError(f'Invalid amount {raw_amount!r}')
+
+        raw_date = self._value(row, 'date')
+        for date_format in self.date_formats:
+            try:
+                date = datetime.strptime(raw_date, date_format).date()
+                break
+            except ValueError:
+                continue
+        else:
+            raise RowError(f'Invalid date {raw_date!r}')
+
+        raw_type = self._value(row, 'type').lower()
+        if raw_type:
+            if raw_type not in TYPE_ALIASES:
+                raise RowError(f'Invalid type {raw_type!r}')
+            type_ = TYPE_ALIASES[raw_type]
+        else:
+            type_ = Transaction.EXPENSE if amount < 0 else Transaction.INCOME
+        amount = abs(amount).quantize(Decimal('0.01'))
+        if amount.adjusted() >= 8:
+            raise RowError(f'Amount {amount} is too large')
+
+        description = self._value(row, 'description')[:255]
+        category = self._value(row, 'category')[:100] or DEFAULT_CATEGORY
+
+        currency = self._value(row, 'currency').upper()
+        if currency:
+            try:
+                currency_code(currency)
+            except ValidationError:
+                raise RowError(f'Invalid currency {currency!r}')
+
+        parts = [date.isoformat(), str(amount), type_, description, category.lower()]
+        # Only appended when present, so statements imported before
+        # currencies existed hash the same.
+        content = '|'.join(parts + [currency] if currency else parts)
+        self.occurrences[content] += 1
+        digest = hashlib.sha256(f'{content}|{self.occurrences[content]}'.encode()).hexdigest()
+        return {
+            'amount': amount, 'date': date, 'type': type_, 'description': description,
+            'category': category, 'currency': currency, 'import_hash': digest,
+        }
+
+    def _ensure_categories(self, batch, report):
+        missing = {}
+        for item in batch:
+            key = item['category'].lower()
+            if key not in self.categories:
+                missing.setdefault(key, item['category'])
+        if not missing:
+            return
+        created = BudgetCategory.objects.bulk_create(
+            [BudgetCategory(user_id=self.user.pk, name=name) for name in missing.values()]
+        )
+        attach(created)
+        sync.record_categories([self.membership.family_id], [category.pk for category in created])
+        for category in created:
+            self.categories[category.name.lower()] = category.pk
+        report.categories_created += len(created)
+
+    def _flush(self, batch, report):
+        if not batch:
+            return
+        with transaction.atomic():
+            hashes = [item['import_hash'] for item in batch]
+            existing = set(
+                Transaction.objects
+                .filter(family_id=self.membership.family_id, import_hash__in=hashes)
+                .values_list('import_hash', flat=True)
+            )
+            fresh = [item for item in batch if item['import_hash'] not in existing]
+            report.duplicates += len(batch) - len(fresh)
+            if not fresh:
+                return
+            self._ensure_categories(fresh, report)
+            rows = [
+                Transaction(
+                    amount=item['amount'], description=item['description'], date=item['date'],
+                    category_id=self.categories[item['category'].lower()], member_id=self.membership.pk,
+                    family_id=self.membership.family_id, user_id=self.user.pk, type=item['type'],
+                    currency=item['currency'], import_hash=item['import_hash'],
+                )
+                for item in fresh
+            ]
+            if connection.vendor == 'postgresql':
+                states = self._copy(rows)
+            else:
+                states = [current_state(obj) for obj in Transaction.objects.bulk_create(rows, batch_size=1000)]
+            send_changes([(None, state) for state in states])
+            report.inserted += len(rows)
+
+    def _copy(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in rows:
+            writer.writerow([getattr(obj, column) for column in COPY_COLUMNS])
+        buffer.seek(0)
+        # An unquoted empty field is NULL to COPY; blank text columns are ''.
+        sql = (
+            f'COPY {Transaction._meta.db_table} ({", ".join(COPY_COLUMNS)}) '
+            f'FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (description, currency))'
+        )
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, buffer)
+            else:
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        # COPY doesn't hand back ids; read the new rows back through the hash index.
+        inserted = (
+            Transaction.objects
+            .filter(family_id=self.membership.family_id, import_hash__in=[obj.import_hash for obj in rows])
+            .values(*STATE_FIELDS)
+        )
+        return [make_state(values) for values in inserted]
@@ -0,0 +1,203 @@
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import deletion, membership, revocation, rollups, versioning
+from .models import Family, Job
+
+logger = logging.getLogger(__name__)
+
+# Retry delay after the first failed attempt, doubled after each further one.
+BACKOFF = getattr(settings, 'BUDGET_JOBS_BACKOFF', 30)
+MAX_BACKOFF = 3600
+
+# A job running longer than this is taken for a crashed worker's and requeued.
+TIMEOUT = getattr(settings, 'BUDGET_JOBS_TIMEOUT', 3600)
+
+# kind -> callable(**payload) returning a JSON-serializable result.
+HANDLERS = {}
+
+
+def handler(kind, progress=False):
+    """
+    Register ``func`` for ``kind``. With ``progress``, it is also passed a
+    ``progress(result)`` callback that saves a partial result on the job,
+    for the job status endpoint to show while it runs.
+    """
+    def register(func):
+        func.reports_progress = progress
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, user_id=None, max_attempts=5):
+    """Queue a ``kind`` job; ``user_id`` may follow it through the job status endpoint."""
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind {kind!r}')
+    return Job.objects.create(kind=kind, payload=payload or {}, user_id=user_id, max_attempts=max_attempts)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _due():
+    return Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).order_by('run_at', 'id')
+
+
+def claim(worker):
+    """
+    Take the next due job for ``worker``, or None. Backends with SKIP LOCKED
+    let concurrent workers pass over each other's rows; elsewhere (SQLite,
+    which serializes writers anyway) a job is claimed by a conditional
+    update that only one worker can win.
+    """
+    claimed = {
+        'status': Job.RUNNING, 'locked_by': worker, 'started_at': timezone.now(),
+        'attempts': F('attempts') + 1,
+    }
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            pk = _due().select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**claimed)
+        else:
+            for pk in _due().values_list('pk', flat=True)[:10]:
+                if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**claimed):
+                    break
+            else:
+                return None
+    return Job.objects.get(pk=pk)
+
+
+def backoff(attempts):
+    return min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def _fail(job, error):
+    job.error = error
+    if job.attempts < job.max_attempts:
+        job.status = Job.QUEUED
+        job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+    else:
+        job.status = Job.FAILED
+
+
+def execute(job):
+    """Run a claimed job and record its outcome, timing and, on failure, the next attempt."""
+    started = time.perf_counter()
+    try:
+        func = HANDLERS[job.kind]
+        kwargs = dict(job.payload)
+        if getattr(func, 'reports_progress', False):
+            kwargs['progress'] = lambda result: Job.objects.filter(pk=job.pk).update(result=result)
+        job.result = func(**kwargs)
+    except Exception as error:
+        # The error is shown to the job's user; the traceback only goes to the log.
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        _fail(job, f'{type(error).__name__}: {error}')
+    else:
+        job.status = Job.DONE
+        job.error = ''
+    job.duration = time.perf_counter() - started
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.save(update_fields=['status', 'result', 'error', 'run_at', 'duration', 'finished_at', 'locked_by'])
+    return job
+
+
+def requeue_stale():
+    """Requeue jobs whose worker died mid-run; the lost run counts as a failed attempt."""
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=TIMEOUT))
+    requeued = 0
+    for job in stale:
+        _fail(job, f'Worker {job.locked_by} did not finish within {TIMEOUT}s')
+        requeued += Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(
+            status=job.status, run_at=job.run_at, error=job.error, locked_by='',
+        )
+    return requeued
+
+
+@dataclass
+class WorkerReport:
+    done: int = 0
+    failed: int = 0
+    requeued: int = 0
+    busy: float = 0.0
+
+
+def work(worker=None, burst=False, poll_interval=1.0, should_stop=None, log=None):
+    """
+    Claim and run jobs until ``should_stop()`` is true or, with ``burst``, no
+    job is due. Stale jobs are requeued whenever the queue looks empty.
+    """
+    worker = worker or worker_name()
+    report = WorkerReport()
+    while not (should_stop and should_stop()):
+        job = claim(worker)
+        if job is None:
+            report.requeued += requeue_stale()
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        execute(job)
+        report.busy += job.duration
+        if job.status == Job.DONE:
+            report.done += 1
+        else:
+            report.failed += 1
+        if log:
+            log(job)
+    return report
+
+
+def schedule_family_deletion(family_id, user_id=None):
+    """Hide the family at once and leave the cascade to a worker."""
+    Family.objects.filter(pk=family_id).update(deleted_at=timezone.now())
+    membership.invalidate_family(family_id)
+    versioning.bump(family_id)
+    return enqueue('delete_family', {'family_id': family_id}, user_id=user_id)
+
+
+def schedule_user_deletion(user):
+    """
+    Deactivate and log out the user at once, hiding the families they own
+    (which the cascade deletes with them), and leave the cascade to a worker.
+    """
+    Family.objects.filter(created_by_id=user.pk).update(deleted_at=timezone.now())
+    user.is_active = False
+    # post_save drops the cached memberships of the owned families' members.
+    user.save(update_fields=['is_active'])
+    membership.invalidate(user.pk)
+    revocation.revoke_user(user.pk)
+    return enqueue('delete_user', {'user_id': user.pk}, user_id=user.pk)
+
+
+def _deletion_log(progress):
+    return lambda report: progress(report.as_dict())
+
+
+@handler('delete_family', progress=True)
+def delete_family(family_id, progress, batch_size=deletion.BATCH_SIZE):
+    return deletion.delete_family(family_id, batch_size=batch_size, log=_deletion_log(progress)).as_dict()
+
+
+@handler('delete_user', progress=True)
+def delete_user(user_id, progress, batch_size=deletion.BATCH_SIZE):
+    return deletion.delete_user(user_id, batch_size=batch_size, log=_deletion_log(progress)).as_dict()
+
+
+@handler('rebuild_rollups')
+def rebuild_rollups(family_ids=None):
+    return {'buckets': rollups.rebuild(family_ids)}
@@ -0,0 +1,50 @@
+from collections import namedtuple
+
+from django.dispatch import Signal
+
+from .models import Transaction
+
+# Sent after transactions are written with ``changes``: a list of ``(old, new)``
+# TransactionState pairs. ``old`` is None for inserts and ``new`` is None for
+# deletes. Bulk code paths that bypass model signals must send it themselves.
+ledger_changed = Signal()
+
+STATE_FIELDS = ('id', 'family_id', 'member_id', 'user_id', 'category_id', 'date', 'type', 'amount', 'currency')
+
+TransactionState = namedtuple('TransactionState', STATE_FIELDS)
+
+
+def _clean(name, value):
+    if name in ('date', 'amount'):
+        return Transaction._meta.get_field(name).to_python(value)
+    return value
+
+
+def make_state(values):
+    return TransactionState(**{name: _clean(name, values[name]) for name in STATE_FIELDS})
+
+
+def current_state(instance):
+    return make_state({name: getattr(instance, name) for name in STATE_FIELDS})
+
+
+def loaded_values(instance):
+    values = getattr(instance, '_loaded_values', None)
+    if values is None or any(name not in values for name in STATE_FIELDS):
+        values = (
+            Transaction.objects
+            .filter(pk=instance.pk)
+            .values(*STATE_FIELDS)
+            .first()
+        )
+    return values
+
+
+def remember_state(instance):
+    instance._loaded_values = {name: getattr(instance, name) for name in STATE_FIELDS}
+
+
+def send_changes(changes):
+    changes = [(old, new) for old, new in changes if old is not None or new is not None]
+    if changes:
+        ledger_changed.send(sender=Transaction, changes=changes)
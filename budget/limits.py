@@ -0,0 +1,169 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.dispatch import Signal
+
+from . import fx
+from .models import BudgetAlert, BudgetCategory, Family, FamilyMembership, MonthlyRollup, Transaction
+from .rollups import month_start
+
+# Percentages of a category's monthly limit that raise an alert.
+THRESHOLDS = (80, 100)
+
+# Sent with ``alerts``, the BudgetAlert rows just created, when expense writes
+# take a category across one of THRESHOLDS for the first time in a month.
+threshold_crossed = Signal()
+
+
+def crossed(limit, before, after):
+    return [
+        threshold for threshold in THRESHOLDS
+        if before * 100 < limit * threshold <= after * 100
+    ]
+
+
+def _expense_deltas(changes):
+    """Expense deltas per (family, category, month) in the family's base currency, rises only."""
+    deltas = defaultdict(Decimal)
+    foreign = []
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None or state.family_id is None or state.type != Transaction.EXPENSE:
+                continue
+            if state.currency:
+                foreign.append((state, sign))
+            else:
+                deltas[state.family_id, state.category_id, month_start(state.date)] += sign * state.amount
+    if foreign:
+        bases = dict(
+            Family.objects
+            .filter(pk__in={state.family_id for state, _ in foreign})
+            .values_list('pk', 'base_currency')
+        )
+        for state, sign in foreign:
+            amount = fx.convert(state.amount, state.currency, bases[state.family_id], state.date)
+            if amount is not None:
+                deltas[state.family_id, state.category_id, month_start(state.date)] += sign * amount
+    return {key: amount for key, amount in deltas.items() if amount > 0}
+
+
+def _converted_spend(family_id, base, currencies, month, category_ids=None):
+    spent = defaultdict(Decimal)
+    for row in fx.converted_totals(family_id, base, currencies, month, month, category_ids):
+        if row['type'] == Transaction.EXPENSE and row['total'] is not None:
+            spent[row['category_id']] += row['total'].quantize(fx.CENT)
+    return spent
+
+
+def check_thresholds(changes):
+    """
+    Compare the rollup totals just written with the categories' limits. The
+    rollups were updated in place, so the total before this write is the
+    current one minus its delta; only spend in foreign currencies is
+    converted from transactions.
+    """
+    deltas = _expense_deltas(changes)
+    if not deltas:
+        return []
+
+    buckets = (
+        MonthlyRollup.objects
+        .filter(reduce(or_, (
+            Q(family_id=family_id, category_id=category_id, month=month)
+            for family_id, category_id, month in deltas
+        )))
+        .filter(type=Transaction.EXPENSE, category__monthly_limit__isnull=False)
+        .values_list('family_id', 'category_id', 'month', 'currency', 'total', 'category__monthly_limit')
+    )
+    totals, limits, foreign = defaultdict(Decimal), {}, defaultdict(set)
+    for family_id, category_id, month, currency, total, limit in buckets:
+        key = (family_id, category_id, month)
+        limits[key] = limit
+        if currency:
+            foreign[key].add(currency)
+        else:
+            totals[key] += total
+    for key, currencies in foreign.items():
+        family_id, category_id, month = key
+        spent = _converted_spend(family_id, fx.base_currency(family_id), sorted(currencies), month, [category_id])
+        totals[key] += spent[category_id]
+
+    alerts = []
+    for key, limit in limits.items():
+        family_id, category_id, month = key
+        alerts += [
+            BudgetAlert(
+                family_id=family_id, category_id=category_id, month=month,
+                threshold=threshold, spent=totals[key], limit=limit,
+            )
+            for threshold in crossed(limit, totals[key] - deltas[key], totals[key])
+        ]
+    if not alerts:
+        return []
+
+    # Spend can dip under a threshold and cross it again; alert once a month.
+    raised = set(
+        BudgetAlert.objects
+        .filter(reduce(or_, (
+            Q(family_id=alert.family_id, category_id=alert.category_id, month=alert.month)
+            for alert in alerts
+        )))
+        .values_list('family_id', 'category_id', 'month', 'threshold')
+    )
+    alerts = [
+        alert for alert in alerts
+        if (alert.family_id, alert.category_id, alert.month, alert.threshold) not in raised
+    ]
+    if alerts:
+        BudgetAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+        threshold_crossed.send(sender=BudgetCategory, alerts=alerts)
+    return alerts
+
+
+def spend_report(family_id, month):
+    """
+    The family's base currency and the spend against the limit of every
+    family category, in that currency, for the month starting at ``month``.
+    """
+    member_user_ids = FamilyMembership.objects.filter(family_id=family_id).values('user_id')
+    categories = (
+        BudgetCategory.objects
+        .filter(user__in=member_user_ids)
+        .order_by('id')
+        .values_list('id', 'name', 'monthly_limit')
+    )
+    base = fx.base_currency(family_id)
+    spent, foreign = defaultdict(Decimal), set()
+    buckets = (
+        MonthlyRollup.objects
+        .filter(family_id=family_id, month=month, type=Transaction.EXPENSE)
+        .values_list('category_id', 'currency', 'total')
+    )
+    for category_id, currency, total in buckets:
+        if currency:
+            foreign.add(currency)
+        else:
+            spent[category_id] += total
+    if foreign:
+        for category_id, total in _converted_spend(family_id, base, sorted(foreign), month).items():
+            spent[category_id] += total
+    rows = []
+    for category_id, name, limit in categories:
+        total = spent[category_id]
+        rows.append({
+            'category': category_id,
+            'name': name,
+            'monthly_limit': limit,
+            'spent': total,
+            'remaining': None if limit is None else limit - total,
+            'percent': None if not limit else float(round(total * 100 / limit, 1)),
+        })
+    return base, rows
+
+
+def current_month():
+    return date.today().replace(day=1)
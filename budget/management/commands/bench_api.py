@@ -0,0 +1,160 @@
+import json
+import math
+import platform
+import time
+from collections import Counter
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from budget import membership as membership_cache, versioning
+from budget.benchmarks import rolled_back, scratch_ledger
+from budget.models import Family, FamilyMembership, Transaction
+from budget.scenarios import SCENARIOS, Context, send
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Drive every API route through the test client and write p50/p95/p99 latency, '
+            'queries per request and throughput to a JSON report. All writes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per route.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route.')
+        parser.add_argument('--family', type=int,
+                            help='Benchmark an existing family (e.g. from seed_budget) as its owner.')
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Size of the scratch ledger when --family is not given.')
+        parser.add_argument('--routes', help='Comma-separated substrings; only matching routes run.')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Clear the response cache before every request.')
+        parser.add_argument('--output', default='bench_api.json', help='Where to write the JSON report.')
+        parser.add_argument('--baseline', help='Earlier report to compare p50/p95 against.')
+        parser.add_argument('--max-regression', type=float,
+                            help='With --baseline, fail if any p95 grew by more than this many percent.')
+
+    def handle(self, *args, **options):
+        scenarios = SCENARIOS
+        if options['routes']:
+            wanted = options['routes'].split(',')
+            scenarios = [scenario for scenario in SCENARIOS if any(part in scenario.name for part in wanted)]
+            if not scenarios:
+                raise CommandError(f"No route matches {options['routes']!r}")
+
+        first_user = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        first_family = (Family.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            if options['family']:
+                owner = FamilyMembership.objects.filter(family_id=options['family'], role='owner').first()
+                if owner is None:
+                    raise CommandError(f"Family {options['family']} has no owner to benchmark as")
+                with rolled_back():
+                    results, benched, (last_user, last_family) = self.run(owner, scenarios, options)
+            else:
+                with scratch_ledger(options['rows']) as owner:
+                    results, benched, (last_user, last_family) = self.run(owner, scenarios, options)
+
+        # Ids used inside the rolled-back transaction will be handed out again;
+        # drop what was cached under them so it is not served to their new owners.
+        membership_cache.invalidate(*range(first_user, last_user + 1))
+        versioning.bump(options['family'], *range(first_family, last_family + 1))
+
+        report = {
+            'meta': {
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'family': options['family'],
+                'transactions': benched,
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'cold_cache': options['cold_cache'],
+            },
+            'routes': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['baseline']:
+            self.compare(options['baseline'], results, options['max_regression'])
+
+    def run(self, owner, scenarios, options):
+        benched = Transaction.objects.filter(family_id=owner.family_id).count()
+        ctx = Context(owner)
+        client = Client(HTTP_HOST='localhost')
+        responses = caches['responses']
+        results = {}
+
+        self.stdout.write(
+            f'{"route":<28} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"req/s":>8} {"errors":>7}'
+        )
+        for scenario in scenarios:
+            timings, queries, statuses = [], [], Counter()
+            for iteration in range(options['warmup'] + options['requests']):
+                request = ctx.prepare(scenario, iteration)
+                if options['cold_cache']:
+                    responses.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = send(client, ctx, scenario, request)
+                    elapsed = time.perf_counter() - started
+
+                if iteration >= options['warmup']:
+                    timings.append(elapsed)
+                    queries.append(len(captured))
+                    statuses[response.status_code] += 1
+
+            total = sum(timings)
+            result = {
+                'method': scenario.method.upper(),
+                'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+                'mean_ms': round(total / len(timings) * 1000, 3),
+                'queries_per_request': round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries),
+                'throughput_rps': round(len(timings) / total, 1),
+                'statuses': {str(code): count for code, count in sorted(statuses.items())},
+                'errors': sum(count for code, count in statuses.items() if code != scenario.expect),
+            }
+            results[scenario.name] = result
+            self.stdout.write(
+                f'{scenario.name:<28} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+                f'{result["queries_per_request"]:>8.1f} {result["throughput_rps"]:>8.1f} {result["errors"]:>7}'
+            )
+        last_ids = (
+            User.objects.aggregate(last=Max('id'))['last'],
+            Family.objects.aggregate(last=Max('id'))['last'],
+        )
+        return results, benched, last_ids
+
+    def compare(self, path, results, max_regression):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['routes']
+
+        regressed = []
+        self.stdout.write(f'{"route":<28} {"p50 Δ%":>8} {"p95 Δ%":>8} {"queries Δ":>10}')
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            p50 = (result['p50_ms'] / before['p50_ms'] - 1) * 100 if before['p50_ms'] else 0.0
+            p95 = (result['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0.0
+            queries = result['queries_per_request'] - before['queries_per_request']
+            self.stdout.write(f'{name:<28} {p50:>+8.1f} {p95:>+8.1f} {queries:>+10.1f}')
+            if max_regression is not None and p95 > max_regression:
+                regressed.append(name)
+        if regressed:
+            raise CommandError(f'p95 regressed by more than {max_regression}% on: {", ".join(regressed)}')
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from budget.management.commands.bench_api import percentile
+from budget.models import FamilyMembership
+from budget.tokens import issue_tokens
+
+# Read mix each simulated client cycles through; the ASGI run prefixes /api/async/.
+PATHS = (
+    'family/me/',
+    'family/members/',
+    'categories/',
+    'transactions/?page_size=50',
+    'transactions/summary/',
+)
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync read endpoints behind a threaded WSGI pool with their async variants '
+            'under ASGI at growing numbers of concurrent clients. Needs committed data, e.g. from seed_budget.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--family', type=int, help='Family to read as its owner (default: the largest).')
+        parser.add_argument('--concurrency', default='100,250,500,1000',
+                            help='Comma-separated numbers of concurrent clients.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run.')
+        parser.add_argument('--threads', type=int, default=32, help='Worker threads of the WSGI pool.')
+        parser.add_argument('--response-cache', action='store_true',
+                            help='Keep the server-side response cache (only the sync endpoints use it).')
+        parser.add_argument('--output', help='Also write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        memberships = FamilyMembership.objects.filter(role='owner').select_related('user')
+        if options['family']:
+            owner = memberships.filter(family_id=options['family']).first()
+        else:
+            owner = memberships.annotate(rows=Count('family__transactions')).order_by('-rows').first()
+        if owner is None:
+            raise CommandError('No family to benchmark; run seed_budget first or pass --family')
+        token = issue_tokens(owner.user)['access']
+
+        caches_setting = dict(settings.CACHES)
+        if not options['response_cache']:
+            caches_setting['responses'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+        results = []
+        self.stdout.write(f'{"mode":<6} {"clients":>8} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} '
+                          f'{"p99 ms":>9} {"errors":>7}')
+        with override_settings(ALLOWED_HOSTS=['testserver'], CACHES=caches_setting):
+            for concurrency in (int(value) for value in options['concurrency'].split(',')):
+                for mode in ('wsgi', 'asgi'):
+                    result = asyncio.run(self.run(mode, concurrency, options, token))
+                    results.append(result)
+                    self.stdout.write(
+                        f'{mode:<6} {concurrency:>8} {result["throughput_rps"]:>9.1f} {result["p50_ms"]:>9.1f} '
+                        f'{result["p95_ms"]:>9.1f} {result["p99_ms"]:>9.1f} {result["errors"]:>7}'
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({'family': owner.family_id, 'threads': options['threads'], 'results': results},
+                          output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    async def run(self, mode, concurrency, options, token):
+        headers = {'Authorization': f'Bearer {token}'}
+        gate = asyncio.Semaphore(concurrency)
+        timings, errors = [], 0
+
+        if mode == 'wsgi':
+            local = threading.local()
+            pool = ThreadPoolExecutor(max_workers=options['threads'])
+            loop = asyncio.get_running_loop()
+
+            def get(path):
+                if not hasattr(local, 'client'):
+                    local.client = Client()
+                return local.client.get(f'/api/{path}', headers=headers).status_code
+
+            async def fetch(path):
+                return await loop.run_in_executor(pool, get, path)
+        else:
+            client = AsyncClient()
+
+            async def fetch(path):
+                return (await client.get(f'/api/async/{path}', headers=headers)).status_code
+
+        async def one(index):
+            nonlocal errors
+            async with gate:
+                started = time.perf_counter()
+                status_code = await fetch(PATHS[index % len(PATHS)])
+                timings.append(time.perf_counter() - started)
+                errors += status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        if mode == 'wsgi':
+            # Every worker thread opened its own connection. The barrier makes
+            # each thread run exactly one of the closing tasks.
+            barrier = threading.Barrier(options['threads'])
+
+            def close():
+                barrier.wait()
+                connections.close_all()
+
+            for _ in range(options['threads']):
+                pool.submit(close)
+            pool.shutdown()
+        return {
+            'mode': mode,
+            'clients': concurrency,
+            'requests': len(timings),
+            'throughput_rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+            'errors': errors,
+        }
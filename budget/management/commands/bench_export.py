@@ -0,0 +1,45 @@
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from budget import export
+from budget.benchmarks import scratch_ledger
+
+
+class Command(BaseCommand):
+    help = 'Measure export throughput and peak memory for growing ledger sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma-separated row counts to export.')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--family', type=int,
+                            help='Export an existing family instead of a generated scratch ledger.')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        if options['family']:
+            self.run(options['family'], sizes, options['format'])
+            return
+        self.stdout.write(f'Generating a scratch ledger of {sizes[-1]} rows (rolled back afterwards)...')
+        with scratch_ledger(sizes[-1]) as membership:
+            self.run(membership.family_id, sizes, options['format'])
+
+    def run(self, family_id, sizes, format_):
+        _, chunks = export.FORMATS[format_]
+        self.stdout.write(f'{"rows":>10} {"seconds":>8} {"rows/s":>10} {"bytes":>12} {"peak heap MiB":>14}')
+        for size in sizes:
+            queryset = export.export_queryset(family_id)[:size]
+            tracemalloc.start()
+            started = time.perf_counter()
+            written = sum(len(chunk) for chunk in chunks(export.iter_rows(queryset)))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{size:>10} {elapsed:>8.2f} {size / elapsed:>10.0f} {written:>12} {peak / 2 ** 20:>14.2f}'
+            )
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(f'Process max RSS: {max_rss / 1024:.1f} MiB')
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from budget.benchmarks import scratch_ledger
+from budget.models import Transaction
+from budget.serializers import TransactionSerializer
+from budget.serializers_lean import TRANSACTION_LOOKUPS, LeanTransactionSerializer
+
+
+def serializer_page(family_id, page_size):
+    queryset = Transaction.objects.filter(family_id=family_id).order_by('date', 'id')
+    return TransactionSerializer(queryset[:page_size], many=True).data
+
+
+def serializer_joined_page(family_id, page_size):
+    queryset = (
+        Transaction.objects.filter(family_id=family_id)
+        .select_related('category', 'user').order_by('date', 'id')
+    )
+    return TransactionSerializer(queryset[:page_size], many=True).data
+
+
+def lean_page(family_id, page_size):
+    queryset = Transaction.objects.filter(family_id=family_id).order_by('date', 'id').values(*TRANSACTION_LOOKUPS)
+    return LeanTransactionSerializer().to_representation(queryset[:page_size])
+
+
+PATHS = (
+    ('serializer', serializer_page),
+    ('serializer+join', serializer_joined_page),
+    ('lean', lean_page),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec and queries/page of the serializer and lean transaction list paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', default='10,100,1000')
+        parser.add_argument('--seconds', type=float, default=2.0, help='Time budget per measurement.')
+        parser.add_argument('--family', type=int,
+                            help='Use an existing family instead of a generated scratch ledger.')
+
+    def handle(self, *args, **options):
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        if options['family']:
+            self.run(options['family'], page_sizes, options['seconds'])
+            return
+        with scratch_ledger(max(page_sizes)) as membership:
+            self.run(membership.family_id, page_sizes, options['seconds'])
+
+    def run(self, family_id, page_sizes, budget):
+        self.stdout.write(f'{"path":<16} {"page":>6} {"queries":>8} {"pages/s":>10} {"rows/s":>10}')
+        for page_size in page_sizes:
+            for name, render in PATHS:
+                with CaptureQueriesContext(connection) as queries:
+                    rows = len(render(family_id, page_size))
+                pages = 0
+                started = time.perf_counter()
+                while time.perf_counter() - started < budget:
+                    render(family_id, page_size)
+                    pages += 1
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{name:<16} {page_size:>6} {len(queries):>8} {pages / elapsed:>10.1f} '
+                    f'{pages * rows / elapsed:>10.0f}'
+                )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget import sync
+
+
+class Command(BaseCommand):
+    help = ('Compact the sync change log: drop superseded entries, expired tombstones and the entries '
+            'of deleted families. Clients with cursors behind expired tombstones start over.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tombstone-days', type=int, default=sync.TOMBSTONE_DAYS,
+                            help='Keep tombstones this many days (default: BUDGET_SYNC_TOMBSTONE_DAYS).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Families per transaction.')
+
+    def handle(self, *args, **options):
+        if options['tombstone_days'] < 0:
+            raise CommandError('--tombstone-days must not be negative')
+
+        def log(progress):
+            self.stdout.write(f'{progress.superseded} superseded, {progress.tombstones} tombstone(s) dropped')
+
+        report = sync.compact(
+            tombstone_days=options['tombstone_days'], chunk_size=options['chunk_size'],
+            log=log if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.superseded} superseded entries, {report.tombstones} tombstone(s) and '
+            f'{report.orphaned} orphaned entries dropped for {report.families} families in {report.elapsed:.2f}s'
+        ))
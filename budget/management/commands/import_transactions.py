@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.importer import RowError, TransactionImporter
+from budget.membership import resolve_membership
+
+
+class Command(BaseCommand):
+    help = "Import a bank statement CSV into a user's family ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import.')
+        parser.add_argument('--user', required=True, help='Username the rows are recorded for.')
+        parser.add_argument('--column', action='append', default=[], metavar='FIELD=HEADER',
+                            help='Map a field (amount, date, description, type, category, currency) to a CSV header.')
+        parser.add_argument('--date-format', action='append', dest='date_formats',
+                            help='strptime format of the date column (repeatable; default %%Y-%%m-%%d).')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user"]!r} does not exist')
+        membership = resolve_membership(user.pk)
+        if not membership:
+            raise CommandError(f'User {user.username!r} is not part of any family')
+
+        columns = {}
+        for mapping in options['column']:
+            field, _, header = mapping.partition('=')
+            if not header:
+                raise CommandError(f'--column expects FIELD=HEADER, got {mapping!r}')
+            columns[field] = header
+
+        importer = TransactionImporter(
+            membership, user, columns=columns, date_format=options['date_formats'] or '%Y-%m-%d',
+            delimiter=options['delimiter'], batch_size=options['batch_size'],
+        )
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as stream:
+                report = importer.run(stream)
+        except (OSError, RowError, UnicodeDecodeError) as error:
+            raise CommandError(str(error))
+
+        for reject in report.rejects:
+            self.stderr.write(f'line {reject["line"]}: {reject["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.rows} rows in {report.elapsed:.2f}s ({report.rows_per_second} rows/s): '
+            f'{report.inserted} inserted, {report.duplicates} duplicates, {report.rejected} rejected, '
+            f'{report.categories_created} categories created'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget import fx
+
+
+class Command(BaseCommand):
+    help = ('Load daily exchange rates from a local date,currency,rate CSV, each rate in units of the '
+            'currency per one BUDGET_FX_PIVOT. Existing rates for the same day are replaced.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to load.')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as stream:
+                written, rejects = fx.load_rates(stream, options['batch_size'])
+        except (OSError, ValueError, UnicodeDecodeError) as error:
+            raise CommandError(str(error))
+
+        for line, error in rejects:
+            self.stderr.write(f'line {line}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {written} rate(s) against {fx.PIVOT}, {len(rejects)} rejected'
+        ))
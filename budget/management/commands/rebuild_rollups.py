@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild monthly transaction rollups from the ledger, or verify them with --verify.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--family', type=int, action='append', dest='families',
+                            help='Limit to the given family id (repeatable).')
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare rollups with the ledger and report drift.')
+
+    def handle(self, *args, **options):
+        family_ids = options['families']
+
+        if options['verify']:
+            drift = rollups.find_drift(family_ids)
+            for (family_id, category_id, month, type_, currency), want, have in drift:
+                self.stdout.write(
+                    f'family={family_id} category={category_id} month={month:%Y-%m} type={type_} '
+                    f'currency={currency or "base"}: '
+                    f'ledger={want[0]}/{want[1]} rollup={have[0]}/{have[1]}'
+                )
+            if drift:
+                raise CommandError(f'{len(drift)} rollup bucket(s) drifted from the ledger')
+            self.stdout.write(self.style.SUCCESS('Rollups match the ledger'))
+            return
+
+        count = rollups.rebuild(family_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollup bucket(s)'))
@@ -0,0 +1,67 @@
+import multiprocessing
+import signal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from budget import jobs
+
+
+def _run(worker, burst, poll_interval, stopping, verbosity):
+    # Spawned children start without Django; forked ones must not share the
+    # parent's database connections.
+    django.setup()
+    connections.close_all()
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    signal.signal(signal.SIGINT, lambda *args: stopping.set())
+
+    def log(job):
+        print(f'{worker} {job.kind} #{job.pk} {job.status} in {job.duration:.3f}s (attempt {job.attempts})',
+              flush=True)
+
+    report = jobs.work(
+        worker=worker, burst=burst, poll_interval=poll_interval,
+        should_stop=stopping.is_set, log=log if verbosity > 1 else None,
+    )
+    print(f'{worker}: {report.done} done, {report.failed} failed, {report.requeued} requeued, '
+          f'{report.busy:.2f}s busy', flush=True)
+
+
+class Command(BaseCommand):
+    help = ('Run background jobs from the database queue in a pool of worker processes. '
+            'SIGTERM lets every worker finish its current job before exiting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before polling again.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+
+        stopping = multiprocessing.Event()
+        connections.close_all()
+        name = jobs.worker_name()
+        pool = [
+            multiprocessing.Process(target=_run, args=(
+                f'{name}/{index}', options['burst'], options['poll_interval'], stopping, options['verbosity'],
+            ))
+            for index in range(options['processes'])
+        ]
+        for process in pool:
+            process.start()
+        signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            stopping.set()
+            for process in pool:
+                process.join()
+        failed = [process for process in pool if process.exitcode]
+        if failed:
+            raise CommandError(f'{len(failed)} worker(s) exited with an error')
+        self.stdout.write(self.style.SUCCESS(f'{len(pool)} worker(s) stopped'))
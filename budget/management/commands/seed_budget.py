@@ -0,0 +1,52 @@
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.benchmarks import CATEGORY_NAMES, seed
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset of families, categories and transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--families', type=int, default=100)
+        parser.add_argument('--members', type=int, default=4, help='Maximum users per family.')
+        parser.add_argument('--categories', type=int, default=len(CATEGORY_NAMES),
+                            help='Categories per family owner.')
+        parser.add_argument('--transactions', type=int, default=1_000_000)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf exponent for spreading transactions over families; 0 is uniform.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; equal seeds give equal data.')
+        parser.add_argument('--start', type=date.fromisoformat, default=date(2020, 1, 1),
+                            help='First transaction date (YYYY-MM-DD).')
+        parser.add_argument('--days', type=int, default=4 * 365, help='Length of the date range in days.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of generated users.')
+        parser.add_argument('--password', default='password', help='Password of every generated user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['families'] < 1 or options['members'] < 1 or options['categories'] < 1:
+            raise CommandError('--families, --members and --categories must be positive')
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Users with prefix '{options['prefix']}-' already exist; pick another --prefix")
+
+        total = options['transactions']
+        started = time.perf_counter()
+
+        def log(inserted):
+            if options['verbosity'] > 1 or inserted == total:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{inserted}/{total} transactions, {inserted / elapsed:.0f} rows/s')
+
+        family_ids = seed(
+            options['families'], options['members'], total,
+            categories=options['categories'], skew=options['skew'], seed_value=options['seed'],
+            start=options['start'], days=options['days'], prefix=options['prefix'],
+            password=options['password'], batch_size=options['batch_size'], log=log,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(family_ids)} families ({family_ids[0]}..{family_ids[-1]}) '
+            f'with {total} transactions in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budget import checkpoints
+
+
+class Command(BaseCommand):
+    help = ('Write month-start balance checkpoints for every family and member, continuing from the '
+            'latest one each. Run it after each month boundary.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', help='Last month start to write, YYYY-MM (default: this month).')
+        parser.add_argument('--family', type=int, action='append', dest='families',
+                            help='Limit to the given family id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Families per transaction.')
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            try:
+                until = datetime.strptime(options['until'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--until must be YYYY-MM')
+
+        def log(progress):
+            self.stdout.write(f'{progress.written} checkpoint(s) written')
+
+        report = checkpoints.write(
+            until=until, chunk_size=options['chunk_size'], family_ids=options['families'],
+            log=log if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.written} checkpoint(s) for {report.families} families in {report.elapsed:.2f}s'
+        ))
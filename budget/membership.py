@@ -0,0 +1,115 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Family, FamilyMembership
+
+CACHE_TIMEOUT = getattr(settings, 'FAMILY_MEMBERSHIP_CACHE_TIMEOUT', 300)
+
+# Cached in place of a membership for users that are not in any family.
+NO_MEMBERSHIP = 'none'
+
+
+def _cache_key(user_id):
+    return f'budget:membership:{user_id}'
+
+
+def _changed_key(user_id):
+    return f'budget:membership-changed:{user_id}'
+
+
+def from_claims(user):
+    """
+    The membership described by the family claims of a token user, or None
+    when the token has no such claims or predates the user's last membership
+    change. The family itself is not loaded; use ``family_id``.
+    """
+    token = getattr(user, 'token', None)
+    if token is None or 'membership_id' not in token:
+        return None
+    changed = cache.get(_changed_key(user.pk))
+    if changed is not None and token.get('claims_at', 0) <= changed:
+        return None
+    if token['membership_id'] is None:
+        return NO_MEMBERSHIP
+    membership = FamilyMembership(
+        pk=token['membership_id'], user_id=user.pk, family_id=token['family_id'], role=token['role'],
+    )
+    membership._state.adding = False
+    membership._state.db = 'default'
+    return membership
+
+
+def resolve_membership(user_id):
+    membership = cache.get(_cache_key(user_id))
+    if membership is None:
+        membership = (
+            FamilyMembership.objects
+            .filter(user_id=user_id, family__deleted_at__isnull=True)
+            .select_related('family__created_by')
+            .order_by('pk')
+            .first()
+        )
+        cache.set(_cache_key(user_id), membership or NO_MEMBERSHIP, CACHE_TIMEOUT)
+    if membership == NO_MEMBERSHIP:
+        return None
+    return membership
+
+
+async def aresolve_membership(user_id):
+    membership = await cache.aget(_cache_key(user_id))
+    if membership is None:
+        membership = await (
+            FamilyMembership.objects
+            .filter(user_id=user_id, family__deleted_at__isnull=True)
+            .select_related('family__created_by')
+            .order_by('pk')
+            .afirst()
+        )
+        await cache.aset(_cache_key(user_id), membership or NO_MEMBERSHIP, CACHE_TIMEOUT)
+    if membership == NO_MEMBERSHIP:
+        return None
+    return membership
+
+
+def get_membership(request):
+    user = request.user
+    if not user or not user.is_authenticated:
+        return None
+    # Memoize on the underlying HttpRequest so every view and helper touching
+    # this request shares one lookup.
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, '_family_membership'):
+        membership = cache.get(_cache_key(user.pk))
+        if membership is None:
+            # Not cached: trust the token's family claims unless they went
+            # stale, and only then fall back to the database.
+            membership = from_claims(user)
+        if membership is None:
+            membership = resolve_membership(user.pk)
+        http_request._family_membership = None if membership == NO_MEMBERSHIP else membership
+    return http_request._family_membership
+
+
+def invalidate(*user_ids):
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    # Tokens issued up to now carry the old family claims.
+    changed = time.time()
+    cache.set_many({_changed_key(user_id): changed for user_id in user_ids}, None)
+    cache.delete_many(keys)
+    # Drop again once the write is visible so a concurrent reader can't
+    # re-cache the pre-commit state.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_family(family_id):
+    invalidate(*FamilyMembership.objects.filter(family_id=family_id).values_list('user_id', flat=True))
+
+
+def invalidate_owner(user_id):
+    for family_id in Family.objects.filter(created_by_id=user_id).values_list('pk', flat=True):
+        invalidate_family(family_id)
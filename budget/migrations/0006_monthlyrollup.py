@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    Transaction = apps.get_model('budget', 'Transaction')
+    MonthlyRollup = apps.get_model('budget', 'MonthlyRollup')
+    rows = (
+        Transaction.objects
+        .annotate(month=TruncMonth('date'))
+        .values('member__family_id', 'category_id', 'month', 'type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    MonthlyRollup.objects.bulk_create(
+        [
+            MonthlyRollup(
+                family_id=row['member__family_id'], category_id=row['category_id'], month=row['month'],
+                type=row['type'], total=row['total'], count=row['count'],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0005_alter_family_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('type', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход')], max_length=10)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='budget.budgetcategory')),
+                ('family', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='budget.family')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('family', 'month', 'category', 'type'), name='budget_rollup_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 03:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_family(apps, schema_editor):
+    Transaction = apps.get_model('budget', 'Transaction')
+    FamilyMembership = apps.get_model('budget', 'FamilyMembership')
+    Transaction.objects.filter(family__isnull=True).update(
+        family_id=Subquery(
+            FamilyMembership.objects.filter(pk=OuterRef('member_id')).values('family_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0006_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='family',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='budget.family'),
+        ),
+        migrations.RunPython(backfill_family, migrations.RunPython.noop),
+    ]
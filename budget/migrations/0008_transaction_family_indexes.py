@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 03:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0007_transaction_family'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='family',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='budget.family'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['family', 'date', 'id'], name='budget_txn_family_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['family', 'category', 'date'], name='budget_txn_family_cat_date'),
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.2 on 2026-10-18 03:25
+
+from django.db import DatabaseError, migrations
+
+# The DDL is frozen here rather than read from budget.search, so that later
+# changes to the app cannot alter what this migration does. Migrations that
+# make SQLite rebuild an indexed table re-run install() from this module,
+# since a table rebuild drops its triggers.
+SEARCH_COLUMNS = {
+    'budget_transaction': ('description',),
+    'budget_budgetcategory': ('name', 'description'),
+}
+PG_CONFIGS = ('russian', 'english')
+PG_WEIGHTS = 'ABCD'
+
+
+def _pg_vector(row, columns):
+    parts = [
+        f"setweight(to_tsvector('{config}', coalesce({row}.{column}, '')), '{PG_WEIGHTS[index]}')"
+        for config in PG_CONFIGS
+        for index, column in enumerate(columns)
+    ]
+    return ' || '.join(parts)
+
+
+def _postgres_install(schema_editor, table, columns):
+    function = f'{table}_search_vector'
+    schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector')
+    schema_editor.execute(
+        f'CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ '
+        f'BEGIN NEW.search_vector := {_pg_vector("NEW", columns)}; RETURN NEW; END '
+        f'$$ LANGUAGE plpgsql'
+    )
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS {function}_update ON {table}')
+    schema_editor.execute(
+        f'CREATE TRIGGER {function}_update BEFORE INSERT OR UPDATE OF {", ".join(columns)} ON {table} '
+        f'FOR EACH ROW EXECUTE FUNCTION {function}()'
+    )
+    schema_editor.execute(f'UPDATE {table} SET search_vector = {_pg_vector(table, columns)}')
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {table}_search_gin ON {table} USING GIN (search_vector)')
+
+
+def _postgres_uninstall(schema_editor, table, columns):
+    function = f'{table}_search_vector'
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS {function}_update ON {table}')
+    schema_editor.execute(f'DROP FUNCTION IF EXISTS {function}()')
+    schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+
+
+def _sqlite_install(schema_editor, table, columns):
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+    schema_editor.execute(
+        f'CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _sqlite_uninstall(schema_editor, table, columns):
+    fts = f'{table}_fts'
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def install(apps, schema_editor):
+    # Safe to re-run: everything is created if missing or replaced.
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_COLUMNS.items():
+        if vendor == 'postgresql':
+            _postgres_install(schema_editor, table, columns)
+        elif vendor == 'sqlite':
+            try:
+                _sqlite_install(schema_editor, table, columns)
+            except DatabaseError:
+                # SQLite built without FTS5: searches fall back to LIKE.
+                pass
+
+
+def uninstall(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_COLUMNS.items():
+        if vendor == 'postgresql':
+            _postgres_uninstall(schema_editor, table, columns)
+        elif vendor == 'sqlite':
+            _sqlite_uninstall(schema_editor, table, columns)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0009_transaction_import_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 03:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0011_tokenrevocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetcategory',
+            name='monthly_limit',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='BudgetAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('threshold', models.PositiveSmallIntegerField()),
+                ('spent', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('limit', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='budget.budgetcategory')),
+                ('family', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_alerts', to='budget.family')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('family', 'category', 'month', 'threshold'), name='budget_alert_unique_threshold')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-18 04:08
+
+from importlib import import_module
+
+import django.core.validators
+from django.db import migrations, models
+
+# The full-text DDL as migration 0010 froze it.
+search = import_module('budget.migrations.0010_full_text_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0013_recurring_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('currency', models.CharField(max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}\\Z', 'Enter a three-letter ISO 4217 currency code.')])),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=20)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='monthlyrollup',
+            name='budget_rollup_unique_bucket',
+        ),
+        migrations.AddField(
+            model_name='family',
+            name='base_currency',
+            field=models.CharField(default='RUB', max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}\\Z', 'Enter a three-letter ISO 4217 currency code.')]),
+        ),
+        migrations.AddField(
+            model_name='monthlyrollup',
+            name='currency',
+            field=models.CharField(blank=True, default='', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='currency',
+            field=models.CharField(blank=True, default='', max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}\\Z', 'Enter a three-letter ISO 4217 currency code.')]),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='currency',
+            field=models.CharField(blank=True, default='', max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}\\Z', 'Enter a three-letter ISO 4217 currency code.')]),
+        ),
+        # Adding the column makes SQLite rebuild budget_transaction, which
+        # drops its full-text triggers.
+        migrations.RunPython(search.install, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(fields=('family', 'month', 'category', 'type', 'currency'), name='budget_rollup_unique_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('currency', 'date'), name='budget_fx_currency_date'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0014_multi_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('family', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='budget.family')),
+                ('member', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='budget.familymembership')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('member__isnull', True)), fields=('family', 'as_of'), name='budget_checkpoint_family'), models.UniqueConstraint(condition=models.Q(('member__isnull', False)), fields=('family', 'member', 'as_of'), name='budget_checkpoint_member')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 04:27
+
+import budget.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_closure(apps, schema_editor):
+    # Every existing category is a root: its only row is the one to itself.
+    BudgetCategory = apps.get_model('budget', 'BudgetCategory')
+    CategoryClosure = apps.get_model('budget', 'CategoryClosure')
+    CategoryClosure.objects.bulk_create(
+        (
+            CategoryClosure(ancestor_id=pk, descendant_id=pk, depth=0)
+            for pk in BudgetCategory.objects.values_list('pk', flat=True).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0015_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetcategory',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=budget.models.detach_children, related_name='children', to='budget.budgetcategory'),
+        ),
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='budget.budgetcategory')),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='budget.budgetcategory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='budget_closure_descendant')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='budget_closure_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
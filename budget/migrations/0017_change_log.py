@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 04:32
+
+from django.db import migrations, models
+
+
+def floor_existing_families(apps, schema_editor):
+    # Their data predates the log, so a sync from cursor 0 would miss it.
+    Family = apps.get_model('budget', 'Family')
+    Family.objects.update(sync_floor=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0016_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='family',
+            name='sync_floor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('family_id', models.IntegerField()),
+                ('model', models.CharField(choices=[('transaction', 'Transaction'), ('category', 'Category'), ('membership', 'Membership')], max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['family_id', 'id'], name='budget_changelog_cursor'), models.Index(fields=['family_id', 'model', 'object_id', 'id'], name='budget_changelog_object')],
+            },
+        ),
+        migrations.RunPython(floor_existing_families, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,64 @@
 from django.contrib.auth.models import User
+from django.core.validators import RegexValidator
 from django.db import models
+from django.utils import timezone
 import uuid
 
+currency_code = RegexValidator(r'^[A-Z]{3}\Z', 'Enter a three-letter ISO 4217 currency code.')
+
+
+def detach_children(collector, field, sub_objs, using):
+    """
+    on_delete of BudgetCategory.parent: the children become roots, and the
+    closure rows linking their subtrees to the deleted category's ancestors
+    are deleted along with it, as one statement per batch.
+    """
+    models.SET_NULL(collector, field, sub_objs, using)
+    subtree = CategoryClosure.objects.using(using).filter(ancestor__in=sub_objs).values('descendant_id')
+    collector.collect(
+        CategoryClosure.objects.using(using).filter(descendant__in=subtree).exclude(ancestor__in=subtree),
+        source=field.model, nullable=True,
+    )
+
 
 class BudgetCategory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
+    # The tree itself is read through CategoryClosure (see budget.categories).
+    parent = models.ForeignKey('self', on_delete=detach_children, null=True, blank=True, related_name='children')
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    # Expense limit per calendar month; spend is read from MonthlyRollup.
+    monthly_limit = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return self.name
 
 
+class CategoryClosure(models.Model):
+    """
+    One row per ancestor of every category, itself included at depth 0, so a
+    subtree or a category's ancestors are one index range each.
+    """
+    ancestor = models.ForeignKey(
+        BudgetCategory, on_delete=models.CASCADE, related_name='descendant_links', db_index=False,
+    )
+    descendant = models.ForeignKey(
+        BudgetCategory, on_delete=models.CASCADE, related_name='ancestor_links', db_index=False,
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='budget_closure_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='budget_closure_descendant'),
+        ]
+
+    def __str__(self):
+        return f'{self.ancestor_id} > {self.descendant_id} ({self.depth})'
+
+
 class FamilyMember(models.Model):
     name = models.CharField(max_length=100)
     age = models.IntegerField()
@@ -34,15 +81,67 @@ class Transaction(models.Model):
     date = models.DateField()
     category = models.ForeignKey('BudgetCategory', on_delete=models.CASCADE)
     member = models.ForeignKey('FamilyMembership', on_delete=models.CASCADE)
+    # Covered by the composite indexes below, so no separate FK index.
+    family = models.ForeignKey('Family', on_delete=models.CASCADE, related_name='transactions', db_index=False)
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPE_CHOICES, default=EXPENSE)
+    # ISO 4217 code of ``amount``; blank means the family's base currency.
+    currency = models.CharField(max_length=3, blank=True, default='', validators=[currency_code])
+    # Content hash of an imported statement row, used to skip re-imported rows.
+    import_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # Template and scheduled date this row was materialized from; the pair is
+    # unique, which makes re-running materialize_recurring harmless.
+    recurring = models.ForeignKey(
+        'RecurringTransaction', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='transactions', db_index=False,
+    )
+    occurrence = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['family', 'date', 'id'], name='budget_txn_family_date_id'),
+            models.Index(fields=['family', 'category', 'date'], name='budget_txn_family_cat_date'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['family', 'import_hash'],
+                condition=models.Q(import_hash__isnull=False),
+                name='budget_txn_family_import_hash',
+            ),
+            models.UniqueConstraint(
+                fields=['recurring', 'occurrence'],
+                condition=models.Q(recurring__isnull=False),
+                name='budget_txn_recurring_occurrence',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.amount} - {self.category.name}"
 
+    def save(self, *args, **kwargs):
+        # family is a copy of member.family kept on the row for the ledger indexes.
+        if self.family_id is None and self.member_id is not None:
+            self.family_id = self.member.family_id
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so that ledger signals can compute deltas on save.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
 
 class Family(models.Model):
     name = models.CharField(max_length=255)
+    # ISO 4217 code that reports convert every amount into.
+    base_currency = models.CharField(max_length=3, default='RUB', validators=[currency_code])
+    # ChangeLog entries up to this id may have been compacted away; sync
+    # cursors below it must start over.
+    sync_floor = models.BigIntegerField(default=0)
+    # Set when deletion is queued: the family is hidden until a worker
+    # removes it (see budget.jobs).
+    deleted_at = models.DateTimeField(null=True, blank=True)
     created_by = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -73,3 +172,225 @@ class InviteCode(models.Model):
 
     def __str__(self):
         return str(self.code)
+
+
+class RecurringTransaction(models.Model):
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+    FREQUENCY_CHOICES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+        (YEARLY, 'Yearly'),
+    ]
+
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, related_name='recurring_transactions')
+    member = models.ForeignKey(FamilyMembership, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(BudgetCategory, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    description = models.CharField(max_length=255, blank=True)
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPE_CHOICES, default=Transaction.EXPENSE)
+    currency = models.CharField(max_length=3, blank=True, default='', validators=[currency_code])
+    # Every ``interval`` days/weeks/months/years, counted from start_date.
+    # Monthly and yearly rules keep start_date's day, clamped to short months.
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default=MONTHLY)
+    interval = models.PositiveSmallIntegerField(default=1)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    # First occurrence not materialized yet; None once the rule has run out.
+    next_date = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_date', 'family'], name='budget_recurring_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.amount} {self.frequency} from {self.start_date}'
+
+
+class MonthlyRollup(models.Model):
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, related_name='rollups')
+    category = models.ForeignKey(BudgetCategory, on_delete=models.CASCADE, related_name='rollups')
+    month = models.DateField()
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPE_CHOICES)
+    # Buckets are kept per currency; reports convert them (see budget.fx).
+    currency = models.CharField(max_length=3, blank=True, default='')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['family', 'month', 'category', 'type', 'currency'],
+                name='budget_rollup_unique_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.family_id} {self.month:%Y-%m} {self.category_id} {self.type}: {self.total} {self.currency}'
+
+
+class BudgetAlert(models.Model):
+    """Recorded the first time a category's spend in a month reaches a threshold of its limit."""
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, related_name='budget_alerts')
+    category = models.ForeignKey(BudgetCategory, on_delete=models.CASCADE, related_name='alerts')
+    month = models.DateField()
+    threshold = models.PositiveSmallIntegerField()
+    spent = models.DecimalField(max_digits=14, decimal_places=2)
+    limit = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['family', 'category', 'month', 'threshold'],
+                name='budget_alert_unique_threshold',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.category_id} {self.month:%Y-%m} reached {self.threshold}%'
+
+
+class TokenRevocation(models.Model):
+    """
+    A revoked token (``jti``) or, with ``revoked_before`` set, every token of
+    ``user_id`` issued before that moment. Rows are kept until the tokens
+    they cover have expired anyway.
+    """
+    jti = models.CharField(max_length=255, blank=True)
+    # Not a foreign key: deleting the user must not drop the revocation.
+    user_id = models.IntegerField(null=True, blank=True)
+    revoked_before = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti or f'user {self.user_id} before {self.revoked_before}'
+
+
+class ExchangeRate(models.Model):
+    """Units of ``currency`` per one unit of settings.BUDGET_FX_PIVOT on ``date``."""
+    date = models.DateField()
+    currency = models.CharField(max_length=3, validators=[currency_code])
+    rate = models.DecimalField(max_digits=20, decimal_places=8)
+
+    class Meta:
+        constraints = [
+            # Serves the "latest rate on or before a date" lookup as one index seek.
+            models.UniqueConstraint(fields=['currency', 'date'], name='budget_fx_currency_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.currency} {self.rate}'
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Balance of a family, or of one member when ``member`` is set, over all
+    transactions dated before ``as_of`` (a month start), in the family's base
+    currency. Written by budget.checkpoints; back-dated changes drop the ones
+    after them.
+    """
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, related_name='balance_checkpoints', db_index=False)
+    member = models.ForeignKey(
+        FamilyMembership, on_delete=models.CASCADE, null=True, blank=True, related_name='balance_checkpoints',
+    )
+    as_of = models.DateField()
+    balance = models.DecimalField(max_digits=16, decimal_places=2)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['family', 'as_of'], condition=models.Q(member__isnull=True),
+                name='budget_checkpoint_family',
+            ),
+            models.UniqueConstraint(
+                fields=['family', 'member', 'as_of'], condition=models.Q(member__isnull=False),
+                name='budget_checkpoint_member',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.family_id}/{self.member_id or "-"} {self.as_of}: {self.balance}'
+
+
+class ChangeLog(models.Model):
+    """
+    A write to one of a family's transactions, categories or memberships; the
+    id is the cursor of /api/sync/. ``deleted`` entries are tombstones.
+    Written by budget.sync, which also compacts the log.
+    """
+    TRANSACTION = 'transaction'
+    CATEGORY = 'category'
+    MEMBERSHIP = 'membership'
+    MODEL_CHOICES = [
+        (TRANSACTION, 'Transaction'),
+        (CATEGORY, 'Category'),
+        (MEMBERSHIP, 'Membership'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # Not a foreign key: tombstones are still written while a family is
+    # being deleted; compaction drops the entries of deleted families.
+    family_id = models.IntegerField()
+    model = models.CharField(max_length=16, choices=MODEL_CHOICES)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['family_id', 'id'], name='budget_changelog_cursor'),
+            models.Index(fields=['family_id', 'model', 'object_id', 'id'], name='budget_changelog_object'),
+        ]
+
+    def __str__(self):
+        return f'{self.pk} {self.model} {self.object_id}{" deleted" if self.deleted else ""}'
+
+
+class Job(models.Model):
+    """
+    Background work run by ``manage.py run_workers``: ``kind`` names a handler
+    in budget.jobs, called with ``payload`` as keyword arguments. Failed
+    attempts are retried at ``run_at`` with exponential backoff.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Seconds the last attempt spent in its handler.
+    duration = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='budget_job_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} {self.status}'
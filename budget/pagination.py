@@ -0,0 +1,194 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the full view ordering (e.g. ``('date', 'id')``)
+    instead of DRF's first-field-plus-offset positions, so every page is an
+    index range scan and pages stay stable while rows are inserted.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', self.ordering))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        window = self.page_window(queryset, request, view)
+        if window is None:
+            return None
+        return self.take_page(list(window))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        window = self.page_window(queryset, request, view)
+        if window is None:
+            return None
+        return self.take_page([row async for row in window])
+
+    def page_window(self, queryset, request, view=None):
+        """Return the unevaluated slice holding the requested page plus one look-ahead row."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        reverse, position = self.decode_cursor(request) or (False, None)
+        if position is not None:
+            position = self._parse_position(queryset.model, position)
+
+        if reverse:
+            queryset = queryset.order_by(*('-' + field for field in self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self._beyond(position, reverse))
+
+        self.cursor_position = position
+        self.cursor_reverse = reverse
+        return queryset[:self.page_size + 1]
+
+    def take_page(self, results):
+        position, reverse = self.cursor_position, self.cursor_reverse
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        if self.page_size and (self.has_next or self.has_previous):
+            self.display_page_controls = True
+        return self.page
+
+    def _parse_position(self, model, position):
+        if len(position) != len(self.ordering):
+            raise ParseError(self.invalid_cursor_message)
+        try:
+            return [self._clean(model._meta.get_field(field), value) for field, value in zip(self.ordering, position)]
+        except ValidationError:
+            raise ParseError(self.invalid_cursor_message)
+
+    def _clean(self, field, value):
+        # Validators bound integers to the column's range; out-of-range ids
+        # would otherwise fail in the database driver.
+        value = field.to_python(value)
+        field.run_validators(value)
+        return value
+
+    def _beyond(self, position, reverse):
+        # (f1, f2, ...) > (v1, v2, ...) spelled out so that any backend can use
+        # the leading column as an index range bound.
+        lookup = 'lt' if reverse else 'gt'
+        first_field, first_value = self.ordering[0], position[0]
+        condition = Q()
+        for index, (field, value) in enumerate(zip(self.ordering, position)):
+            branch = Q(**{f'{field}__{lookup}': value})
+            for prefix_field, prefix_value in zip(self.ordering[:index], position[:index]):
+                branch &= Q(**{prefix_field: prefix_value})
+            condition |= branch
+        bound = Q(**{f'{first_field}__{lookup}e': first_value})
+        return bound & condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            return [str(instance[field]) for field in ordering]
+        return [str(getattr(instance, field)) for field in ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii'), validate=True).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens['p']
+        except (TypeError, ValueError, KeyError):
+            raise ParseError(self.invalid_cursor_message)
+        return reverse, position
+
+    def encode_cursor(self, reverse, position):
+        tokens = {'p': position}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = [str(value) for value in self.cursor_position]
+        return self.encode_cursor(False, position)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = [str(value) for value in self.cursor_position]
+        return self.encode_cursor(True, position)
+
+
+class LedgerPagination(BasePagination):
+    """
+    Keyset pagination by default; ``?page=N`` (or ``?pagination=page``) keeps
+    the old page-number responses with ``count``. Orderings the keyset can't
+    follow (``?ordering=amount``) fall back to page numbers as well.
+    """
+    mode_query_param = 'pagination'
+    display_page_controls = False
+
+    def use_page_numbers(self, queryset, request, view):
+        params = request.query_params
+        if params.get(self.mode_query_param) == 'page' or PageNumberPagination.page_query_param in params:
+            return True
+        ordering = tuple(getattr(view, 'cursor_ordering', KeysetPagination.ordering))
+        return tuple(queryset.query.order_by) != ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_page_numbers(queryset, request, view):
+            self.paginator = PageNumberPagination()
+        else:
+            self.paginator = KeysetPagination()
+        page = self.paginator.paginate_queryset(queryset, request, view)
+        self.display_page_controls = getattr(self.paginator, 'display_page_controls', False)
+        return page
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = KeysetPagination().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "page" for page-number pagination.',
+                'schema': {'type': 'string', 'enum': ['cursor', 'page']},
+            },
+            *KeysetPagination().get_schema_operation_parameters(view),
+            *PageNumberPagination().get_schema_operation_parameters(view)[:1],
+        ]
+
+    def to_html(self):
+        return self.paginator.to_html()
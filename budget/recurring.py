@@ -0,0 +1,187 @@
+import calendar
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.db import connection, connections, transaction
+
+from .ledger import current_state, send_changes
+from .models import RecurringTransaction, Transaction
+
+
+def _add_months(anchor, months):
+    index = anchor.year * 12 + anchor.month - 1 + months
+    year, month = divmod(index, 12)
+    month += 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence(template, number):
+    """The ``number``-th date of the rule, counting start_date as 0."""
+    step = number * template.interval
+    if template.frequency == RecurringTransaction.DAILY:
+        return template.start_date + timedelta(days=step)
+    if template.frequency == RecurringTransaction.WEEKLY:
+        return template.start_date + timedelta(weeks=step)
+    if template.frequency == RecurringTransaction.MONTHLY:
+        return _add_months(template.start_date, step)
+    return _add_months(template.start_date, step * 12)
+
+
+def _first_number(template, first):
+    # Dates are counted from start_date rather than stepped from next_date,
+    # so a month-end anchor survives February.
+    start = template.start_date
+    if template.frequency in (RecurringTransaction.DAILY, RecurringTransaction.WEEKLY):
+        unit = template.interval * (1 if template.frequency == RecurringTransaction.DAILY else 7)
+        return max(0, -(-(first - start).days // unit))
+    unit = template.interval * (1 if template.frequency == RecurringTransaction.MONTHLY else 12)
+    number = max(0, ((first.year - start.year) * 12 + first.month - start.month) // unit)
+    while occurrence(template, number) < first:
+        number += 1
+    return number
+
+
+def first_on_or_after(template, day):
+    """The rule's first date on or after ``day``, or None if the rule ends before it."""
+    current = occurrence(template, _first_number(template, day))
+    if template.end_date is not None and current > template.end_date:
+        return None
+    return current
+
+
+def due_dates(template, until):
+    """Unmaterialized dates up to ``until`` and the next date after them (None when the rule ends)."""
+    if template.next_date is None:
+        return [], None
+    number = _first_number(template, template.next_date)
+    dates = []
+    while True:
+        current = occurrence(template, number)
+        if template.end_date is not None and current > template.end_date:
+            return dates, None
+        if current > until:
+            return dates, current
+        dates.append(current)
+        number += 1
+
+
+@dataclass
+class MaterializeReport:
+    families: int = 0
+    templates: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    chunks: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)
+
+    def merge(self, other):
+        self.templates += other.templates
+        self.inserted += other.inserted
+        self.duplicates += other.duplicates
+        self.chunks += other.chunks
+        self.errors += other.errors
+
+
+def _due_templates(until, family_ids=None):
+    queryset = RecurringTransaction.objects.filter(is_active=True, next_date__lte=until)
+    if family_ids is not None:
+        queryset = queryset.filter(family_id__in=family_ids)
+    return queryset
+
+
+def materialize_chunk(family_ids, until, batch_size=5000):
+    """
+    Materialize every due occurrence of the templates of ``family_ids`` in one
+    transaction: the rows and the advanced next_date are committed together
+    or not at all, so a crashed run is simply repeated. The unique
+    (recurring, occurrence) key backs this up against overlapping runs.
+    """
+    report = MaterializeReport(chunks=1)
+    with transaction.atomic():
+        templates = _due_templates(until, family_ids).order_by('pk')
+        if connection.features.has_select_for_update_skip_locked:
+            # Templates another worker holds are left to it.
+            templates = templates.select_for_update(skip_locked=True)
+        rows, advanced = [], []
+        for template in templates:
+            dates, template.next_date = due_dates(template, until)
+            advanced.append(template)
+            rows += [
+                Transaction(
+                    amount=template.amount, description=template.description, date=day,
+                    category_id=template.category_id, member_id=template.member_id,
+                    family_id=template.family_id, user_id=template.user_id, type=template.type,
+                    currency=template.currency, recurring_id=template.pk, occurrence=day,
+                )
+                for day in dates
+            ]
+        report.templates = len(advanced)
+        if not advanced:
+            return report
+
+        # Rows written by a concurrent run, or left behind after next_date
+        # was moved back by hand.
+        existing = set()
+        if rows:
+            existing = set(
+                Transaction.objects
+                .filter(
+                    recurring_id__in=[template.pk for template in advanced],
+                    occurrence__gte=min(row.occurrence for row in rows),
+                )
+                .values_list('recurring_id', 'occurrence')
+            )
+        fresh = [row for row in rows if (row.recurring_id, row.occurrence) not in existing]
+        report.duplicates = len(rows) - len(fresh)
+        created = Transaction.objects.bulk_create(fresh, batch_size=batch_size)
+        send_changes([(None, current_state(obj)) for obj in created])
+        RecurringTransaction.objects.bulk_update(advanced, ['next_date'], batch_size=batch_size)
+        report.inserted = len(created)
+    return report
+
+
+def materialize(until=None, chunk_size=500, workers=1, batch_size=5000, family_ids=None, log=None):
+    """
+    Materialize all due recurring transactions up to ``until`` (default:
+    today). Families are split into chunks of ``chunk_size``; with several
+    ``workers`` the chunks run in parallel threads, each on its own database
+    connection.
+    """
+    until = until or date.today()
+    started = time.perf_counter()
+    families = list(
+        _due_templates(until, family_ids)
+        .order_by('family_id')
+        .values_list('family_id', flat=True)
+        .distinct()
+    )
+    chunks = [families[index:index + chunk_size] for index in range(0, len(families), chunk_size)]
+    report = MaterializeReport(families=len(families))
+
+    def run(chunk):
+        try:
+            return materialize_chunk(chunk, until, batch_size)
+        except Exception as error:
+            # One bad chunk must not stop the others; it is retried next run.
+            return MaterializeReport(chunks=1, errors=[f'families {chunk[0]}-{chunk[-1]}: {error}'])
+        finally:
+            if workers > 1:
+                connections.close_all()
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(run, chunks)
+            for result in results:
+                report.merge(result)
+                if log:
+                    log(report)
+    else:
+        for chunk in chunks:
+            report.merge(run(chunk))
+            if log:
+                log(report)
+    report.elapsed = time.perf_counter() - started
+    return report
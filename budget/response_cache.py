@@ -0,0 +1,115 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .membership import get_membership
+from .versioning import family_version
+
+CACHE_ALIAS = getattr(settings, 'BUDGET_RESPONSE_CACHE', 'responses')
+MAX_BYTES = getattr(settings, 'BUDGET_RESPONSE_CACHE_MAX_BYTES', 512 * 1024)
+STATS = ('hits', 'misses', 'stores', 'too_large')
+
+
+def get_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def _count(name):
+    cache = get_cache()
+    key = f'budget:response-stats:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    values = get_cache().get_many([f'budget:response-stats:{name}' for name in STATS])
+    return {name: values.get(f'budget:response-stats:{name}', 0) for name in STATS}
+
+
+class CachedResponse(Response):
+    """
+    A response replayed from stored bytes. Rendering returns the bytes as
+    they are; ``data`` is only decoded if something asks for it.
+    """
+
+    def __init__(self, content, content_type):
+        super().__init__(content_type=content_type)
+        # Response only sets the header while rendering, which is skipped here.
+        self['Content-Type'] = content_type
+        self._cached_content = content
+
+    @property
+    def data(self):
+        if self._data is None and self._cached_content is not None:
+            self._data = json.loads(self._cached_content)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        return self._cached_content
+
+
+def _cache_key(request, membership, per_user):
+    params = '&'.join(f'{key}={value}' for key, value in sorted(request.query_params.lists()))
+    parts = [membership.family_id, family_version(membership.family_id), request.path, params]
+    if per_user:
+        parts += [request.user.pk, membership.role]
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    # The family id stays readable so entries can be told apart when debugging;
+    # stale versions are never read again and age out through TTL/culling.
+    return f'budget:response:{membership.family_id}:{digest}'
+
+
+def cached_family_response(per_user=False):
+    """
+    Cache the rendered JSON of a family-scoped GET handler under a key that
+    includes the family's version counter, so any write to the family makes
+    its old entries unreachable. Set ``per_user`` for responses that differ
+    between members of the same family.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            membership = get_membership(request)
+            if membership is None or request.accepted_renderer.format != 'json':
+                return view_method(self, request, *args, **kwargs)
+
+            cache = get_cache()
+            key = _cache_key(request, membership, per_user)
+            cached = cache.get(key)
+            if cached is not None:
+                _count('hits')
+                content, content_type = cached
+                response = CachedResponse(content, content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK or not hasattr(response, 'add_post_render_callback'):
+                return response
+
+            def store(rendered):
+                if len(rendered.content) > MAX_BYTES:
+                    _count('too_large')
+                    return
+                cache.set(key, (rendered.content, rendered['Content-Type']))
+                _count('stores')
+
+            response.add_post_render_callback(store)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import TokenRevocation
+
+# How often a process looks for revocations made by other processes.
+REFRESH_SECONDS = getattr(settings, 'BUDGET_REVOCATION_REFRESH_SECONDS', 30)
+
+# Changes with every revocation, so an idle check costs one cache read.
+VERSION_KEY = 'budget:revocations:version'
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings; ``in`` may report false positives, never false negatives."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & 1 << (position & 7) for position in self._positions(key))
+
+
+class Denylist:
+    """
+    The process-local copy of all live revocations. Checking a token only
+    touches memory: the bloom filter turns away almost every valid jti, the
+    exact set confirms the rest, and per-user cut-offs are a dict lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._replace((), {})
+        self.version = None
+        self.checked_at = -math.inf
+
+    def _replace(self, jtis, users):
+        bloom = BloomFilter(max(1024, 2 * len(jtis)))
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom, self.jtis, self.users = bloom, set(jtis), users
+
+    def add_jti(self, jti):
+        self.jtis.add(jti)
+        self.bloom.add(jti)
+
+    def add_user(self, user_id, revoked_before):
+        self.users[user_id] = max(revoked_before, self.users.get(user_id, revoked_before))
+
+    def is_revoked(self, token):
+        revoked_before = self.users.get(token.get(api_settings.USER_ID_CLAIM))
+        # claims_at (budget.tokens) has sub-second precision, iat does not.
+        if revoked_before is not None and token.get('claims_at', token.get('iat', 0)) <= revoked_before:
+            return True
+        jti = token.get(api_settings.JTI_CLAIM)
+        return jti is not None and jti in self.bloom and jti in self.jtis
+
+    def _due(self):
+        return time.monotonic() - self.checked_at >= REFRESH_SECONDS
+
+    def _load(self, rows, version):
+        jtis, users = [], {}
+        for jti, user_id, revoked_before in rows:
+            if jti:
+                jtis.append(jti)
+            elif revoked_before is not None:
+                users[user_id] = max(revoked_before.timestamp(), users.get(user_id, 0))
+        self._replace(jtis, users)
+        self.version = version
+
+    def refresh(self, force=False):
+        if not (force or self._due()) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = time.monotonic()
+            version = cache.get(VERSION_KEY)
+            if force or version is None or version != self.version:
+                self._load(list(_live_rows()), version)
+        finally:
+            self._lock.release()
+
+    async def arefresh(self, force=False):
+        if not (force or self._due()) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = time.monotonic()
+            version = await cache.aget(VERSION_KEY)
+            if force or version is None or version != self.version:
+                self._load([row async for row in _live_rows()], version)
+        finally:
+            self._lock.release()
+
+
+denylist = Denylist()
+
+
+def _live_rows():
+    return (
+        TokenRevocation.objects
+        .filter(expires_at__gt=datetime.now(timezone.utc))
+        .values_list('jti', 'user_id', 'revoked_before')
+    )
+
+
+def _recorded(revocation):
+    TokenRevocation.objects.filter(expires_at__lte=datetime.now(timezone.utc)).delete()
+    revocation.save()
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def revoke_token(token):
+    """Revoke one access or refresh token until it expires."""
+    jti = token[api_settings.JTI_CLAIM]
+    _recorded(TokenRevocation(
+        jti=jti,
+        user_id=token.get(api_settings.USER_ID_CLAIM),
+        expires_at=datetime.fromtimestamp(token['exp'], timezone.utc),
+    ))
+    denylist.add_jti(jti)
+
+
+def revoke_user(user_id):
+    """Revoke every token issued to ``user_id`` so far."""
+    now = datetime.now(timezone.utc)
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    _recorded(TokenRevocation(user_id=user_id, revoked_before=now, expires_at=now + lifetime))
+    denylist.add_user(user_id, now.timestamp())
+
+
+def check(token):
+    if denylist.is_revoked(token):
+        raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
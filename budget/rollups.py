@@ -0,0 +1,210 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from . import fx
+from .categories import subtree
+from .models import MonthlyRollup, Transaction
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def _bucket(state):
+    return (state.family_id, state.category_id, month_start(state.date), state.type, state.currency)
+
+
+def collect_deltas(changes):
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for old, new in changes:
+        if old is not None and old.family_id is not None:
+            delta = deltas[_bucket(old)]
+            delta[0] -= old.amount
+            delta[1] -= 1
+        if new is not None and new.family_id is not None:
+            delta = deltas[_bucket(new)]
+            delta[0] += new.amount
+            delta[1] += 1
+    return {key: value for key, value in deltas.items() if value[0] or value[1]}
+
+
+def _apply_delta(key, amount, count):
+    family_id, category_id, month, type_, currency = key
+    bucket = MonthlyRollup.objects.filter(
+        family_id=family_id, category_id=category_id, month=month, type=type_, currency=currency,
+    )
+    updated = bucket.update(total=F('total') + amount, count=F('count') + count)
+    if not updated and count > 0:
+        try:
+            with transaction.atomic():
+                MonthlyRollup.objects.create(
+                    family_id=family_id, category_id=category_id, month=month, type=type_,
+                    currency=currency, total=amount, count=count,
+                )
+        except IntegrityError:
+            # Somebody created the bucket concurrently; add to theirs.
+            bucket.update(total=F('total') + amount, count=F('count') + count)
+    if count < 0:
+        bucket.filter(count__lte=0).delete()
+
+
+def apply_changes(changes):
+    deltas = collect_deltas(changes)
+    if not deltas:
+        return
+    with transaction.atomic():
+        for key in sorted(deltas, key=str):
+            amount, count = deltas[key]
+            _apply_delta(key, amount, count)
+
+
+def ledger_buckets(family_ids=None):
+    queryset = Transaction.objects.all()
+    if family_ids is not None:
+        queryset = queryset.filter(family_id__in=family_ids)
+    rows = (
+        queryset
+        .annotate(month=TruncMonth('date'))
+        .values('family_id', 'category_id', 'month', 'type', 'currency')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    return {
+        (row['family_id'], row['category_id'], row['month'], row['type'], row['currency']):
+            (row['total'], row['count'])
+        for row in rows
+    }
+
+
+def stored_buckets(family_ids=None):
+    queryset = MonthlyRollup.objects.all()
+    if family_ids is not None:
+        queryset = queryset.filter(family_id__in=family_ids)
+    return {
+        (row.family_id, row.category_id, row.month, row.type, row.currency): (row.total, row.count)
+        for row in queryset
+    }
+
+
+def find_drift(family_ids=None):
+    expected = ledger_buckets(family_ids)
+    actual = stored_buckets(family_ids)
+    drift = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        want = expected.get(key, (Decimal('0'), 0))
+        have = actual.get(key, (Decimal('0'), 0))
+        if want[0] != have[0] or want[1] != have[1]:
+            drift.append((key, want, have))
+    return drift
+
+
+def rebuild(family_ids=None):
+    buckets = ledger_buckets(family_ids)
+    with transaction.atomic():
+        stale = MonthlyRollup.objects.all()
+        if family_ids is not None:
+            stale = stale.filter(family_id__in=family_ids)
+        stale.delete()
+        MonthlyRollup.objects.bulk_create(
+            [
+                MonthlyRollup(
+                    family_id=family_id, category_id=category_id, month=month, type=type_,
+                    currency=currency, total=total, count=count,
+                )
+                for (family_id, category_id, month, type_, currency), (total, count) in buckets.items()
+            ],
+            batch_size=1000,
+        )
+    return len(buckets)
+
+
+def summary_querysets(family_id, start=None, end=None, category_id=None):
+    """Return the (per month, per category) aggregate querysets behind summarize(); a category includes its subtree."""
+    queryset = MonthlyRollup.objects.filter(family_id=family_id)
+    if start is not None:
+        queryset = queryset.filter(month__gte=start)
+    if end is not None:
+        queryset = queryset.filter(month__lte=end)
+    if category_id is not None:
+        queryset = queryset.filter(category_id__in=subtree(category_id))
+
+    by_month = queryset.values('month', 'type', 'currency').annotate(total=Sum('total')).order_by('month')
+    by_category = (
+        queryset
+        .values('category_id', 'category__name', 'type', 'currency')
+        .annotate(total=Sum('total'))
+        .order_by('category_id')
+    )
+    return by_month, by_category
+
+
+def foreign_currencies(rows):
+    return sorted({row['currency'] for row in rows if row['currency']})
+
+
+def fold_summary(month_rows, category_rows, converted_rows=()):
+    """
+    Fold base currency buckets and the converted totals of the foreign ones
+    (budget.fx.converted_totals) into per month and per category totals.
+    Returns them with the number of rows that had no exchange rate.
+    """
+    months = defaultdict(lambda: {Transaction.INCOME: Decimal('0'), Transaction.EXPENSE: Decimal('0')})
+    for row in month_rows:
+        totals = months[row['month']]
+        if not row['currency']:
+            totals[row['type']] += row['total']
+
+    categories = {}
+
+    def category(row):
+        return categories.setdefault(row['category_id'], {
+            'name': row['category__name'],
+            Transaction.INCOME: Decimal('0'),
+            Transaction.EXPENSE: Decimal('0'),
+        })
+
+    for row in category_rows:
+        entry = category(row)
+        if not row['currency']:
+            entry[row['type']] += row['total']
+
+    unconverted = 0
+    for row in converted_rows:
+        total = (row['total'] or Decimal('0')).quantize(fx.CENT)
+        months[row['month']][row['type']] += total
+        category(row)[row['type']] += total
+        unconverted += row['unconverted']
+    return months, categories, unconverted
+
+
+def _subtree(category_id):
+    return None if category_id is None else subtree(category_id)
+
+
+def summarize(family_id, start=None, end=None, category_id=None):
+    """Per month and per category totals in the family's base currency, which is returned with them."""
+    by_month, by_category = summary_querysets(family_id, start, end, category_id)
+    month_rows = list(by_month)
+    base = fx.base_currency(family_id)
+    converted = []
+    foreign = foreign_currencies(month_rows)
+    if foreign:
+        converted = fx.converted_totals(family_id, base, foreign, start, end, _subtree(category_id))
+    return (base, *fold_summary(month_rows, by_category, converted))
+
+
+async def asummarize(family_id, start=None, end=None, category_id=None):
+    by_month, by_category = summary_querysets(family_id, start, end, category_id)
+    month_rows = [row async for row in by_month]
+    base = await fx.abase_currency(family_id)
+    converted = []
+    foreign = foreign_currencies(month_rows)
+    if foreign:
+        converted = [
+            row async for row in fx.converted_totals(family_id, base, foreign, start, end, _subtree(category_id))
+        ]
+    return (base, *fold_summary(month_rows, [row async for row in by_category], converted))
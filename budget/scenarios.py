@@ -0,0 +1,270 @@
+import json
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Min
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import checkpoints, jobs
+from .models import (
+    BudgetCategory, Family, FamilyMember, FamilyMembership, InviteCode, RecurringTransaction, Transaction,
+)
+from .tokens import issue_tokens
+
+# ``prepare(ctx, iteration)`` runs untimed before each request and returns the
+# request: a dict with ``path`` and optionally ``data``, ``user`` and ``multipart``.
+Scenario = namedtuple('Scenario', 'name method expect prepare')
+
+
+def call(path, data=None, user=None, multipart=False):
+    return {'path': path, 'data': data, 'user': user, 'multipart': multipart}
+
+
+def static(path, data=None):
+    return lambda ctx, iteration: call(path, data)
+
+
+def transaction_data(ctx, iteration):
+    return {
+        'amount': f'{iteration % 1000 + 1}.25', 'date': str(ctx.first_date), 'category': ctx.category_id,
+        'description': f'bench {iteration}', 'type': 'expense',
+    }
+
+
+def statement(ctx, iteration, rows=100):
+    lines = ['date,amount,description,type,category']
+    lines += [f'{ctx.first_date},{row + 1}.00,bench import {iteration}-{row},expense,Bench' for row in range(rows)]
+    return SimpleUploadedFile('statement.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+
+def new_transaction(ctx, iteration):
+    return Transaction.objects.create(
+        amount=Decimal('1.25'), date=ctx.first_date, category_id=ctx.category_id, member=ctx.membership,
+        user=ctx.owner, description=f'bench {iteration}', type=Transaction.EXPENSE,
+    ).pk
+
+
+def new_recurring(ctx, iteration):
+    return RecurringTransaction.objects.create(
+        family=ctx.family, member=ctx.membership, user=ctx.owner, category_id=ctx.category_id,
+        amount=Decimal('9.99'), description=f'bench {iteration}', start_date=ctx.first_date,
+        next_date=ctx.first_date,
+    ).pk
+
+
+def new_member(ctx, label, iteration):
+    user = ctx.new_user(f'{label}-{iteration}')
+    return FamilyMembership.objects.create(user=user, family=ctx.family, role='member')
+
+
+def new_family(ctx, label, iteration, with_member=False):
+    owner = ctx.new_user(f'{label}-{iteration}')
+    family = Family.objects.create(name=f'Bench {label} {iteration}', created_by=owner)
+    FamilyMembership.objects.create(user=owner, family=family, role='owner')
+    member = None
+    if with_member:
+        member = ctx.new_user(f'{label}-{iteration}-member')
+        FamilyMembership.objects.create(user=member, family=family, role='member')
+    return owner, member
+
+
+def prepare_join(ctx, iteration):
+    invite = InviteCode.objects.create(family=ctx.family)
+    return call('/api/join/', {'code': str(invite.code)}, user=ctx.new_user(f'join-{iteration}'))
+
+
+def prepare_remove(ctx, iteration):
+    return call('/api/family/members/remove/', {'user_id': new_member(ctx, 'remove', iteration).pk})
+
+
+def prepare_change_role(ctx, iteration):
+    target = new_member(ctx, 'role', iteration)
+    return call('/api/family/members/change-role/', {'user_id': target.pk, 'new_role': 'member'})
+
+
+def prepare_leave(ctx, iteration):
+    return call('/api/family/leave/', user=new_member(ctx, 'leave', iteration).user)
+
+
+def prepare_delete_family(ctx, iteration):
+    owner, _ = new_family(ctx, 'delete', iteration)
+    return call('/api/family/delete/', user=owner)
+
+
+def prepare_assign_head(ctx, iteration):
+    owner, member = new_family(ctx, 'head', iteration, with_member=True)
+    return call('/api/family/assign-head/', {'user_id': member.pk}, user=owner)
+
+
+def prepare_logout(ctx, iteration):
+    user = ctx.new_user(f'logout-{iteration}')
+    return call('/api/logout/', {'refresh': str(RefreshToken.for_user(user))}, user=user)
+
+
+def prepare_balance(ctx, iteration):
+    # As after the monthly job: one checkpoint plus this month's rows.
+    checkpoints.write(family_ids=[ctx.membership.family_id])
+    return call('/api/transactions/balance/')
+
+
+def prepare_token_refresh(ctx, iteration):
+    return call('/api/token/refresh/', {'refresh': str(RefreshToken.for_user(ctx.owner))}, user=False)
+
+
+SCENARIOS = (
+    Scenario('api-root', 'get', 200, static('/api/')),
+    Scenario('familymembers-list', 'get', 200, static('/api/familymembers/')),
+    Scenario('familymembers-create', 'post', 201, static(
+        '/api/familymembers/', {'name': 'Bench', 'age': 30, 'relation': 'self'},
+    )),
+    Scenario('familymembers-detail', 'get', 200,
+             lambda ctx, i: call(f'/api/familymembers/{ctx.family_member_id}/')),
+    Scenario('categories-list', 'get', 200, static('/api/categories/')),
+    Scenario('categories-search', 'get', 200, static('/api/categories/?search=прод')),
+    Scenario('categories-create', 'post', 201,
+             lambda ctx, i: call('/api/categories/', {'name': f'Bench {i}'})),
+    Scenario('categories-detail', 'get', 200, lambda ctx, i: call(f'/api/categories/{ctx.category_id}/')),
+    Scenario('categories-update', 'patch', 200,
+             lambda ctx, i: call(f'/api/categories/{ctx.category_id}/', {'description': f'v{i}'})),
+    Scenario('categories-delete', 'delete', 204, lambda ctx, i: call(
+        f'/api/categories/{BudgetCategory.objects.create(user=ctx.owner, name=f"Doomed {i}").pk}/',
+    )),
+    Scenario('categories-budgets', 'get', 200, static('/api/categories/budgets/')),
+    Scenario('categories-alerts', 'get', 200, static('/api/categories/alerts/')),
+    Scenario('categories-tree', 'get', 200, static('/api/categories/tree/')),
+    Scenario('transactions-list', 'get', 200, static('/api/transactions/?page_size=50')),
+    Scenario('transactions-list-page', 'get', 200, static('/api/transactions/?page=1')),
+    Scenario('transactions-list-filtered', 'get', 200,
+             lambda ctx, i: call(f'/api/transactions/?category={ctx.category_id}&ordering=-amount')),
+    Scenario('transactions-search', 'get', 200, static('/api/transactions/?search=такси')),
+    Scenario('transactions-detail', 'get', 200,
+             lambda ctx, i: call(f'/api/transactions/{ctx.transaction_id}/')),
+    Scenario('transactions-create', 'post', 201,
+             lambda ctx, i: call('/api/transactions/', {**transaction_data(ctx, i), 'member': ctx.membership.pk})),
+    Scenario('transactions-update', 'patch', 200,
+             lambda ctx, i: call(f'/api/transactions/{ctx.transaction_id}/', {'description': f'v{i}'})),
+    Scenario('transactions-delete', 'delete', 204,
+             lambda ctx, i: call(f'/api/transactions/{new_transaction(ctx, i)}/')),
+    Scenario('transactions-summary', 'get', 200, static('/api/transactions/summary/')),
+    Scenario('transactions-balance', 'get', 200, prepare_balance),
+    Scenario('transactions-balance-series', 'get', 200, lambda ctx, i: call(
+        f'/api/transactions/balance-series/?interval=week&from={ctx.first_date}'
+        f'&to={ctx.first_date + timedelta(days=90)}',
+    )),
+    Scenario('transactions-export', 'get', 200, lambda ctx, i: call(
+        f'/api/transactions/export/?format=csv&date_from={ctx.first_date}'
+        f'&date_to={ctx.first_date + timedelta(days=30)}',
+    )),
+    Scenario('transactions-import', 'post', 200,
+             lambda ctx, i: call('/api/transactions/import/', {'file': statement(ctx, i)}, multipart=True)),
+    Scenario('transactions-bulk', 'post', 200, lambda ctx, i: call('/api/transactions/bulk/', {
+        'create': [transaction_data(ctx, i * 50 + row) for row in range(50)],
+    })),
+    Scenario('recurring-list', 'get', 200, static('/api/recurring/')),
+    Scenario('recurring-create', 'post', 201, lambda ctx, i: call('/api/recurring/', {
+        'amount': '9.99', 'description': f'bench {i}', 'category': ctx.category_id, 'frequency': 'weekly',
+        'start_date': str(ctx.first_date),
+    })),
+    Scenario('recurring-update', 'patch', 200, lambda ctx, i: call(
+        f'/api/recurring/{new_recurring(ctx, i)}/', {'interval': 2},
+    )),
+    Scenario('recurring-delete', 'delete', 204, lambda ctx, i: call(f'/api/recurring/{new_recurring(ctx, i)}/')),
+    Scenario('register', 'post', 201, lambda ctx, i: call('/api/register/', {
+        'username': f'{ctx.prefix}-register-{i}', 'email': f'{ctx.prefix}-{i}@example.com',
+        'password': 'bench-password',
+    }, user=False)),
+    Scenario('me', 'get', 200, static('/api/me/')),
+    Scenario('me-update', 'patch', 200, lambda ctx, i: call('/api/me/', {'email': f'bench-{i}@example.com'})),
+    Scenario('me-delete', 'delete', 202,
+             lambda ctx, i: call('/api/me/', user=ctx.new_user(f'me-delete-{i}'))),
+    Scenario('logout', 'post', 200, prepare_logout),
+    Scenario('invite', 'post', 201, static('/api/invite/')),
+    Scenario('join', 'post', 200, prepare_join),
+    Scenario('family-create', 'post', 201,
+             lambda ctx, i: call('/api/family/create/', {'name': f'Bench {i}'}, user=ctx.new_user(f'create-{i}'))),
+    Scenario('family-me', 'get', 200, static('/api/family/me/')),
+    Scenario('family-rename', 'patch', 200,
+             lambda ctx, i: call('/api/family/me/', {'name': f'{ctx.family.name} {i}'})),
+    Scenario('family-members', 'get', 200, static('/api/family/members/')),
+    Scenario('family-members-remove', 'post', 200, prepare_remove),
+    Scenario('family-members-change-role', 'post', 200, prepare_change_role),
+    Scenario('family-leave', 'post', 200, prepare_leave),
+    Scenario('family-delete', 'delete', 200, prepare_delete_family),
+    Scenario('family-assign-head', 'post', 200, prepare_assign_head),
+    Scenario('async-family-me', 'get', 200, static('/api/async/family/me/')),
+    Scenario('async-family-members', 'get', 200, static('/api/async/family/members/')),
+    Scenario('async-categories-list', 'get', 200, static('/api/async/categories/')),
+    Scenario('async-transactions-list', 'get', 200, static('/api/async/transactions/?page_size=50')),
+    Scenario('async-transactions-summary', 'get', 200, static('/api/async/transactions/summary/')),
+    Scenario('sync', 'get', 200, static('/api/sync/?since=0&limit=100')),
+    Scenario('job-status', 'get', 200, lambda ctx, i: call(
+        f"/api/jobs/{jobs.enqueue('rebuild_rollups', {'family_ids': [ctx.family.pk]}, user_id=ctx.owner.pk).pk}/",
+    )),
+    Scenario('cache-stats', 'get', 200, lambda ctx, i: call('/api/cache/stats/', user=ctx.staff)),
+    Scenario('token', 'post', 200, lambda ctx, i: call(
+        '/api/token/', {'username': ctx.staff.username, 'password': ctx.password}, user=False,
+    )),
+    Scenario('token-refresh', 'post', 200, prepare_token_refresh),
+    Scenario('schema', 'get', 200, lambda ctx, i: call('/api/schema/', user=False)),
+    Scenario('docs', 'get', 200, lambda ctx, i: call('/api/docs/', user=False)),
+    Scenario('admin-login', 'get', 200, lambda ctx, i: call('/admin/login/', user=False)),
+)
+
+
+class Context:
+    """Fixtures shared by the scenarios: the benchmarked family and helpers to create throwaway users."""
+
+    password = 'bench-password'
+
+    def __init__(self, membership):
+        self.membership = membership
+        self.family = membership.family
+        self.owner = membership.user
+        self.prefix = f'bench-api-{time.time_ns()}'
+        self._tokens = {}
+
+        self.category_id = BudgetCategory.objects.create(
+            user=self.owner, name='Bench', monthly_limit=Decimal('1000.00'),
+        ).pk
+        self.first_date = Transaction.objects.filter(family=self.family).aggregate(first=Min('date'))['first']
+        self.first_date = self.first_date or date.today()
+        self.transaction_id = new_transaction(self, 0)
+        self.family_member_id = FamilyMember.objects.create(name='Bench', age=30, relation='self').pk
+        self.staff = self.new_user('staff')
+        self.staff.is_staff = True
+        self.staff.set_password(self.password)
+        self.staff.save()
+
+    def new_user(self, label):
+        return User.objects.create(username=f'{self.prefix}-{label}')
+
+    def token(self, user):
+        if user.pk not in self._tokens:
+            self._tokens[user.pk] = issue_tokens(user)['access']
+        return self._tokens[user.pk]
+
+    def prepare(self, scenario, iteration):
+        """``scenario.prepare`` plus the caller's access token, so issuing it is not measured."""
+        request = scenario.prepare(self, iteration)
+        if request['user'] is not False:
+            request['token'] = self.token(request['user'] or self.owner)
+        return request
+
+
+def send(client, ctx, scenario, request):
+    """Issue ``request`` (as returned by ``ctx.prepare``) and drain streaming bodies."""
+    kwargs = {}
+    if request['user'] is not False:
+        kwargs['HTTP_AUTHORIZATION'] = f'Bearer {request["token"]}'
+    if request['data'] is not None and not request['multipart']:
+        kwargs.update(data=json.dumps(request['data']), content_type='application/json')
+    elif request['data'] is not None:
+        kwargs['data'] = request['data']
+    response = getattr(client, scenario.method)(request['path'], **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
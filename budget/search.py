@@ -0,0 +1,91 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+# Text columns indexed per table. PostgreSQL keeps a trigger-maintained
+# ``search_vector`` column with a GIN index; SQLite keeps an FTS5 shadow table
+# (``<table>_fts``) in sync through triggers. Neither is a model field, so the
+# ORM never reads or writes them; migration 0010 creates them.
+SEARCH_COLUMNS = {
+    'budget_transaction': ('description',),
+    'budget_budgetcategory': ('name', 'description'),
+}
+PG_CONFIGS = ('russian', 'english')
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_fts_available = {}
+
+
+def _available(table):
+    key = (connection.vendor, connection.settings_dict['NAME'], table)
+    if key not in _fts_available:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                columns = connection.introspection.get_table_description(cursor, table)
+            _fts_available[key] = any(column.name == 'search_vector' for column in columns)
+        elif connection.vendor == 'sqlite':
+            _fts_available[key] = f'{table}_fts' in connection.introspection.table_names()
+        else:
+            _fts_available[key] = False
+    return _fts_available[key]
+
+
+def _words(terms):
+    return [word for term in terms for word in _WORD.findall(term)]
+
+
+def _postgres_search(queryset, table, words):
+    # Every word must match, the last one as a prefix for search-as-you-type.
+    query = ' & '.join(f"'{word}'" for word in words[:-1])
+    query = f"{query} & '{words[-1]}':*" if query else f"'{words[-1]}':*"
+    tsquery = ' || '.join('to_tsquery(%s::regconfig, %s)' for _ in PG_CONFIGS)
+    params = [value for config in PG_CONFIGS for value in (config, query)]
+    return queryset.alias(
+        search_match=RawSQL(f'{table}.search_vector @@ ({tsquery})', params, output_field=BooleanField()),
+    ).filter(search_match=True).annotate(
+        search_rank=RawSQL(f'ts_rank({table}.search_vector, {tsquery})', params, output_field=FloatField()),
+    )
+
+
+def _sqlite_search(queryset, table, words):
+    fts = f'{table}_fts'
+    # Quote every word so FTS5 operators in user input are taken literally;
+    # the trailing * turns each into a prefix match.
+    query = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+    return queryset.alias(
+        search_match=RawSQL(
+            f'{table}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)', [query], output_field=BooleanField(),
+        ),
+    ).filter(search_match=True).annotate(
+        # bm25() is lower for better matches; negate it so higher ranks first.
+        search_rank=RawSQL(
+            f'(SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid = {table}.id)',
+            [query], output_field=FloatField(),
+        ),
+    )
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for SearchFilter on ``?search=`` that uses the
+    database's full-text index when there is one. Results are ranked by
+    relevance unless the client asked for an explicit ``?ordering=``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        table = queryset.model._meta.db_table
+        words = _words(self.get_search_terms(request))
+        if not words or table not in SEARCH_COLUMNS or not _available(table):
+            return super().filter_queryset(request, queryset, view)
+
+        if connection.vendor == 'postgresql':
+            queryset = _postgres_search(queryset, table, words)
+        else:
+            queryset = _sqlite_search(queryset, table, words)
+
+        if filters.OrderingFilter.ordering_param not in request.query_params:
+            queryset = queryset.order_by('-search_rank', *queryset.query.order_by)
+        return queryset
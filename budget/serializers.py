@@ -1,5 +1,7 @@
 ﻿from rest_framework import serializers
-from .models import FamilyMember, BudgetCategory, Transaction
+from .categories import is_descendant
+from .membership import get_membership
+from .models import FamilyMember, BudgetAlert, BudgetCategory, FamilyMembership, Transaction
 
 
 class FamilyMemberSerializer(serializers.ModelSerializer):
@@ -13,6 +15,27 @@ class BudgetCategorySerializer(serializers.ModelSerializer):
         model = BudgetCategory
         fields = '__all__'
         read_only_fields = ['user']
+        extra_kwargs = {'monthly_limit': {'min_value': 0}}
+
+    def validate_parent(self, parent):
+        if parent is None:
+            return parent
+        membership = get_membership(self.context['request'])
+        if membership is None or not FamilyMembership.objects.filter(
+            family_id=membership.family_id, user_id=parent.user_id,
+        ).exists():
+            raise serializers.ValidationError('Must be a category of your family.')
+        if self.instance is not None and is_descendant(parent.pk, self.instance.pk):
+            raise serializers.ValidationError('A category cannot be moved under itself or its descendants.')
+        return parent
+
+
+class BudgetAlertSerializer(serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.name', read_only=True)
+
+    class Meta:
+        model = BudgetAlert
+        fields = ['id', 'category', 'category_name', 'month', 'threshold', 'spent', 'limit', 'created_at']
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -21,6 +44,6 @@ class TransactionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Transaction
-        fields = ['id', 'amount', 'description', 'date', 'category', 'category_name', 'member', 'user', 'user_name',
-                  'type']
+        fields = ['id', 'amount', 'currency', 'description', 'date', 'category', 'category_name', 'member', 'user',
+                  'user_name', 'type']
         read_only_fields = ['user']
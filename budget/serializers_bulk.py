@@ -0,0 +1,26 @@
+from rest_framework import serializers
+
+from .models import Transaction, currency_code
+
+
+class BulkTransactionItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    currency = serializers.CharField(max_length=3, allow_blank=True, required=False, default='',
+                                     validators=[currency_code])
+    description = serializers.CharField(max_length=255, allow_blank=True, required=False, default='')
+    date = serializers.DateField()
+    category = serializers.IntegerField()
+    type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPE_CHOICES, default=Transaction.EXPENSE)
+
+
+class BulkTransactionSerializer(serializers.Serializer):
+    MAX_ITEMS = 1000
+
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list,
+                                   max_length=MAX_ITEMS)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list,
+                                   max_length=MAX_ITEMS)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list,
+                                   max_length=MAX_ITEMS)
+    all_or_nothing = serializers.BooleanField(required=False, default=False)
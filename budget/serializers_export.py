@@ -0,0 +1,10 @@
+from rest_framework import serializers
+
+from .models import Transaction
+
+
+class TransactionExportFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    category = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPE_CHOICES, required=False)
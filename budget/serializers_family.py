@@ -4,8 +4,8 @@ from .models import Family
 class CreateFamilySerializer(serializers.ModelSerializer):
     class Meta:
         model = Family
-        fields = ['name']
+        fields = ['name', 'base_currency']
 
     def create(self, validated_data):
         user = self.context['request'].user
-        return Family.objects.create(created_by=user, **validated_data)
+        return Family.objects.create(created_by_id=user.pk, **validated_data)
@@ -0,0 +1,29 @@
+import codecs
+
+from rest_framework import serializers
+
+from .importer import FIELDS
+
+
+class TransactionImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    date_format = serializers.CharField(required=False, default='%Y-%m-%d')
+    delimiter = serializers.CharField(required=False, default=',', max_length=1)
+    encoding = serializers.CharField(required=False, default='utf-8-sig')
+    columns = serializers.JSONField(required=False, default=dict,
+                                    help_text='Maps amount/date/description/type/category/currency to CSV headers.')
+
+    def validate_columns(self, value):
+        if not isinstance(value, dict) or not all(isinstance(header, str) for header in value.values()):
+            raise serializers.ValidationError('Expected an object of field name to CSV header.')
+        unknown = set(value) - set(FIELDS)
+        if unknown:
+            raise serializers.ValidationError(f'Unknown field(s): {", ".join(sorted(unknown))}')
+        return value
+
+    def validate_encoding(self, value):
+        try:
+            codecs.lookup(value)
+        except LookupError:
+            raise serializers.ValidationError('Unknown encoding.')
+        return value
@@ -0,0 +1,19 @@
+from rest_framework import serializers
+
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # Seconds between queueing and the start of the last attempt.
+    wait = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'started_at',
+                  'finished_at', 'wait', 'duration', 'result', 'error']
+        read_only_fields = fields
+
+    def get_wait(self, job) -> float | None:
+        if job.started_at is None:
+            return None
+        return (job.started_at - job.created_at).total_seconds()
@@ -0,0 +1,52 @@
+from .serializers import TransactionSerializer
+
+# (output key, values() lookup) in TransactionSerializer.Meta.fields order.
+TRANSACTION_COLUMNS = (
+    ('id', 'id'),
+    ('amount', 'amount'),
+    ('currency', 'currency'),
+    ('description', 'description'),
+    ('date', 'date'),
+    ('category', 'category_id'),
+    ('category_name', 'category__name'),
+    ('member', 'member_id'),
+    ('user', 'user_id'),
+    ('user_name', 'user__username'),
+    ('type', 'type'),
+)
+TRANSACTION_LOOKUPS = tuple(lookup for _, lookup in TRANSACTION_COLUMNS)
+
+
+class LeanTransactionSerializer:
+    """
+    Builds the same dicts as TransactionSerializer(many=True) from
+    ``queryset.values(*TRANSACTION_LOOKUPS)`` rows, skipping DRF's per-field
+    machinery. Only amount and date go through the DRF fields, so their
+    formatting follows the same settings.
+    """
+
+    def __init__(self):
+        fields = TransactionSerializer().fields
+        self.amount = fields['amount'].to_representation
+        self.date = fields['date'].to_representation
+        assert tuple(fields) == tuple(key for key, _ in TRANSACTION_COLUMNS), \
+            'LeanTransactionSerializer is out of sync with TransactionSerializer'
+
+    def to_representation(self, rows):
+        amount, date = self.amount, self.date
+        return [
+            {
+                'id': row['id'],
+                'amount': amount(row['amount']),
+                'currency': row['currency'],
+                'description': row['description'],
+                'date': date(row['date']),
+                'category': row['category_id'],
+                'category_name': row['category__name'],
+                'member': row['member_id'],
+                'user': row['user_id'],
+                'user_name': row['user__username'],
+                'type': row['type'],
+            }
+            for row in rows
+        ]
@@ -0,0 +1,30 @@
+from rest_framework import serializers
+
+from .membership import get_membership
+from .models import FamilyMembership, RecurringTransaction
+
+
+class RecurringTransactionSerializer(serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.name', read_only=True)
+
+    class Meta:
+        model = RecurringTransaction
+        fields = ['id', 'amount', 'currency', 'description', 'type', 'category', 'category_name', 'frequency',
+                  'interval', 'start_date', 'end_date', 'next_date', 'is_active', 'member', 'user']
+        read_only_fields = ['next_date', 'member', 'user']
+        extra_kwargs = {'interval': {'min_value': 1}}
+
+    def validate_category(self, category):
+        membership = get_membership(self.context['request'])
+        if membership is None or not FamilyMembership.objects.filter(
+            family_id=membership.family_id, user_id=category.user_id,
+        ).exists():
+            raise serializers.ValidationError('Category not found in your family.')
+        return category
+
+    def validate(self, attrs):
+        start = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if start and end and end < start:
+            raise serializers.ValidationError({'end_date': 'Must not be before start_date.'})
+        return attrs
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Func, Q, Sum, Value, When, Window
+from django.db.models.functions import Greatest, TruncDay, TruncMonth, TruncWeek
+
+from . import fx
+from .models import Transaction
+
+INTERVALS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+# Longest series one request may ask for, after gap filling.
+MAX_POINTS = 3700
+
+
+class _WindowSum(Func):
+    function = 'SUM'
+    window_compatible = True
+
+
+class RunningSum(Window):
+    """
+    SUM(aggregate) OVER (ORDER BY ...) across the groups of an aggregate
+    query. Window(Sum(...)) can't wrap an aggregate, and a plain Window would
+    be added to the GROUP BY.
+    """
+
+    def __init__(self, aggregate, order_by):
+        super().__init__(
+            _WindowSum(aggregate, output_field=DecimalField(max_digits=20, decimal_places=2)),
+            order_by=order_by,
+        )
+
+    def get_group_by_cols(self):
+        return []
+
+
+def signed_in_base():
+    """Income as positive, expense as negative ``amount_in_base`` (see fx.in_base)."""
+    return Case(
+        When(type=Transaction.INCOME, then=F('amount_in_base')),
+        default=-F('amount_in_base'),
+    )
+
+
+def period_start(day, interval):
+    if interval == 'month':
+        return day.replace(day=1)
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_period(day, interval):
+    if interval == 'month':
+        return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=7 if interval == 'week' else 1)
+
+
+def count_periods(first, last, interval):
+    if interval == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days // (7 if interval == 'week' else 1) + 1
+
+
+def series_queryset(family_id, base, interval, start=None, end=None, member_id=None):
+    """
+    One row per period with transactions: its income, expense and the
+    running balance, the latter a window sum over the periods in date order.
+    Everything before ``start`` is folded into the first period so the
+    window starts from the opening balance; income and expense leave it out.
+    """
+    queryset = Transaction.objects.filter(family_id=family_id)
+    if member_id is not None:
+        queryset = queryset.filter(member_id=member_id)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+
+    period = INTERVALS[interval]('date')
+    in_range = Q()
+    if start is not None:
+        period = Greatest(period, Value(start))
+        in_range = Q(date__gte=start)
+
+    return (
+        queryset
+        .annotate(period=period, amount_in_base=fx.in_base(base))
+        .values('period')
+        .annotate(
+            income=Sum('amount_in_base', filter=in_range & Q(type=Transaction.INCOME)),
+            expense=Sum('amount_in_base', filter=in_range & Q(type=Transaction.EXPENSE)),
+            unconverted=Count('id', filter=Q(amount_in_base__isnull=True)),
+            balance=RunningSum(Sum(signed_in_base()), order_by=F('period').asc()),
+        )
+        .order_by('period')
+    )
+
+
+def fill_gaps(rows, interval, start=None, end=None):
+    """
+    Expand the period rows of series_queryset() into a point per period from
+    ``start`` (or the first row) to ``end``; empty periods keep the balance.
+    Returns (opening balance, points, unconverted rows).
+    """
+    rows = list(rows)
+    zero = Decimal('0')
+    first = start if start is not None else (rows[0]['period'] if rows else None)
+    if first is None:
+        return zero, [], 0
+    last = period_start(end, interval) if end is not None else rows[-1]['period']
+    if count_periods(first, last, interval) > MAX_POINTS:
+        raise ValueError(f'Range is longer than {MAX_POINTS} {interval}s')
+
+    by_period = {row['period']: row for row in rows}
+    opening = zero
+    if rows and rows[0]['period'] == first:
+        head = rows[0]
+        opening = (head['balance'] or zero) - (head['income'] or zero) + (head['expense'] or zero)
+
+    points, balance, current = [], opening, first
+    while current <= last:
+        row = by_period.get(current)
+        if row is not None:
+            balance = row['balance'] or zero
+        points.append({
+            'period': current,
+            'income': (row['income'] or zero) if row else zero,
+            'expense': (row['expense'] or zero) if row else zero,
+            'balance': balance,
+        })
+        current = next_period(current, interval)
+    return opening, points, sum(row['unconverted'] for row in rows)
@@ -0,0 +1,179 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import categories, checkpoints, limits, membership, revocation, rollups, sync, versioning
+from .ledger import (
+    STATE_FIELDS,
+    current_state,
+    ledger_changed,
+    loaded_values,
+    make_state,
+    remember_state,
+    send_changes,
+)
+from .models import (
+    BalanceCheckpoint,
+    BudgetCategory,
+    ChangeLog,
+    Family,
+    FamilyMembership,
+    RecurringTransaction,
+    Transaction,
+)
+
+
+@receiver(pre_save, sender=Transaction)
+def capture_transaction_state(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or instance.pk is None:
+        instance._ledger_old_values = None
+    else:
+        instance._ledger_old_values = loaded_values(instance)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_values = None if created else getattr(instance, '_ledger_old_values', None)
+    old = make_state(old_values) if old_values is not None else None
+    new = current_state(instance)
+    remember_state(instance)
+    send_changes([(old, new)])
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    values = getattr(instance, '_loaded_values', None)
+    if values is None or any(name not in values for name in STATE_FIELDS):
+        old = current_state(instance)
+    else:
+        old = make_state(values)
+    send_changes([(old, None)])
+
+
+@receiver(ledger_changed)
+def update_rollups(sender, changes, **kwargs):
+    rollups.apply_changes(changes)
+
+
+@receiver(ledger_changed)
+def check_budget_limits(sender, changes, **kwargs):
+    # Connected after update_rollups, so it reads the updated totals.
+    limits.check_thresholds(changes)
+
+
+@receiver(ledger_changed)
+def drop_stale_checkpoints(sender, changes, **kwargs):
+    checkpoints.drop_after(changes)
+
+
+@receiver(post_init, sender=BudgetCategory)
+def remember_parent(sender, instance, **kwargs):
+    instance._loaded_parent_id = instance.parent_id
+
+
+@receiver(post_save, sender=BudgetCategory)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        categories.attach([instance])
+    elif instance.parent_id != instance._loaded_parent_id:
+        categories.move(instance)
+    instance._loaded_parent_id = instance.parent_id
+
+
+@receiver(post_save, sender=FamilyMembership)
+@receiver(post_delete, sender=FamilyMembership)
+def membership_changed(sender, instance, **kwargs):
+    membership.invalidate(instance.user_id)
+
+
+@receiver(post_init, sender=Family)
+def remember_base_currency(sender, instance, **kwargs):
+    instance._loaded_base_currency = instance.base_currency
+
+
+@receiver(post_save, sender=Family)
+def family_saved(sender, instance, created, **kwargs):
+    if not created:
+        membership.invalidate_family(instance.pk)
+        if instance.base_currency != instance._loaded_base_currency:
+            # Blank currency means the base currency, so rows written under
+            # the old one get its code to keep their value; checkpoint
+            # balances are in the old currency.
+            old = instance._loaded_base_currency
+            blank = Transaction.objects.filter(family_id=instance.pk, currency='')
+            sync.record((instance.pk, ChangeLog.TRANSACTION, pk, False) for pk in blank.values_list('pk', flat=True))
+            blank.update(currency=old)
+            RecurringTransaction.objects.filter(family_id=instance.pk, currency='').update(currency=old)
+            rollups.rebuild([instance.pk])
+            BalanceCheckpoint.objects.filter(family_id=instance.pk).delete()
+    instance._loaded_base_currency = instance.base_currency
+
+
+@receiver(post_init, sender=User)
+def remember_password(sender, instance, **kwargs):
+    instance._loaded_password = instance.password
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        membership.invalidate_owner(instance.pk)
+        if instance.password != instance._loaded_password:
+            # A new password logs the user out everywhere.
+            revocation.revoke_user(instance.pk)
+    instance._loaded_password = instance.password
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Tokens are trusted without loading the user, so they must be revoked.
+    revocation.revoke_user(instance.pk)
+
+
+@receiver(ledger_changed)
+def bump_ledger_versions(sender, changes, **kwargs):
+    versioning.bump(*(state.family_id for pair in changes for state in pair if state is not None))
+
+
+@receiver(post_save, sender=BudgetCategory)
+@receiver(post_delete, sender=BudgetCategory)
+def category_changed(sender, instance, signal, raw=False, **kwargs):
+    # Categories are seen by every family of their owner.
+    family_ids = list(FamilyMembership.objects.filter(user_id=instance.user_id).values_list('family_id', flat=True))
+    versioning.bump(*family_ids)
+    if not raw:
+        sync.record_categories(family_ids, [instance.pk], deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=FamilyMembership)
+@receiver(post_delete, sender=FamilyMembership)
+@receiver(post_save, sender=Family)
+@receiver(post_delete, sender=Family)
+def bump_family_versions(sender, instance, **kwargs):
+    versioning.bump(instance.family_id if sender is FamilyMembership else instance.pk)
+
+
+@receiver(post_save, sender=User)
+def bump_user_versions(sender, instance, created, **kwargs):
+    if not created:
+        versioning.bump_user_families(instance.pk)
+
+
+@receiver(ledger_changed)
+def log_ledger_changes(sender, changes, **kwargs):
+    sync.record_ledger(changes)
+
+
+@receiver(post_save, sender=FamilyMembership)
+def log_membership_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        sync.record_membership(instance, created=created)
+
+
+@receiver(post_delete, sender=FamilyMembership)
+def log_membership_deleted(sender, instance, **kwargs):
+    sync.record_membership(instance, deleted=True)
@@ -0,0 +1,155 @@
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import BudgetCategory, ChangeLog, Family, FamilyMembership, Transaction
+
+# Changes returned by one /api/sync/ page unless the client asks for fewer.
+BATCH_SIZE = 500
+MAX_BATCH_SIZE = 1000
+
+# Tombstones older than this are compacted away; clients that have not
+# synced for longer start over.
+TOMBSTONE_DAYS = getattr(settings, 'BUDGET_SYNC_TOMBSTONE_DAYS', 90)
+
+
+def record(entries):
+    """Append (family_id, model, object_id, deleted) entries to the change log."""
+    ChangeLog.objects.bulk_create(
+        [
+            ChangeLog(family_id=family_id, model=model, object_id=object_id, deleted=deleted)
+            for family_id, model, object_id, deleted in entries
+        ],
+        batch_size=1000,
+    )
+
+
+def record_ledger(changes):
+    """
+    Log ledger_changed ``changes``: the new state of a row as an upsert in its
+    family, and a tombstone in the family it was deleted from or left.
+    """
+    entries = []
+    for old, new in changes:
+        if new is not None and new.family_id is not None:
+            entries.append((new.family_id, ChangeLog.TRANSACTION, new.id, False))
+        if old is not None and old.family_id is not None and (new is None or new.family_id != old.family_id):
+            entries.append((old.family_id, ChangeLog.TRANSACTION, old.id, True))
+    if entries:
+        record(entries)
+
+
+def record_categories(family_ids, category_ids, deleted=False):
+    """Log category writes in the families of the categories' owner."""
+    record(
+        (family_id, ChangeLog.CATEGORY, category_id, deleted)
+        for family_id in family_ids for category_id in category_ids
+    )
+
+
+def record_membership(membership, created=False, deleted=False):
+    """
+    Log a membership write. Joining or leaving also shows or hides the
+    member's categories, so those are logged with it.
+    """
+    entries = [(membership.family_id, ChangeLog.MEMBERSHIP, membership.pk, deleted)]
+    if created or deleted:
+        entries += [
+            (membership.family_id, ChangeLog.CATEGORY, category_id, deleted)
+            for category_id in BudgetCategory.objects.filter(user_id=membership.user_id).values_list('pk', flat=True)
+        ]
+    record(entries)
+
+
+def cursor(family_id):
+    """The id of the family's latest change, where a full download leaves off."""
+    return ChangeLog.objects.filter(family_id=family_id).aggregate(last=Max('id'))['last'] or 0
+
+
+def changes_since(family_id, since, limit=BATCH_SIZE):
+    """
+    The family's changes after the cursor ``since``, oldest first, with at
+    most ``limit`` log entries read. An object changed several times in the
+    page appears once, at its latest change. Returns (changes, next cursor,
+    more pending); each change is (model, object_id, deleted, entry id).
+    """
+    entries = list(
+        ChangeLog.objects
+        .filter(family_id=family_id, id__gt=since)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'deleted')[:limit + 1]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {}
+    for entry_id, model, object_id, deleted in entries:
+        latest.pop((model, object_id), None)
+        latest[model, object_id] = (model, object_id, deleted, entry_id)
+    return list(latest.values()), (entries[-1][0] if entries else since), more
+
+
+def visible(family_id, model, ids):
+    """The objects among ``ids`` of ``model`` the family can still see; the others are gone for it."""
+    if model == ChangeLog.TRANSACTION:
+        return Transaction.objects.filter(family_id=family_id, pk__in=ids)
+    if model == ChangeLog.CATEGORY:
+        member_user_ids = FamilyMembership.objects.filter(family_id=family_id).values('user_id')
+        return BudgetCategory.objects.filter(pk__in=ids, user__in=member_user_ids)
+    return FamilyMembership.objects.filter(family_id=family_id, pk__in=ids).select_related('user')
+
+
+@dataclass
+class CompactReport:
+    families: int = 0
+    superseded: int = 0
+    tombstones: int = 0
+    orphaned: int = 0
+    elapsed: float = 0.0
+
+
+def compact(tombstone_days=TOMBSTONE_DAYS, chunk_size=500, log=None):
+    """
+    Shrink the change log: drop entries superseded by a later one for the same
+    object, tombstones older than ``tombstone_days`` (raising the families'
+    sync_floor past them) and the entries of deleted families. Superseded
+    entries carry nothing a later cursor needs, so only old tombstones force
+    clients to start over.
+    """
+    started = time.perf_counter()
+    report = CompactReport()
+    horizon = timezone.now() - timedelta(days=tombstone_days)
+    family_ids = list(Family.objects.order_by('pk').values_list('pk', flat=True))
+    report.families = len(family_ids)
+
+    newer = ChangeLog.objects.filter(
+        family_id=OuterRef('family_id'), model=OuterRef('model'), object_id=OuterRef('object_id'),
+        id__gt=OuterRef('id'),
+    )
+    for index in range(0, len(family_ids), chunk_size):
+        chunk = family_ids[index:index + chunk_size]
+        with transaction.atomic():
+            entries = ChangeLog.objects.filter(family_id__in=chunk)
+            report.superseded += entries.filter(Exists(newer)).delete()[0]
+            expired = entries.filter(deleted=True, created_at__lt=horizon)
+            floor = (
+                expired.filter(family_id=OuterRef('pk'))
+                .values('family_id')
+                .annotate(last=Max('id'))
+                .values('last')
+            )
+            Family.objects.filter(pk__in=chunk).update(
+                sync_floor=Greatest('sync_floor', Coalesce(Subquery(floor), 'sync_floor')),
+            )
+            report.tombstones += expired.delete()[0]
+        if log:
+            log(report)
+
+    report.orphaned = ChangeLog.objects.exclude(family_id__in=Family.objects.values('pk')).delete()[0]
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -1,3 +1,2023 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from base64 import b64encode
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import checkpoints, deletion, export, fx, jobs, limits, recurring, revocation, rollups, sync, versioning, views
+from .benchmarks import seed
+from .importer import RowError, TransactionImporter
+from .models import (
+    BalanceCheckpoint, BudgetAlert, BudgetCategory, CategoryClosure, ChangeLog, ExchangeRate, Family,
+    FamilyMembership, InviteCode, Job, MonthlyRollup, RecurringTransaction, TokenRevocation, Transaction,
+)
+from .scenarios import SCENARIOS, Context, send
+from .serializers import TransactionSerializer
+
+
+def make_family(username, family_name='Family'):
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    family = Family.objects.create(name=family_name, created_by=user)
+    membership = FamilyMembership.objects.create(user=user, family=family, role='owner')
+    return user, family, membership
+
+
+def make_transactions(membership, category, count, start=date(2024, 1, 1)):
+    return Transaction.objects.bulk_create([
+        Transaction(
+            amount=Decimal('10.00') + index,
+            date=start.replace(day=1 + index % 28),
+            category=category,
+            member=membership,
+            family_id=membership.family_id,
+            user_id=membership.user_id,
+            type=Transaction.EXPENSE,
+        )
+        for index in range(count)
+    ])
+
+
+class MonthlyRollupTests(TestCase):
+
+    def setUp(self):
+        self.user, self.family, self.membership = make_family('owner')
+        self.food = BudgetCategory.objects.create(user=self.user, name='Food')
+        self.rent = BudgetCategory.objects.create(user=self.user, name='Rent')
+
+    def add(self, amount, day=date(2024, 3, 5), category=None, type=Transaction.EXPENSE):
+        return Transaction.objects.create(
+            amount=Decimal(amount), date=day, category=category or self.food, member=self.membership,
+            user=self.user, type=type,
+        )
+
+    def buckets(self):
+        return {
+            (row.category_id, row.month, row.type): (row.total, row.count)
+            for row in MonthlyRollup.objects.filter(family=self.family)
+        }
+
+    def test_writes_keep_buckets_current(self):
+        first = self.add('10.00')
+        self.add('2.50', day=date(2024, 3, 20))
+        self.assertEqual(self.buckets(), {
+            (self.food.pk, date(2024, 3, 1), Transaction.EXPENSE): (Decimal('12.50'), 2),
+        })
+
+        first.amount = Decimal('4.00')
+        first.date = date(2024, 4, 1)
+        first.category = self.rent
+        first.save()
+        self.assertEqual(self.buckets(), {
+            (self.food.pk, date(2024, 3, 1), Transaction.EXPENSE): (Decimal('2.50'), 1),
+            (self.rent.pk, date(2024, 4, 1), Transaction.EXPENSE): (Decimal('4.00'), 1),
+        })
+
+        first.type = Transaction.INCOME
+        first.save()
+        first.refresh_from_db()
+        first.delete()
+        self.assertEqual(self.buckets(), {
+            (self.food.pk, date(2024, 3, 1), Transaction.EXPENSE): (Decimal('2.50'), 1),
+        })
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_cascades_leave_no_buckets_behind(self):
+        self.add('10.00')
+        self.add('20.00', category=self.rent)
+        self.food.delete()
+        self.assertEqual(list(self.buckets()), [(self.rent.pk, date(2024, 3, 1), Transaction.EXPENSE)])
+        self.assertEqual(rollups.find_drift(), [])
+
+        Family.objects.get(pk=self.family.pk).delete()
+        self.assertFalse(MonthlyRollup.objects.exists())
+
+    def test_summary_reads_the_buckets(self):
+        self.add('10.00')
+        self.add('30.00', category=self.rent, day=date(2024, 4, 2), type=Transaction.INCOME)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = client.get('/api/transactions/summary/').data
+        self.assertEqual((data['income'], data['expense'], data['balance']), ('30.00', '10.00', '20.00'))
+        self.assertEqual(
+            [(row['month'], row['income'], row['expense']) for row in data['months']],
+            [('2024-03', '0.00', '10.00'), ('2024-04', '30.00', '0.00')],
+        )
+        self.assertEqual(
+            {row['category_name']: (row['income'], row['expense']) for row in data['categories']},
+            {'Food': ('0.00', '10.00'), 'Rent': ('30.00', '0.00')},
+        )
+
+    def test_verify_reports_drift_and_rebuild_repairs_it(self):
+        self.add('10.00')
+        other_user, other_family, other_membership = make_family('other', 'Other')
+        make_transactions(other_membership, BudgetCategory.objects.create(user=other_user, name='Misc'), 3)
+        MonthlyRollup.objects.filter(family=self.family).update(total=Decimal('99.00'))
+
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 rollup bucket(s) drifted'):
+            call_command('rebuild_rollups', '--verify', '--family', str(self.family.pk), stdout=out)
+        # SQLite sums decimals without their trailing zeros.
+        self.assertRegex(out.getvalue(), r'type=expense currency=base: ledger=10(\.00)?/1 rollup=99\.00/1')
+
+        call_command('rebuild_rollups', '--family', str(self.family.pk), stdout=StringIO())
+        self.assertEqual(rollups.find_drift([self.family.pk]), [])
+        # bulk_create bypasses the signals, so the other family still drifts.
+        self.assertTrue(rollups.find_drift([other_family.pk]))
+        call_command('rebuild_rollups', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_rollups', '--verify', stdout=out)
+        self.assertIn('Rollups match the ledger', out.getvalue())
+
+
+class LedgerQueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.family, cls.membership = make_family('owner')
+        cls.category = BudgetCategory.objects.create(user=cls.user, name='Food')
+        make_transactions(cls.membership, cls.category, 50)
+
+    def ledger_query(self):
+        return Transaction.objects.filter(family=self.family).order_by('date', 'id')
+
+    def category_query(self):
+        return Transaction.objects.filter(family=self.family, category=self.category).order_by('date')
+
+    def test_transaction_is_stamped_with_member_family(self):
+        transaction = Transaction.objects.create(
+            amount=Decimal('1.00'), date=date(2024, 2, 1), category=self.category,
+            member=self.membership, user=self.user,
+        )
+        self.assertEqual(transaction.family_id, self.family.pk)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_sqlite_ledger_plan_uses_family_date_index(self):
+        plan = self.ledger_query().explain()
+        self.assertIn('budget_txn_family_date_id', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_sqlite_category_plan_uses_family_category_index(self):
+        plan = self.category_query().explain()
+        self.assertIn('budget_txn_family_cat_date', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plan')
+    def test_postgres_ledger_plan_uses_family_date_index(self):
+        with connection.cursor() as cursor:
+            # The test tables are tiny, so force the planner off sequential scans.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = self.ledger_query().explain()
+        self.assertIn('budget_txn_family_date_id', plan)
+        self.assertNotIn('Sort', plan)
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plan')
+    def test_postgres_category_plan_uses_family_category_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = self.category_query().explain()
+        self.assertIn('budget_txn_family_cat_date', plan)
+        self.assertNotIn('Sort', plan)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, _, self.membership = make_family('owner')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Food')
+        # More rows than days in the month, so dates repeat and ids break ties.
+        make_transactions(self.membership, self.category, 40)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ledger(self):
+        return list(Transaction.objects.order_by('date', 'id').values_list('id', flat=True))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        return ids
+
+    def test_next_and_previous_links_walk_the_ledger(self):
+        self.assertEqual(self.walk('/api/transactions/?page_size=7'), self.ledger())
+
+        first = self.client.get('/api/transactions/?page_size=7').json()
+        self.assertNotIn('count', first)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+        self.assertEqual(back['next'], first['next'])
+
+    def test_pages_stay_stable_across_inserts(self):
+        expected = self.ledger()
+        first = self.client.get('/api/transactions/?page_size=10').json()
+        # Rows landing before the cursor would shift an offset-based page.
+        make_transactions(self.membership, self.category, 5, start=date(2023, 1, 1))
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['id'] for row in second['results']], expected[10:20])
+
+        Transaction.objects.filter(pk=expected[0]).delete()
+        third = self.client.get(second['next']).json()
+        self.assertEqual([row['id'] for row in third['results']], expected[20:30])
+
+    def test_page_size_is_capped(self):
+        make_transactions(self.membership, self.category, 470)
+        response = self.client.get('/api/transactions/?page_size=100000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 500)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_malformed_or_tampered_cursors_are_rejected(self):
+        def cursor(querystring):
+            return b64encode(querystring.encode()).decode()
+
+        cursors = [
+            'not a cursor',
+            'Zm9v',
+            cursor('r=1'),
+            cursor('p=2024-01-01'),
+            cursor('p=2024-13-01&p=1'),
+            cursor('p=2024-01-01&p=one'),
+            cursor('p=2024-01-01&p=99999999999999999999999'),
+            cursor('p=2024-01-01&p=1&r=x'),
+        ]
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        for value in cursors:
+            for path in ('/api/transactions/', '/api/async/transactions/'):
+                response = self.client.get(path, {'cursor': value}, headers=headers)
+                self.assertEqual(response.status_code, 400, (path, value))
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'}, (path, value))
+
+    def test_page_numbers_on_request(self):
+        for query in ('page=2', 'pagination=page&page=2', 'ordering=date&page=2'):
+            response = self.client.get(f'/api/transactions/?{query}')
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(response.data['count'], 40, query)
+            self.assertIn('page=3', response.data['next'], query)
+            self.assertIn('/api/transactions/', response.data['previous'], query)
+        ids = [row['id'] for row in self.client.get('/api/transactions/?page=2').data['results']]
+        self.assertEqual(ids, self.ledger()[10:20])
+        response = self.client.get('/api/transactions/?ordering=-amount')
+        self.assertEqual(response.data['count'], 40)
+
+
+class MembershipCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.owner, self.family, self.owner_membership = make_family('owner')
+        self.member = User.objects.create_user('member', 'member@example.com', 'password')
+        self.membership = FamilyMembership.objects.create(user=self.member, family=self.family)
+        self.owner_client = APIClient()
+        self.owner_client.force_authenticate(self.owner)
+        self.member_client = APIClient()
+        self.member_client.force_authenticate(self.member)
+        # Prime the cache for both users.
+        self.owner_client.get('/api/family/me/')
+        self.member_client.get('/api/family/me/')
+
+    def family_me(self, client):
+        return client.get('/api/family/me/')
+
+    def test_cached_membership_needs_no_queries(self):
+        with self.assertNumQueries(0):
+            response = self.family_me(self.owner_client)
+        self.assertEqual(response.data['role'], 'owner')
+
+    def test_create_family_invalidates(self):
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(outsider)
+        self.assertEqual(self.family_me(client).status_code, 404)
+        client.post('/api/family/create/', {'name': 'New'}, format='json')
+        self.assertEqual(self.family_me(client).data['name'], 'New')
+
+    def test_join_invalidates(self):
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(outsider)
+        self.assertEqual(self.family_me(client).status_code, 404)
+        code = self.owner_client.post('/api/invite/').data['code']
+        client.post('/api/join/', {'code': code}, format='json')
+        self.assertEqual(self.family_me(client).data['id'], self.family.pk)
+
+    def test_leave_invalidates(self):
+        self.member_client.post('/api/family/leave/')
+        self.assertEqual(self.family_me(self.member_client).status_code, 404)
+
+    def test_remove_invalidates(self):
+        self.owner_client.post('/api/family/members/remove/', {'user_id': self.membership.pk}, format='json')
+        self.assertEqual(self.family_me(self.member_client).status_code, 404)
+
+    def test_change_role_invalidates(self):
+        self.owner_client.post(
+            '/api/family/members/change-role/',
+            {'user_id': self.membership.pk, 'new_role': 'owner'},
+            format='json',
+        )
+        self.assertEqual(self.family_me(self.member_client).data['role'], 'owner')
+        self.assertEqual(self.family_me(self.owner_client).data['role'], 'member')
+
+    def test_assign_head_invalidates(self):
+        self.owner_client.post('/api/family/assign-head/', {'user_id': self.member.pk}, format='json')
+        self.assertEqual(self.family_me(self.member_client).data['role'], 'owner')
+        self.assertEqual(self.family_me(self.owner_client).data['role'], 'member')
+
+    def test_rename_family_invalidates(self):
+        self.owner_client.patch('/api/family/me/', {'name': 'Renamed'}, format='json')
+        self.assertEqual(self.family_me(self.member_client).data['name'], 'Renamed')
+
+    def test_delete_family_invalidates(self):
+        self.owner_client.delete('/api/family/delete/')
+        self.assertEqual(self.family_me(self.owner_client).status_code, 404)
+        self.assertEqual(self.family_me(self.member_client).status_code, 404)
+
+    def test_delete_member_user_invalidates(self):
+        self.member_client.delete('/api/me/')
+        members = self.owner_client.get('/api/family/members/').data
+        self.assertEqual([member['username'] for member in members], ['owner'])
+
+    def test_owner_rename_invalidates(self):
+        self.owner_client.patch('/api/me/', {'username': 'boss'}, format='json')
+        self.assertEqual(self.family_me(self.member_client).data['created_by'], 'boss')
+
+
+class BulkTransactionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.member = User.objects.create_user('member', 'member@example.com', 'password')
+        member_membership = FamilyMembership.objects.create(user=self.member, family=self.family)
+        self.category = BudgetCategory.objects.create(user=self.user, name='Food')
+        self.own = [
+            Transaction.objects.create(
+                amount=Decimal('10.00'), date=date(2024, 3, 1 + index), category=self.category,
+                member=self.membership, user=self.user,
+            )
+            for index in range(3)
+        ]
+        self.foreign = [
+            Transaction.objects.create(
+                amount=Decimal('5.00'), date=date(2024, 3, 1), category=self.category,
+                member=member_membership, user=self.member,
+            )
+            for _ in range(2)
+        ]
+        other_user, _, _ = make_family('other', 'Other')
+        self.other_category = BudgetCategory.objects.create(user=other_user, name='Rent')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, **payload):
+        return self.client.post('/api/transactions/bulk/', payload, format='json')
+
+    def item(self, **fields):
+        return {'amount': '1.00', 'date': '2024-03-10', 'category': self.category.pk, **fields}
+
+    def statuses(self, response, section):
+        return [entry['status'] for entry in response.data[section]]
+
+    def test_per_item_results(self):
+        response = self.bulk(
+            create=[self.item(), self.item(amount='x'), self.item(category=self.other_category.pk)],
+            update=[
+                {'id': self.own[0].pk, 'amount': '20.00'},
+                {'id': self.foreign[0].pk, 'amount': '1.00'},
+                {'id': 10 ** 6, 'amount': '1.00'},
+            ],
+            delete=[self.own[1].pk, self.foreign[1].pk, 10 ** 6 + 1],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response, 'create'), [201, 400, 400])
+        self.assertEqual(self.statuses(response, 'update'), [200, 403, 404])
+        self.assertEqual(self.statuses(response, 'delete'), [204, 403, 404])
+        self.assertIn('category', response.data['create'][2]['errors'])
+
+        self.assertEqual(Transaction.objects.get(pk=self.own[0].pk).amount, Decimal('20.00'))
+        self.assertFalse(Transaction.objects.filter(pk=self.own[1].pk).exists())
+        self.assertEqual(Transaction.objects.get(pk=self.foreign[0].pk).amount, Decimal('5.00'))
+        self.assertEqual(Transaction.objects.filter(family=self.family).count(), 5)
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_all_or_nothing_writes_nothing_on_failure(self):
+        response = self.bulk(
+            create=[self.item()], update=[{'id': self.foreign[0].pk, 'amount': '1.00'}], all_or_nothing=True,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.objects.filter(family=self.family).count(), 5)
+
+    def test_repeated_ids_are_rejected(self):
+        first, second, third = self.own
+        response = self.bulk(
+            update=[
+                {'id': first.pk, 'amount': '20.00'},
+                {'id': first.pk, 'amount': '30.00'},
+                {'id': third.pk, 'amount': '40.00'},
+            ],
+            delete=[second.pk, second.pk, third.pk],
+        )
+        self.assertEqual(self.statuses(response, 'update'), [400, 400, 400])
+        self.assertEqual(self.statuses(response, 'delete'), [400, 400, 400])
+        self.assertEqual(
+            sorted(Transaction.objects.filter(user=self.user).values_list('amount', flat=True)),
+            [Decimal('10.00')] * 3,
+        )
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_rollups_follow_a_mixed_batch(self):
+        response = self.bulk(
+            create=[self.item(amount='7.50', type='income'), self.item(date='2024-04-02')],
+            update=[{'id': self.own[0].pk, 'amount': '12.00', 'date': '2024-05-01'}],
+            delete=[self.own[2].pk],
+        )
+        self.assertFalse(any(entry['status'] >= 400 for section in response.data.values() for entry in section))
+        self.assertEqual(rollups.find_drift(), [])
+
+
+class TransactionExportTests(TestCase):
+
+    def setUp(self):
+        self.user, self.family, self.membership = make_family('owner')
+        self.food = BudgetCategory.objects.create(user=self.user, name='Еда')
+        self.groceries = BudgetCategory.objects.create(user=self.user, name='Groceries', parent=self.food)
+        self.rent = BudgetCategory.objects.create(user=self.user, name='Rent')
+        rows = [
+            ('12.50', date(2024, 1, 5), self.groceries, Transaction.EXPENSE, 'Молоко, хлеб и "сыр"\nв магазине'),
+            ('3000', date(2024, 1, 1), self.rent, Transaction.EXPENSE, ''),
+            ('5000.00', date(2024, 2, 1), self.food, Transaction.INCOME, 'Refund'),
+            ('7.25', date(2024, 3, 1), self.food, Transaction.EXPENSE, 'Coffee'),
+        ]
+        self.transactions = [
+            Transaction.objects.create(
+                amount=Decimal(amount), date=day, category=category, member=self.membership,
+                user=self.user, type=type, description=description,
+            )
+            for amount, day, category, type, description in rows
+        ]
+        other_user, _, other_membership = make_family('other', 'Other')
+        make_transactions(other_membership, BudgetCategory.objects.create(user=other_user, name='Other'), 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        return self.client.get('/api/transactions/export/', params)
+
+    def csv_rows(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.DictReader(StringIO(content, newline='')))
+
+    def ndjson_rows(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def ids(self, *transactions):
+        return [transaction.pk for transaction in transactions]
+
+    def test_csv_streams_the_family_ledger(self):
+        response = self.export(format='csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.csv"')
+
+        rows = self.csv_rows(response)
+        self.assertEqual(list(rows[0]), list(export.HEADER))
+        milk, rent, refund, coffee = self.transactions
+        self.assertEqual([int(row['id']) for row in rows], self.ids(rent, milk, refund, coffee))
+        self.assertEqual(rows[1], {
+            'id': str(milk.pk), 'date': '2024-01-05', 'type': 'expense', 'amount': '12.50', 'currency': '',
+            'category': str(self.groceries.pk), 'category_name': 'Groceries',
+            'description': 'Молоко, хлеб и "сыр"\nв магазине', 'member': str(self.membership.pk),
+            'user': str(self.user.pk), 'user_name': 'owner',
+        })
+        self.assertEqual(rows[0]['amount'], '3000.00')
+        self.assertEqual(rows[0]['description'], '')
+
+    def test_ndjson_has_one_object_per_transaction(self):
+        response = self.export(format='ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.ndjson"')
+
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.endswith('\n'))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1], {
+            'id': self.transactions[0].pk, 'date': '2024-01-05', 'type': 'expense', 'amount': '12.50',
+            'currency': '', 'category': self.groceries.pk, 'category_name': 'Groceries',
+            'description': 'Молоко, хлеб и "сыр"\nв магазине', 'member': self.membership.pk,
+            'user': self.user.pk, 'user_name': 'owner',
+        })
+        csv_ids = [int(row['id']) for row in self.csv_rows(self.export(format='csv'))]
+        self.assertEqual([row['id'] for row in rows], csv_ids)
+
+    def test_filters(self):
+        milk, rent, refund, coffee = self.transactions
+        cases = [
+            ({'date_from': '2024-01-05'}, [milk, refund, coffee]),
+            ({'date_to': '2024-01-31'}, [rent, milk]),
+            ({'date_from': '2024-01-02', 'date_to': '2024-02-01'}, [milk, refund]),
+            ({'type': 'income'}, [refund]),
+            # A category covers its subcategories.
+            ({'category': self.food.pk}, [milk, refund, coffee]),
+            ({'category': self.groceries.pk}, [milk]),
+            ({'category': self.food.pk, 'type': 'expense', 'date_to': '2024-02-29'}, [milk]),
+            ({'date_from': '2025-01-01'}, []),
+        ]
+        for params, expected in cases:
+            for format, read in (('csv', self.csv_rows), ('ndjson', self.ndjson_rows)):
+                response = self.export(format=format, **params)
+                self.assertEqual(response.status_code, 200, params)
+                self.assertEqual([int(row['id']) for row in read(response)], self.ids(*expected), (format, params))
+
+        other_category = BudgetCategory.objects.get(name='Other')
+        self.assertEqual(self.csv_rows(self.export(format='csv', category=other_category.pk)), [])
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({'date_from': '2024-13-01'}, {'type': 'transfer'}, {'category': 'food'}):
+            response = self.export(format='csv', **params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertNotIsInstance(response, StreamingHttpResponse)
+            self.assertIn(next(iter(params)), json.loads(response.content))
+
+    def test_large_exports_are_written_in_chunks(self):
+        make_transactions(self.membership, self.rent, 9)
+        for format in ('csv', 'ndjson'):
+            whole = list(self.export(format=format).streaming_content)
+            with mock.patch.object(export, 'CHUNK_ROWS', 4):
+                chunks = list(self.export(format=format).streaming_content)
+            # 13 rows in chunks of 4.
+            self.assertEqual(len(whole), 1, format)
+            self.assertEqual(len(chunks), 4, format)
+            self.assertEqual(b''.join(chunks), whole[0], format)
+
+    def test_requires_a_family(self):
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(outsider)
+        response = client.get('/api/transactions/export/', {'format': 'csv'})
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+
+
+class StatementImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.food = BudgetCategory.objects.create(user=self.user, name='Food')
+
+    def run_import(self, text, **options):
+        importer = TransactionImporter(self.membership, self.user, **options)
+        return importer.run(StringIO(text))
+
+    def test_rows_are_typed_by_sign_and_filed_under_categories(self):
+        report = self.run_import(
+            'date,amount,description,category\n'
+            '2024-03-01,-10.50,Market,food\n'
+            '2024-03-02,1 500,Salary,Work\n'
+            '2024-03-03,"-2,25",Fee,\n'
+        )
+        self.assertEqual((report.rows, report.inserted, report.rejected), (3, 3, 0))
+        self.assertEqual(report.categories_created, 2)
+        rows = {
+            obj.description: obj
+            for obj in Transaction.objects.select_related('category').filter(family=self.family)
+        }
+        self.assertEqual((rows['Market'].type, rows['Market'].amount), (Transaction.EXPENSE, Decimal('10.50')))
+        self.assertEqual(rows['Market'].category_id, self.food.pk)
+        self.assertEqual((rows['Salary'].type, rows['Salary'].amount), (Transaction.INCOME, Decimal('1500.00')))
+        self.assertEqual(rows['Salary'].category.name, 'Work')
+        self.assertEqual(rows['Fee'].category.name, 'Uncategorized')
+        # Created categories join the tree as roots.
+        self.assertTrue(CategoryClosure.objects.filter(ancestor=rows['Salary'].category, depth=0).exists())
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_reimport_skips_known_rows_but_keeps_repeats_within_a_file(self):
+        statement = (
+            'date,amount,description,category\n'
+            '2024-03-01,-3.00,Coffee,Food\n'
+            '2024-03-01,-3.00,Coffee,Food\n'
+        )
+        first = self.run_import(statement)
+        self.assertEqual((first.inserted, first.duplicates), (2, 0))
+        second = self.run_import(statement + '2024-03-01,-3.00,Coffee,Food\n')
+        self.assertEqual((second.inserted, second.duplicates), (1, 2))
+        self.assertEqual(Transaction.objects.filter(family=self.family).count(), 3)
+
+    def test_bad_rows_are_rejected_with_their_line(self):
+        report = self.run_import(
+            'date,amount,type,currency\n'
+            '2024-03-01,abc,,\n'
+            '2024-03-01,NaN,,\n'
+            '2024-03-01,-Infinity,,\n'
+            '2024-13-01,1.00,,\n'
+            '2024-03-01,1.00,gift,\n'
+            '2024-03-01,1.00,,euro\n'
+            '2024-03-01,123456789.00,,\n'
+            '2024-03-01,1.00,расход,usd\n',
+            batch_size=2,
+        )
+        self.assertEqual((report.rows, report.inserted, report.rejected), (8, 1, 7))
+        self.assertEqual([reject['line'] for reject in report.rejects], [2, 3, 4, 5, 6, 7, 8])
+        self.assertIn("Invalid amount 'NaN'", report.rejects[1]['error'])
+        self.assertEqual(
+            Transaction.objects.values_list('type', 'currency').get(), (Transaction.EXPENSE, 'USD'),
+        )
+
+    def test_missing_required_column_fails_the_import(self):
+        with self.assertRaisesMessage(RowError, 'amount'):
+            self.run_import('date,sum\n2024-03-01,1.00\n')
+
+    def test_endpoint_reports_the_import(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile(
+            'statement.csv', 'Дата;Сумма\n01.03.2024;-7,00\n01.03.2024;NaN\n'.encode(), content_type='text/csv',
+        )
+        response = client.post('/api/transactions/import/', {
+            'file': upload, 'delimiter': ';', 'date_format': '%d.%m.%Y',
+            'columns': json.dumps({'date': 'Дата', 'amount': 'Сумма'}),
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['inserted'], response.data['rejected']), (1, 1))
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as handle:
+            handle.write('when,sum,what\n03/01/2024,-4.00,Bread\n2024-03-02,-1.00,Milk\nbad,1,x\n')
+        self.addCleanup(os.remove, handle.name)
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_transactions', handle.name, '--user', 'owner',
+            '--column', 'date=when', '--column', 'amount=sum', '--column', 'description=what',
+            '--date-format', '%m/%d/%Y', '--date-format', '%Y-%m-%d',
+            stdout=out, stderr=err,
+        )
+        self.assertIn('2 inserted, 0 duplicates, 1 rejected', out.getvalue())
+        self.assertIn("line 4: Invalid date 'bad'", err.getvalue())
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('description', flat=True)), ['Bread', 'Milk'],
+        )
+        with self.assertRaisesMessage(CommandError, 'does not exist'):
+            call_command('import_transactions', handle.name, '--user', 'nobody')
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL COPY')
+    def test_copy_keeps_blank_text_columns_empty(self):
+        report = self.run_import(
+            'date,amount,description,currency,category\n'
+            '2024-03-01,-10.00,,,Food\n'
+            '2024-03-02,-5.00,"",EUR,Food\n'
+        )
+        self.assertEqual((report.inserted, report.rejected), (2, 0))
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('description', 'currency')), [('', ''), ('', 'EUR')],
+        )
+
+
+class FullTextSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Transport')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, description, amount='10.00'):
+        return Transaction.objects.create(
+            amount=Decimal(amount), date=date(2024, 3, 1), category=self.category,
+            member=self.membership, user=self.user, description=description,
+        )
+
+    def search(self, text, path='/api/transactions/'):
+        return self.client.get(path, {'search': text}).data
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite triggers')
+    def test_migrations_leave_every_sqlite_trigger_in_place(self):
+        # The test database is built by the whole migration chain, including
+        # those that make SQLite rebuild the indexed tables.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = {name for name, in cursor.fetchall()}
+        for table in ('budget_transaction', 'budget_budgetcategory'):
+            for suffix in ('ai', 'ad', 'au'):
+                self.assertIn(f'{table}_fts_{suffix}', triggers)
+
+    def test_search_finds_rows_written_after_migrating(self):
+        taxi = self.add('Taxi home')
+        self.add('Groceries')
+        data = self.search('taxi')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], taxi.pk)
+
+    def ids(self, data):
+        return [row['id'] for row in data['results']]
+
+    def test_every_word_must_match_and_the_last_one_as_a_prefix(self):
+        airport = self.add('Taxi to the airport')
+        home = self.add('Taxi home')
+        self.add('Bus to the airport')
+        self.assertEqual(set(self.ids(self.search('tax'))), {airport.pk, home.pk})
+        self.assertEqual(self.ids(self.search('taxi airp')), [airport.pk])
+        self.assertEqual(self.search('train')['count'], 0)
+
+    def test_cyrillic_and_case_insensitive(self):
+        taxi = self.add('Такси до дома')
+        self.assertEqual(self.ids(self.search('ТАКСИ')), [taxi.pk])
+        self.assertEqual(self.ids(self.search('дом')), [taxi.pk])
+
+    def test_results_are_ranked_unless_ordering_is_given(self):
+        weak = self.add('Taxi after a long flight back from the conference in another city', amount='1.00')
+        strong = self.add('Taxi, taxi', amount='2.00')
+        self.assertEqual(self.ids(self.search('taxi')), [strong.pk, weak.pk])
+        ordered = self.client.get('/api/transactions/', {'search': 'taxi', 'ordering': 'amount'}).data
+        self.assertEqual(self.ids(ordered), [weak.pk, strong.pk])
+
+    def test_search_syntax_in_input_is_taken_literally(self):
+        taxi = self.add('Taxi home')
+        for text in ('"taxi', 'taxi*', 'taxi OR bus', 'NEAR(taxi home)', "taxi'"):
+            response = self.client.get('/api/transactions/', {'search': text})
+            self.assertEqual(response.status_code, 200, text)
+        self.assertEqual(self.ids(self.search('"taxi')), [taxi.pk])
+        self.assertEqual(self.search('taxi OR bus')['count'], 0)
+
+    def test_search_sees_updates_and_deletes(self):
+        taxi = self.add('Taxi home')
+        taxi.description = 'Bus home'
+        taxi.save()
+        self.assertEqual(self.search('taxi')['count'], 0)
+        self.assertEqual(self.ids(self.search('bus')), [taxi.pk])
+        taxi.delete()
+        self.assertEqual(self.search('bus')['count'], 0)
+
+    def test_categories_match_name_and_description(self):
+        BudgetCategory.objects.create(user=self.user, name='Food', description='Groceries and restaurants')
+        names = [row['name'] for row in self.client.get('/api/categories/', {'search': 'restaur'}).data['results']]
+        self.assertEqual(names, ['Food'])
+        names = [row['name'] for row in self.client.get('/api/categories/', {'search': 'transp'}).data['results']]
+        self.assertEqual(names, ['Transport'])
+
+
+
+class LeanTransactionListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        category = BudgetCategory.objects.create(user=self.user, name='Продукты «к ужину»')
+        amounts = ['0.10', '12.5', '99999999.99', '7']
+        for index, amount in enumerate(amounts):
+            Transaction.objects.create(
+                amount=Decimal(amount), date=date(2024, 3, index + 1), category=category,
+                member=self.membership, user=self.user, description=f'строка "{index}"\\n',
+                type=Transaction.INCOME if index % 2 else Transaction.EXPENSE,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_content(self, response, queryset):
+        data = {
+            'next': response.data['next'],
+            'previous': response.data['previous'],
+            'results': TransactionSerializer(queryset, many=True).data,
+        }
+        if 'count' in response.data:
+            data = {'count': response.data['count'], **data}
+        return JSONRenderer().render(data)
+
+    def test_cursor_page_matches_transaction_serializer(self):
+        response = self.client.get('/api/transactions/?page_size=3')
+        queryset = Transaction.objects.order_by('date', 'id')[:3]
+        self.assertEqual(response.content, self.expected_content(response, queryset))
+
+    def test_page_number_page_matches_transaction_serializer(self):
+        response = self.client.get('/api/transactions/?page=1')
+        queryset = Transaction.objects.order_by('date', 'id')
+        self.assertEqual(response.content, self.expected_content(response, queryset))
+
+    def test_list_is_one_query(self):
+        self.client.get('/api/family/me/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/transactions/?page_size=100')
+
+
+class ConditionalGetTests(TestCase):
+
+    PATHS = (
+        '/api/family/me/',
+        '/api/family/members/',
+        '/api/categories/',
+        '/api/categories/tree/',
+        '/api/transactions/?page_size=3',
+        '/api/transactions/summary/?from=2024-01',
+        '/api/transactions/balance/',
+        '/api/transactions/balance-series/?from=2024-01-01&to=2024-01-31',
+    )
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.owner, self.family, self.owner_membership = make_family('owner')
+        self.member = User.objects.create_user('member', 'member@example.com', 'password')
+        self.membership = FamilyMembership.objects.create(user=self.member, family=self.family)
+        self.category = BudgetCategory.objects.create(user=self.owner, name='Food')
+        make_transactions(self.owner_membership, self.category, 5)
+        rollups.rebuild()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.member_client = APIClient()
+        self.member_client.force_authenticate(self.member)
+
+    def test_matching_etag_answers_304_before_the_handler(self):
+        for path in self.PATHS:
+            etag = self.client.get(path)['ETag']
+            caches['responses'].clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, path)
+            self.assertEqual(response['ETag'], etag, path)
+            self.assertEqual(response.content, b'', path)
+            self.assertEqual(len(queries), 0, (path, [query['sql'] for query in queries]))
+
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=f'"stale", {etag}').status_code, 304, path)
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH='*').status_code, 304, path)
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH='"stale"').status_code, 200, path)
+
+    def test_write_changes_the_etag(self):
+        path = '/api/transactions/summary/?from=2024-01'
+        etag = self.client.get(path)['ETag']
+        self.client.post('/api/transactions/', {
+            'amount': '1.00', 'date': '2024-01-02', 'category': self.category.id,
+            'member': self.owner_membership.id, 'type': 'expense',
+        })
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['expense'], '61.00')
+
+        etag = response['ETag']
+        self.client.patch(f'/api/categories/{self.category.pk}/', {'name': 'Groceries'})
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_user_role_and_query(self):
+        path = '/api/family/me/'
+        owner_etag = self.client.get(path)['ETag']
+        member = self.member_client.get(path, HTTP_IF_NONE_MATCH=owner_etag)
+        self.assertEqual(member.status_code, 200)
+        self.assertEqual(member.data['role'], 'member')
+        self.assertNotEqual(member['ETag'], owner_etag)
+        self.assertNotEqual(self.client.get(f'{path}?format=json')['ETag'], owner_etag)
+
+        # The same user and family version, only the role differs.
+        request = RequestFactory().get(path)
+        request.user = self.member
+        version = versioning.family_version(self.family.pk)
+        as_member = versioning.family_etag(request, self.membership, version)
+        self.membership.role = 'owner'
+        self.assertNotEqual(versioning.family_etag(request, self.membership, version), as_member)
+
+    def test_default_dates_move_with_the_day(self):
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+
+        tomorrow = Tomorrow.today().isoformat()
+        week_ago = (date.today() - timedelta(days=7)).isoformat()
+        for path, field in (
+            ('/api/transactions/balance/', 'date'),
+            (f'/api/transactions/balance-series/?from={week_ago}&interval=week', 'to'),
+        ):
+            response = self.client.get(path)
+            with mock.patch.object(views, 'date', Tomorrow):
+                later = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(later.status_code, 200, path)
+                self.assertEqual(later.data[field], tomorrow, path)
+                # An explicit date answers the same on any day.
+                separator = '&' if '?' in path else '?'
+                pinned = f'{path}{separator}{field}={date.today().isoformat()}'
+                etag = self.client.get(pinned)['ETag']
+            self.assertEqual(self.client.get(pinned, HTTP_IF_NONE_MATCH=etag).status_code, 304, path)
+
+    def test_no_etag_without_a_family(self):
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(outsider)
+        response = client.get('/api/family/me/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Food')
+        make_transactions(self.membership, self.category, 5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.other_user, _, other_membership = make_family('other', 'Other')
+        make_transactions(other_membership, BudgetCategory.objects.create(user=self.other_user, name='Rent'), 3)
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other_user)
+
+    def test_repeat_read_is_served_without_queries(self):
+        first = self.client.get('/api/transactions/?page_size=10')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/transactions/?page_size=10')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_write_invalidates_only_that_family(self):
+        self.client.get('/api/transactions/')
+        self.other_client.get('/api/transactions/')
+        self.client.post('/api/transactions/', {
+            'amount': '1.00', 'date': '2024-02-01', 'category': self.category.id,
+            'member': self.membership.id, 'type': 'expense',
+        })
+        response = self.client.get('/api/transactions/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(self.other_client.get('/api/transactions/')['X-Cache'], 'HIT')
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/api/transactions/?page_size=2')
+        response = self.client.get('/api/transactions/?page_size=3')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class BenchmarkToolTests(TestCase):
+
+    def ledger(self, prefix):
+        return list(
+            Transaction.objects.filter(user__username__startswith=f'{prefix}-')
+            .order_by('id').values_list('amount', 'date', 'type', 'description', 'category__name')
+        )
+
+    def test_seed_is_deterministic_and_skewed(self):
+        first = seed(5, 3, 400, skew=1.5, seed_value=3, prefix='a')
+        seed(5, 3, 400, skew=1.5, seed_value=3, prefix='b')
+        self.assertEqual(self.ledger('a'), self.ledger('b'))
+
+        sizes = [Transaction.objects.filter(family_id=family_id).count() for family_id in first]
+        self.assertEqual(sum(sizes), 400)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertEqual(rollups.find_drift(first), [])
+
+    def test_bench_api_drives_every_route(self):
+        cache.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_api', requests=1, warmup=0, rows=50, output=output, stdout=StringIO())
+            with open(output) as report_file:
+                report = json.load(report_file)
+        failed = {name: route['statuses'] for name, route in report['routes'].items() if route['errors']}
+        self.assertEqual(failed, {})
+        self.assertIn('transactions-list', report['routes'])
+        self.assertEqual(report['meta']['transactions'], 50)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every endpoint runs against a small and a large family with cold caches.
+    Query counts must not change with the data size and must stay within the
+    view's ``query_budget``.
+    """
+
+    SIZES = ((2, 2, 3), (6, 8, 40))  # members, categories, transactions
+
+    def build_family(self, members, categories, transactions, name):
+        user, _, membership = make_family(name)
+        extra = [User.objects.create(username=f'{name}-member-{index}') for index in range(members - 1)]
+        FamilyMembership.objects.bulk_create(
+            [FamilyMembership(user=member, family=membership.family) for member in extra]
+        )
+        created = BudgetCategory.objects.bulk_create(
+            [BudgetCategory(user=user, name=f'Category {index}') for index in range(categories)]
+        )
+        for index in range(transactions):
+            make_transactions(membership, created[index % categories], 1)
+        Transaction.objects.filter(family=membership.family).update(description='Такси до дома')
+        return membership
+
+    def budget_for(self, scenario, request):
+        match = resolve(request['path'].split('?')[0])
+        view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+        if view_class is None or view_class.__module__ != views.__name__:
+            return None, None
+        actions = getattr(match.func, 'actions', None)
+        key = actions[scenario.method] if actions else scenario.method
+        return f'{view_class.__name__}.{key}', getattr(view_class, 'query_budget', {}).get(key)
+
+    def measure(self, membership):
+        ctx = Context(membership)
+        client = Client()
+        measured = {}
+        for scenario in SCENARIOS:
+            request = ctx.prepare(scenario, 0)
+            cache.clear()
+            caches['responses'].clear()
+            # Reload the denylist now so a periodic reload never lands in a measurement.
+            revocation.denylist.refresh(force=True)
+            with CaptureQueriesContext(connection) as captured:
+                response = send(client, ctx, scenario, request)
+            self.assertEqual(response.status_code, scenario.expect, scenario.name)
+            measured[scenario.name] = (self.budget_for(scenario, request), [query['sql'] for query in captured])
+        return measured
+
+    def test_query_counts_are_flat_and_within_budget(self):
+        # A throwaway pass first, so per-process memoization (e.g. the search
+        # backend probe) is not billed to the first endpoint measured.
+        self.measure(self.build_family(*self.SIZES[0], name='warmup'))
+        small, large = [
+            self.measure(self.build_family(*size, name=f'size{index}'))
+            for index, size in enumerate(self.SIZES)
+        ]
+        problems = []
+        for name, ((view, budget), queries) in large.items():
+            grown = small[name][1]
+            if view and budget is None:
+                problems.append(f'{name}: {view} declares no query budget')
+            if len(queries) != len(grown):
+                problems.append(f'{name}: {len(grown)} queries for the small family, {len(queries)} for the large')
+            elif budget is not None and len(queries) > budget:
+                problems.append(f'{name}: {len(queries)} queries, budget {budget} ({view})')
+            else:
+                continue
+            problems.extend(f'    {sql}' for sql in queries)
+        self.assertFalse(problems, '\n' + '\n'.join(problems))
+
+
+class AsyncReadEndpointTests(TestCase):
+
+    PATHS = (
+        'family/me/',
+        'family/members/',
+        'categories/',
+        'transactions/?page_size=7',
+        'transactions/summary/?from=2024-01',
+        'transactions/?search=купить',
+        'transactions/?page=2',
+    )
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, _, membership = make_family('owner')
+        category = BudgetCategory.objects.create(user=self.user, name='Food')
+        make_transactions(membership, category, 25)
+        rollups.rebuild()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def test_responses_match_the_sync_endpoints(self):
+        client = AsyncClient()
+        for path in self.PATHS:
+            expected = await client.get(f'/api/{path}', headers=self.headers)
+            response = await client.get(f'/api/async/{path}', headers=self.headers)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response.content, expected.content.replace(b'/api/', b'/api/async/'), path)
+
+    async def test_cursor_pages_follow_next_links(self):
+        client = AsyncClient()
+        seen, url = [], '/api/async/transactions/?page_size=10'
+        while url:
+            data = (await client.get(url, headers=self.headers)).json()
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), 25)
+
+    async def test_unchanged_family_answers_304(self):
+        client = AsyncClient()
+        response = await client.get('/api/async/family/me/', headers=self.headers)
+        cached = await client.get(
+            '/api/async/family/me/', headers={**self.headers, 'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    async def test_requires_a_valid_token(self):
+        client = AsyncClient()
+        self.assertEqual((await client.get('/api/async/family/me/')).status_code, 401)
+        response = await client.get('/api/async/family/me/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+        self.assertEqual((await client.post('/api/async/family/me/', headers=self.headers)).status_code, 405)
+
+
+class StatelessTokenTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.owner, self.family, self.membership = make_family('owner')
+        self.member_user = User.objects.create_user('member', 'member@example.com', 'password')
+        self.member = FamilyMembership.objects.create(user=self.member_user, family=self.family, role='member')
+        make_transactions(self.member, BudgetCategory.objects.create(user=self.owner, name='Food'), 5)
+        self.client = APIClient()
+
+    def login(self, username):
+        response = self.client.post('/api/token/', {'username': username, 'password': 'password'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_tokens_carry_family_claims(self):
+        token = AccessToken(self.login('member')['access'])
+        self.assertEqual(token['family_id'], self.family.pk)
+        self.assertEqual(token['membership_id'], self.member.pk)
+        self.assertEqual(token['role'], 'member')
+
+    def test_ledger_reads_need_no_user_or_membership_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login("member")["access"]}')
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/transactions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        sql = ' '.join(query['sql'] for query in captured)
+        self.assertNotIn('FROM "auth_user"', sql)
+        self.assertNotIn('FROM "budget_familymembership"', sql)
+
+    def test_claims_of_a_removed_member_are_not_trusted(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login("member")["access"]}')
+        self.member.delete()
+        response = self.client.get('/api/transactions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_leaving_reissues_tokens_without_the_family(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login("member")["access"]}')
+        response = self.client.post('/api/family/leave/')
+        self.assertEqual(response.status_code, 200)
+        token = AccessToken(response.data['access'])
+        self.assertIsNone(token['family_id'])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get('/api/family/me/').status_code, 404)
+
+    def test_refresh_picks_up_role_changes(self):
+        refresh = self.login('member')['refresh']
+        self.member.role = 'owner'
+        self.member.save()
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'owner')
+
+
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner, self.family, self.membership = make_family('owner')
+        self.member_user = User.objects.create_user('member', 'member@example.com', 'password')
+        self.member = FamilyMembership.objects.create(user=self.member_user, family=self.family, role='member')
+        revocation.denylist.refresh(force=True)
+
+    def login(self, username, password='password'):
+        client = APIClient()
+        tokens = client.post('/api/token/', {'username': username, 'password': password}, format='json').data
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        return client, tokens
+
+    def assertRevoked(self, response):
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'token_revoked')
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        client, tokens = self.login('member')
+        self.assertEqual(client.post('/api/logout/', {'refresh': tokens['refresh']}, format='json').status_code, 200)
+        self.assertRevoked(client.get('/api/family/me/'))
+        self.assertRevoked(APIClient().post('/api/token/refresh/', {'refresh': tokens['refresh']}, format='json'))
+
+    def test_password_change_and_removal_revoke_earlier_tokens(self):
+        member, _ = self.login('member')
+        owner, _ = self.login('owner')
+        self.owner.set_password('changed')
+        self.owner.save()
+        self.assertRevoked(owner.get('/api/family/me/'))
+        owner, _ = self.login('owner', 'changed')
+        self.assertEqual(owner.post('/api/family/members/remove/', {'user_id': self.member.pk}).status_code, 200)
+        self.assertRevoked(member.get('/api/family/me/'))
+
+    def test_leaving_revokes_tokens_that_name_the_family(self):
+        client, _ = self.login('member')
+        response = client.post('/api/family/leave/')
+        self.assertEqual(response.status_code, 200)
+        # A process that never saw the leave: no membership markers in its
+        # cache, only what the database holds.
+        cache.clear()
+        revocation.denylist._replace((), {})
+        revocation.denylist.refresh(force=True)
+        self.assertRevoked(client.get('/api/transactions/'))
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(client.get('/api/family/me/').status_code, 404)
+
+    def test_demoted_owners_lose_their_owner_tokens(self):
+        owner, _ = self.login('owner')
+        response = owner.post('/api/family/assign-head/', {'user_id': self.member_user.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertRevoked(owner.get('/api/family/me/'))
+        owner.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(owner.get('/api/family/me/').data['role'], 'member')
+
+        # Handing ownership back demotes the caller.
+        member, _ = self.login('member')
+        response = member.post(
+            '/api/family/members/change-role/', {'user_id': self.membership.pk, 'new_role': 'owner'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertRevoked(member.get('/api/family/me/'))
+
+        # So does demoting a co-owner, for the co-owner.
+        self.member.refresh_from_db()
+        self.member.role = 'owner'
+        self.member.save()
+        member, _ = self.login('member')
+        owner, _ = self.login('owner')
+        response = owner.post(
+            '/api/family/members/change-role/', {'user_id': self.member.pk, 'new_role': 'member'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertRevoked(member.get('/api/family/me/'))
+
+    def test_check_stays_in_memory_until_another_process_revokes(self):
+        client, tokens = self.login('member')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(client.get('/api/family/me/').status_code, 200)
+        self.assertFalse([query for query in captured if 'tokenrevocation' in query['sql']])
+
+        # What another process's logout leaves behind: the row and a new version.
+        access = AccessToken(tokens['access'])
+        TokenRevocation.objects.create(jti=access['jti'], expires_at=timezone.now() + timedelta(minutes=5))
+        cache.set(revocation.VERSION_KEY, 'elsewhere', None)
+        self.assertEqual(client.get('/api/family/me/').status_code, 200)
+        revocation.denylist.refresh(force=True)
+        self.assertRevoked(client.get('/api/family/me/'))
+
+
+class CategoryBudgetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Food', monthly_limit=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def spend(self, amount, day=1):
+        return Transaction.objects.create(
+            amount=Decimal(amount), date=date(2024, 3, day), category=self.category,
+            member=self.membership, user=self.user, type=Transaction.EXPENSE,
+        )
+
+    def test_report_reads_counters_instead_of_transactions(self):
+        self.spend('30.00')
+        self.spend('40.50', day=2)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/categories/budgets/?month=2024-03')
+        self.assertFalse([query for query in captured if 'FROM "budget_transaction"' in query['sql']])
+        self.assertEqual(response.data['categories'], [{
+            'category': self.category.pk, 'name': 'Food', 'monthly_limit': '100.00',
+            'spent': '70.50', 'remaining': '29.50', 'percent': 70.5,
+        }])
+        self.assertEqual(self.client.get('/api/categories/budgets/?month=March').status_code, 400)
+
+    def test_alerts_are_raised_once_when_thresholds_are_crossed(self):
+        events = []
+        receiver = lambda sender, alerts, **kwargs: events.extend(  # noqa: E731
+            (alert.threshold, alert.spent) for alert in alerts
+        )
+        limits.threshold_crossed.connect(receiver)
+        self.addCleanup(limits.threshold_crossed.disconnect, receiver)
+
+        self.spend('70.00')
+        self.assertEqual(events, [])
+        self.spend('15.00')
+        self.assertEqual(events, [(80, Decimal('85.00'))])
+        refund = self.spend('20.00')
+        self.assertEqual(events[1:], [(100, Decimal('105.00'))])
+        refund.delete()
+        self.spend('20.00')
+        self.assertEqual(len(events), 2)
+
+        alerts = self.client.get('/api/categories/alerts/').data
+        self.assertEqual([alert['threshold'] for alert in alerts], [100, 80])
+        self.assertEqual(alerts[0]['category_name'], 'Food')
+
+
+class RecurringTransactionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Rent')
+
+    def template(self, membership=None, **fields):
+        membership = membership or self.membership
+        fields.setdefault('start_date', date(2024, 1, 31))
+        return RecurringTransaction.objects.create(
+            family_id=membership.family_id, member=membership, user_id=membership.user_id,
+            category=self.category, amount=Decimal('500.00'), next_date=fields['start_date'], **fields,
+        )
+
+    def test_schedule_keeps_the_anchor_day_and_stops_at_end_date(self):
+        monthly = self.template()
+        self.assertEqual(
+            recurring.due_dates(monthly, date(2024, 4, 30)),
+            ([date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)], date(2024, 5, 31)),
+        )
+        fortnightly = self.template(
+            frequency=RecurringTransaction.WEEKLY, interval=2, start_date=date(2024, 1, 1), end_date=date(2024, 2, 1),
+        )
+        fortnightly.next_date = date(2024, 1, 10)
+        self.assertEqual(
+            recurring.due_dates(fortnightly, date(2024, 12, 31)),
+            ([date(2024, 1, 15), date(2024, 1, 29)], None),
+        )
+
+    def test_materialize_is_idempotent(self):
+        template = self.template()
+        others = [make_family(f'other-{index}')[2] for index in range(3)]
+        for membership in others:
+            self.template(membership, frequency=RecurringTransaction.DAILY, start_date=date(2024, 3, 1))
+
+        report = recurring.materialize(until=date(2024, 3, 31), chunk_size=2)
+        self.assertEqual((report.families, report.chunks, report.inserted), (4, 2, 3 + 3 * 31))
+        self.assertEqual(recurring.materialize(until=date(2024, 3, 31)).inserted, 0)
+
+        # As if a run had died after writing rows but before moving next_date.
+        RecurringTransaction.objects.filter(pk=template.pk).update(next_date=date(2024, 1, 31))
+        report = recurring.materialize(until=date(2024, 4, 30))
+        self.assertEqual((report.inserted, report.duplicates), (1 + 3 * 30, 3))
+        self.assertEqual(Transaction.objects.filter(recurring=template).count(), 4)
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_command_and_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/recurring/', {
+            'amount': '45.00', 'category': self.category.pk, 'frequency': 'monthly', 'start_date': '2024-01-15',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['next_date'], '2024-01-15')
+
+        out = StringIO()
+        call_command('materialize_recurring', until='2024-02-29', stdout=out, stderr=StringIO())
+        self.assertIn('2 inserted', out.getvalue())
+        self.assertEqual(client.get('/api/recurring/').data['results'][0]['next_date'], '2024-03-15')
+
+    def test_api_rejects_categories_of_other_families(self):
+        stranger, _, _ = make_family('stranger')
+        foreign = BudgetCategory.objects.create(user=stranger, name='Theirs')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {'amount': '45.00', 'category': foreign.pk, 'frequency': 'monthly', 'start_date': '2024-01-15'}
+        response = client.post('/api/recurring/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data)
+
+        template = self.template()
+        response = client.patch(f'/api/recurring/{template.pk}/', {'category': foreign.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        template.refresh_from_db()
+        self.assertEqual(template.category_id, self.category.pk)
+
+
+class MultiCurrencyTests(TestCase):
+    RATES = (
+        'date,currency,rate\n'
+        '2024-03-01,RUB,100\n'
+        '2024-03-01,USD,1.10\n'
+        '2024-03-10,RUB,90\n'
+        '2024-03-10,RUB,95\n'
+        '2024-03-11,XX,1\n'
+        '2024-03-12,USD,-1\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Travel', monthly_limit=Decimal('2000.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def spend(self, amount, day, currency=''):
+        return Transaction.objects.create(
+            amount=Decimal(amount), date=date(2024, 3, day), category=self.category, currency=currency,
+            member=self.membership, user=self.user, type=Transaction.EXPENSE,
+        )
+
+    def test_load_rates_upserts_and_rejects(self):
+        written, rejects = fx.load_rates(StringIO(self.RATES))
+        self.assertEqual(written, 3)
+        self.assertEqual([line for line, _ in rejects], [6, 7])
+        self.assertEqual(ExchangeRate.objects.get(currency='RUB', date=date(2024, 3, 10)).rate, Decimal('95'))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('date,currency,rate\n2024-03-10,RUB,92.5\n')
+        self.addCleanup(os.unlink, handle.name)
+        out = StringIO()
+        call_command('load_exchange_rates', handle.name, stdout=out, stderr=StringIO())
+        self.assertIn('Loaded 1 rate(s) against EUR', out.getvalue())
+        self.assertEqual(ExchangeRate.objects.filter(currency='RUB').count(), 2)
+        self.assertEqual(ExchangeRate.objects.get(currency='RUB', date=date(2024, 3, 10)).rate, Decimal('92.5'))
+
+    def test_summary_converts_in_the_database_at_the_latest_prior_rate(self):
+        fx.load_rates(StringIO(self.RATES))
+        self.spend('500.00', 2)
+        self.spend('11.00', 5, 'USD')    # 11 / 1.10 * 100 RUB
+        self.spend('10.00', 12, 'EUR')   # at the 2024-03-10 rate, 95 RUB
+        self.spend('7.00', 12, 'RUB')
+        self.spend('3.00', 12, 'JPY')    # no rate
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/transactions/summary/')
+        self.assertEqual(len([query for query in captured if 'FROM "budget_transaction"' in query['sql']]), 1)
+        self.assertEqual(response.data['currency'], 'RUB')
+        self.assertEqual(response.data['unconverted'], 1)
+        self.assertEqual(response.data['expense'], '2457.00')
+        self.assertEqual(response.data['categories'][0]['expense'], '2457.00')
+
+        async_response = Client().get(
+            '/api/async/transactions/summary/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}',
+        )
+        self.assertEqual(async_response.json(), json.loads(JSONRenderer().render(response.data)))
+
+    def test_limits_count_converted_spend(self):
+        fx.load_rates(StringIO(self.RATES))
+        self.spend('1000.00', 2)
+        self.spend('6.60', 3, 'USD')     # 600 RUB, 80% of the limit
+        self.assertEqual(list(self.family.budget_alerts.values_list('threshold', 'spent')),
+                         [(80, Decimal('1600.00'))])
+
+        response = self.client.get('/api/categories/budgets/?month=2024-03')
+        self.assertEqual(response.data['currency'], 'RUB')
+        self.assertEqual(response.data['categories'][0]['spent'], '1600.00')
+
+    def test_changing_the_base_currency_converts_old_rows(self):
+        fx.load_rates(StringIO(self.RATES))
+        blank = self.spend('500.00', 2)  # 500 / 100 * 1.10 USD
+        self.spend('11.00', 5, 'USD')
+        rule = RecurringTransaction.objects.create(
+            family=self.family, member=self.membership, user=self.user, category=self.category,
+            amount=Decimal('100.00'), start_date=date(2024, 3, 1), next_date=date(2024, 4, 1),
+        )
+        since = sync.cursor(self.family.pk)
+
+        response = self.client.patch('/api/family/me/', {'base_currency': 'USD'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        summary = self.client.get('/api/transactions/summary/').data
+        self.assertEqual(summary['currency'], 'USD')
+        self.assertEqual(summary['expense'], '16.50')
+        self.assertEqual(summary['unconverted'], 0)
+
+        self.assertEqual(set(Transaction.objects.values_list('currency', flat=True)), {'RUB', 'USD'})
+        rule.refresh_from_db()
+        self.assertEqual(rule.currency, 'RUB')
+        self.assertEqual(rollups.find_drift([self.family.pk]), [])
+        changes, _, _ = sync.changes_since(self.family.pk, since)
+        self.assertEqual([change[:3] for change in changes], [(ChangeLog.TRANSACTION, blank.pk, False)])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_sqlite_rate_lookup_uses_currency_date_index(self):
+        plan = (
+            ExchangeRate.objects
+            .filter(currency='USD', date__lte=date(2024, 3, 5))
+            .order_by('-date')
+            .values('rate')[:1]
+            .explain()
+        )
+        # SQLite builds the unique constraint into the table as an autoindex.
+        self.assertIn('USING INDEX', plan)
+        self.assertIn('(currency=? AND date<?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class BalanceSeriesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.member_user = User.objects.create_user('member', 'member@example.com', 'password')
+        self.member = FamilyMembership.objects.create(user=self.member_user, family=self.family, role='member')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Home')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for membership, amount, day, type_ in (
+            (self.membership, '1000.00', date(2024, 1, 10), Transaction.INCOME),
+            (self.membership, '200.00', date(2024, 2, 5), Transaction.EXPENSE),
+            (self.member, '50.00', date(2024, 2, 10), Transaction.INCOME),
+            (self.membership, '100.00', date(2024, 4, 1), Transaction.EXPENSE),
+        ):
+            Transaction.objects.create(
+                amount=Decimal(amount), date=day, type=type_, category=self.category,
+                member=membership, user_id=membership.user_id,
+            )
+
+    def series(self, query):
+        return self.client.get(f'/api/transactions/balance-series/?{query}')
+
+    def test_running_balance_in_one_query_with_gaps_filled(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.series('interval=month&from=2024-02-15&to=2024-04-30')
+        self.assertEqual(len([query for query in captured if 'FROM "budget_transaction"' in query['sql']]), 1)
+        self.assertEqual(response.data['from'], '2024-02-01')
+        self.assertEqual(response.data['opening'], '1000.00')
+        self.assertEqual(response.data['points'], [
+            {'period': '2024-02-01', 'income': '50.00', 'expense': '200.00', 'balance': '850.00'},
+            {'period': '2024-03-01', 'income': '0.00', 'expense': '0.00', 'balance': '850.00'},
+            {'period': '2024-04-01', 'income': '0.00', 'expense': '100.00', 'balance': '750.00'},
+        ])
+
+    def test_per_member_weekly_series(self):
+        response = self.series(f'interval=week&from=2024-02-07&to=2024-02-20&member={self.member.pk}')
+        self.assertEqual([(point['period'], point['balance']) for point in response.data['points']], [
+            ('2024-02-05', '50.00'), ('2024-02-12', '50.00'), ('2024-02-19', '50.00'),
+        ])
+        self.assertEqual(response.data['opening'], '0.00')
+
+        self.assertEqual(self.series('interval=year').status_code, 400)
+        self.assertEqual(self.series('from=2024-03-01&to=2024-02-01').status_code, 400)
+        self.assertEqual(self.series('interval=day&from=1990-01-01&to=2024-01-01').status_code, 400)
+
+
+class BalanceCheckpointTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.member_user = User.objects.create_user('member', 'member@example.com', 'password')
+        self.member = FamilyMembership.objects.create(user=self.member_user, family=self.family, role='member')
+        self.category = BudgetCategory.objects.create(user=self.user, name='Home')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.add(self.membership, '1000.00', date(2024, 1, 10), Transaction.INCOME)
+        self.add(self.membership, '200.00', date(2024, 2, 5))
+        self.add(self.member, '50.00', date(2024, 3, 10), Transaction.INCOME)
+        self.add(self.membership, '30.00', date(2024, 4, 2))
+
+    def add(self, membership, amount, day, type_=Transaction.EXPENSE):
+        return Transaction.objects.create(
+            amount=Decimal(amount), date=day, type=type_, category=self.category,
+            member=membership, user_id=membership.user_id,
+        )
+
+    def expected(self, before, member=None):
+        balance = Decimal('0')
+        for txn in Transaction.objects.filter(family=self.family, date__lt=before):
+            if member is None or txn.member_id == member.pk:
+                balance += txn.amount if txn.type == Transaction.INCOME else -txn.amount
+        return balance
+
+    def assert_checkpoints_match_ledger(self):
+        for checkpoint in BalanceCheckpoint.objects.filter(family=self.family):
+            self.assertEqual(checkpoint.balance, self.expected(checkpoint.as_of, checkpoint.member), str(checkpoint))
+
+    def test_balance_reads_the_nearest_checkpoint_and_later_rows(self):
+        checkpoints.write(until=date(2024, 4, 1))
+        self.assertEqual(
+            set(BalanceCheckpoint.objects.filter(member=None).values_list('as_of', flat=True)),
+            {date(2024, 2, 1), date(2024, 3, 1), date(2024, 4, 1)},
+        )
+        self.assert_checkpoints_match_ledger()
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/transactions/balance/?date=2024-04-15')
+        ledger = [query['sql'] for query in captured if 'FROM "budget_transaction"' in query['sql']]
+        self.assertEqual(len(ledger), 1)
+        self.assertIn("'2024-04-01'", ledger[0])
+        self.assertEqual((response.data['balance'], response.data['checkpoint']), ('820.00', '2024-04-01'))
+
+        response = self.client.get(f'/api/transactions/balance/?date=2024-03-31&member={self.member.pk}')
+        self.assertEqual(response.data['balance'], '50.00')
+
+    def test_back_dated_changes_drop_later_checkpoints_until_recomputed(self):
+        checkpoints.write(until=date(2024, 5, 1))
+        owner_rows = BalanceCheckpoint.objects.filter(member=self.membership).count()
+
+        self.add(self.member, '5.00', date(2024, 2, 20))
+        self.assertEqual(
+            sorted(BalanceCheckpoint.objects.filter(member=None).values_list('as_of', flat=True)),
+            [date(2024, 2, 1)],
+        )
+        self.assertEqual(BalanceCheckpoint.objects.filter(member=self.membership).count(), owner_rows)
+
+        balance, checkpoint = checkpoints.balance_on(self.family.pk, date(2024, 4, 30))
+        self.assertEqual((balance, checkpoint), (Decimal('815.00'), date(2024, 2, 1)))
+        self.assertEqual(BalanceCheckpoint.objects.filter(member=None).count(), 4)
+        self.assert_checkpoints_match_ledger()
+
+        # This month's rows leave checkpoints alone; a new base currency drops them all.
+        self.add(self.membership, '1.00', date.today())
+        self.assertEqual(BalanceCheckpoint.objects.filter(member=None).count(), 4)
+        self.family.base_currency = 'USD'
+        self.family.save()
+        self.assertFalse(BalanceCheckpoint.objects.filter(family=self.family).exists())
+
+
+class CategoryTreeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.home = self.create('Home')
+        self.food = self.create('Food', self.home)
+        self.cafe = self.create('Cafe', self.food)
+        self.car = self.create('Car')
+
+    def create(self, name, parent=None):
+        response = self.client.post('/api/categories/', {'name': name, 'parent': parent and parent.pk}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return BudgetCategory.objects.get(pk=response.data['id'])
+
+    def move(self, category, parent):
+        return self.client.patch(f'/api/categories/{category.pk}/', {'parent': parent and parent.pk}, format='json')
+
+    def assert_closure_matches_parents(self):
+        expected = set()
+        for category in BudgetCategory.objects.all():
+            node, depth = category, 0
+            while node is not None:
+                expected.add((node.pk, category.pk, depth))
+                node, depth = node.parent, depth + 1
+        self.assertEqual(set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), expected)
+
+    def test_moves_and_deletes_keep_the_closure_in_step(self):
+        self.assert_closure_matches_parents()
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.move(self.food, self.car).status_code, 200)
+        closure = [query['sql'] for query in captured if 'budget_categoryclosure' in query['sql']]
+        # Cycle check, the delete, the subtree and new ancestors, one insert.
+        self.assertEqual(len(closure), 5, closure)
+        self.assert_closure_matches_parents()
+
+        response = self.move(self.car, self.cafe)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.data)
+        self.assertEqual(self.move(self.home, self.home).status_code, 400)
+
+        self.client.delete(f'/api/categories/{self.car.pk}/')
+        self.food.refresh_from_db()
+        self.assertIsNone(self.food.parent_id)
+        self.assert_closure_matches_parents()
+
+        self.assertEqual(self.move(self.food, None).status_code, 200)
+        self.assert_closure_matches_parents()
+
+        _, _, other = make_family('other', 'Other')
+        foreign = BudgetCategory.objects.create(user=other.user, name='Theirs')
+        self.assertEqual(self.move(self.food, foreign).status_code, 400)
+
+    def test_category_filters_and_totals_cover_the_subtree(self):
+        for category, amount in ((self.home, '100.00'), (self.food, '20.00'), (self.cafe, '3.00'), (self.car, '7.00')):
+            Transaction.objects.create(
+                amount=Decimal(amount), date=date(2024, 1, 10), type=Transaction.EXPENSE, category=category,
+                member=self.membership, user=self.user,
+            )
+
+        response = self.client.get(f'/api/transactions/?category={self.food.pk}&page_size=50')
+        self.assertEqual(sorted(row['amount'] for row in response.data['results']), ['20.00', '3.00'])
+        self.assertEqual(self.client.get('/api/transactions/?category=999999').status_code, 400)
+
+        response = self.client.get(f'/api/transactions/summary/?category={self.home.pk}')
+        self.assertEqual(response.data['expense'], '123.00')
+
+        response = self.client.get('/api/categories/tree/?from=2024-01&to=2024-01')
+        rows = {row['category']: row for row in response.data['categories']}
+        self.assertEqual(
+            [(rows[c.pk]['expense'], rows[c.pk]['subtree_expense']) for c in (self.home, self.food, self.cafe)],
+            [('100.00', '123.00'), ('20.00', '23.00'), ('3.00', '3.00')],
+        )
+        self.assertEqual(rows[self.food.pk]['parent'], self.home.pk)
+
+        response = self.client.get(f'/api/categories/tree/?category={self.food.pk}')
+        self.assertEqual([row['category'] for row in response.data['categories']], [self.food.pk, self.cafe.pk])
+
+        self.move(self.food, self.car)
+        response = self.client.get('/api/categories/tree/')
+        rows = {row['category']: row for row in response.data['categories']}
+        self.assertEqual((rows[self.home.pk]['subtree_expense'], rows[self.car.pk]['subtree_expense']),
+                         ('100.00', '30.00'))
+
+
+class SyncTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = BudgetCategory.objects.create(user=self.user, name='Food')
+
+    def add(self, amount, category=None):
+        return Transaction.objects.create(
+            amount=Decimal(amount), date=date(2024, 1, 10), type=Transaction.EXPENSE,
+            category=category or self.category, member=self.membership, user=self.user,
+        )
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_feed_returns_latest_state_and_tombstones_in_pages(self):
+        start = self.sync()
+        self.assertTrue(start['reset'])
+
+        kept, dropped = self.add('10.00'), self.add('20.00')
+        kept.description = 'edited'
+        kept.save()
+        self.client.delete(f'/api/transactions/{dropped.pk}/')
+        rent = self.client.post('/api/categories/', {'name': 'Rent'}, format='json').data['id']
+
+        page = self.sync(start['cursor'])
+        self.assertFalse(page['reset'] or page['more'])
+        changes = {(change['model'], change['object_id']): change for change in page['changes']}
+        self.assertEqual(len(page['changes']), 3)
+        self.assertEqual(changes['transaction', kept.pk]['data']['description'], 'edited')
+        self.assertEqual(changes['transaction', dropped.pk], {
+            'id': changes['transaction', dropped.pk]['id'], 'model': 'transaction', 'object_id': dropped.pk,
+            'deleted': True, 'data': None,
+        })
+        self.assertEqual(changes['category', rent]['data']['name'], 'Rent')
+        self.assertEqual(self.sync(page['cursor'])['changes'], [])
+
+        first = self.sync(start['cursor'], limit=2)
+        self.assertTrue(first['more'])
+        rest = self.sync(first['cursor'], limit=2)
+        self.assertEqual(rest['changes'][-1]['object_id'], rent)
+
+        # A member who leaves takes their categories out of the family's view.
+        other = User.objects.create_user('member', 'member@example.com', 'password')
+        membership = FamilyMembership.objects.create(user=other, family=self.family, role='member')
+        theirs = BudgetCategory.objects.create(user=other, name='Hobby')
+        cursor, membership_id = self.sync(rest['cursor'])['cursor'], membership.pk
+        membership.delete()
+        changes = {(change['model'], change['object_id']): change for change in self.sync(cursor)['changes']}
+        self.assertTrue(changes['membership', membership_id]['deleted'])
+        self.assertTrue(changes['category', theirs.pk]['deleted'])
+
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sync/', {'since': 0, 'limit': 5000}).status_code, 400)
+
+    def test_compaction_keeps_latest_entries_and_resets_stale_cursors(self):
+        cursor = self.sync(0)['cursor']
+        txn = self.add('10.00')
+        for index in range(3):
+            txn.description = f'v{index}'
+            txn.save()
+        self.add('5.00').delete()
+        _, gone, _ = make_family('gone', 'Gone')
+        gone_id = gone.pk
+        BudgetCategory.objects.create(user=gone.created_by, name='Orphan')
+        gone.delete()
+
+        call_command('compact_changelog', stdout=StringIO())
+        self.assertEqual(ChangeLog.objects.filter(model=ChangeLog.TRANSACTION, object_id=txn.pk).count(), 1)
+        self.assertTrue(ChangeLog.objects.filter(family_id=self.family.pk, deleted=True).exists())
+        self.assertFalse(ChangeLog.objects.filter(family_id=gone_id).exists())
+        self.assertEqual(len(self.sync(cursor)['changes']), 2)
+
+        ChangeLog.objects.update(created_at=timezone.now() - timedelta(days=sync.TOMBSTONE_DAYS + 1))
+        report = sync.compact()
+        self.assertEqual(report.tombstones, 1)
+        self.family.refresh_from_db()
+        self.assertGreater(self.family.sync_floor, cursor)
+        self.assertTrue(self.sync(cursor)['reset'])
+        self.assertFalse(self.sync(self.family.sync_floor)['reset'])
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.family, self.membership = make_family('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def flaky(self, failures):
+        calls = []
+
+        def run(**payload):
+            calls.append(payload)
+            if len(calls) <= failures:
+                raise RuntimeError('boom')
+            return {'calls': len(calls)}
+        jobs.HANDLERS['flaky'] = run
+        self.addCleanup(jobs.HANDLERS.pop, 'flaky', None)
+        return calls
+
+    def test_family_deletion_is_hidden_at_once_and_run_by_a_worker(self):
+        category = BudgetCategory.objects.create(user=self.user, name='Food')
+        make_transactions(self.membership, category, 5)
+
+        response = self.client.delete('/api/family/delete/')
+        self.assertEqual(response.status_code, 200)
+        job_id = response.data['job']
+        self.assertEqual(self.client.get('/api/family/me/').status_code, 404)
+        self.assertTrue(Family.objects.filter(pk=self.family.pk).exists())
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').data['status'], Job.QUEUED)
+
+        report = jobs.work(burst=True)
+        self.assertEqual((report.done, report.failed), (1, 0))
+        self.assertFalse(Family.objects.filter(pk=self.family.pk).exists())
+        self.assertFalse(Transaction.objects.exists())
+        status = self.client.get(f'/api/jobs/{job_id}/').data
+        self.assertEqual(status['status'], Job.DONE)
+        self.assertGreaterEqual(status['duration'], 0)
+        self.assertGreaterEqual(status['wait'], 0)
+
+        stranger = APIClient()
+        stranger.force_authenticate(User.objects.create_user('stranger', 'stranger@example.com', 'password'))
+        self.assertEqual(stranger.get(f'/api/jobs/{job_id}/').status_code, 404)
+
+    def test_account_deletion_answers_with_its_job(self):
+        response = self.client.delete('/api/me/')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=response.data['job'])
+        self.assertEqual((job.kind, job.user_id), ('delete_user', self.user.pk))
+
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.user_id), (Job.DONE, None))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_deletion_jobs_save_progress_per_batch(self):
+        category = BudgetCategory.objects.create(user=self.user, name='Food')
+        make_transactions(self.membership, category, 25)
+        job = jobs.enqueue('delete_family', {'family_id': self.family.pk, 'batch_size': 10})
+
+        with CaptureQueriesContext(connection) as queries:
+            jobs.work(burst=True)
+        saves = [query for query in queries if query['sql'].startswith('UPDATE "budget_job" SET "result"')]
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(len(saves), job.result['batches'])
+        self.assertEqual(job.result['rows']['budget.Transaction'], 25)
+
+    def test_failed_jobs_back_off_then_fail_for_good(self):
+        calls = self.flaky(failures=1)
+        job = jobs.enqueue('flaky', {'value': 1}, user_id=self.user.pk, max_attempts=2)
+
+        with self.assertLogs('budget.jobs', 'ERROR') as logs:
+            self.assertEqual(jobs.work(burst=True).failed, 1)
+        self.assertIn('Traceback', logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertEqual(job.error, 'RuntimeError: boom')
+        self.assertEqual(self.client.get(f'/api/jobs/{job.pk}/').data['error'], 'RuntimeError: boom')
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=jobs.BACKOFF - 5))
+        self.assertEqual(jobs.work(burst=True).done, 0)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.error), (Job.DONE, {'calls': 2}, ''))
+        self.assertEqual(calls, [{'value': 1}, {'value': 1}])
+
+        self.flaky(failures=5)
+        job = jobs.enqueue('flaky', max_attempts=1)
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+        # A worker that died mid-run leaves its job to the next one.
+        stale = jobs.enqueue('flaky', max_attempts=3)
+        Job.objects.filter(pk=stale.pk).update(
+            status=Job.RUNNING, attempts=1, locked_by='gone:1',
+            started_at=timezone.now() - timedelta(seconds=jobs.TIMEOUT + 1),
+        )
+        self.assertEqual(jobs.requeue_stale(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), (Job.QUEUED, ''))
+
+
+class ChunkedDeletionTests(TestCase):
+    """The batched deletion paths against the ORM cascade they replace."""
+
+    def setUp(self):
+        cache.clear()
+        self.owner, self.family, self.owner_membership = make_family('owner')
+        # The member also owns a family of their own.
+        self.member, self.other_family, other_membership = make_family('member', 'Other')
+        self.membership = FamilyMembership.objects.create(user=self.member, family=self.family)
+
+        food = BudgetCategory.objects.create(user=self.member, name='Food', monthly_limit=Decimal('50'))
+        cafe = BudgetCategory.objects.create(user=self.member, name='Cafe', parent=food)
+        # Another user's category under the member's: it must survive as a root.
+        coffee = BudgetCategory.objects.create(user=self.owner, name='Coffee', parent=cafe)
+        BudgetCategory.objects.create(user=self.owner, name='Beans', parent=coffee)
+        rent = BudgetCategory.objects.create(user=self.owner, name='Rent')
+
+        make_transactions(self.membership, cafe, 30)
+        make_transactions(self.owner_membership, food, 12)
+        make_transactions(self.owner_membership, rent, 20)
+        make_transactions(self.owner_membership, coffee, 7)
+        make_transactions(other_membership, food, 25)
+        template = RecurringTransaction.objects.create(
+            family=self.family, member=self.owner_membership, user=self.owner, category=food,
+            amount=Decimal('5'), start_date=date(2024, 1, 1),
+        )
+        Transaction.objects.filter(category=rent).update(recurring=template, occurrence=F('date'))
+        RecurringTransaction.objects.create(
+            family=self.family, member=self.membership, user=self.member, category=rent,
+            amount=Decimal('9'), start_date=date(2024, 1, 1),
+        )
+        BudgetAlert.objects.create(
+            family=self.family, category=food, month=date(2024, 1, 1), threshold=80,
+            spent=Decimal('40'), limit=Decimal('50'),
+        )
+        InviteCode.objects.create(family=self.family)
+        InviteCode.objects.create(family=self.other_family)
+        rollups.rebuild()
+        checkpoints.write(until=date(2024, 6, 1))
+
+    def snapshot(self):
+        state = {}
+        for model in [User, *apps.get_app_config('budget').get_models()]:
+            if model not in (ChangeLog, Job, TokenRevocation):
+                state[model._meta.label] = list(model.objects.order_by('pk').values())
+        state['changes'] = set(
+            ChangeLog.objects
+            .filter(family_id__in=Family.objects.values('pk'))
+            .values_list('family_id', 'model', 'object_id', 'deleted')
+        )
+        return state
+
+    def cascade(self, delete):
+        with transaction.atomic():
+            delete()
+            expected = self.snapshot()
+            transaction.set_rollback(True)
+        return expected
+
+    def test_family_deletion_matches_the_cascade(self):
+        expected = self.cascade(lambda: Family.objects.get(pk=self.family.pk).delete())
+
+        progress = []
+        report = deletion.delete_family(self.family.pk, batch_size=10, log=lambda r: progress.append(r.total))
+        self.assertEqual(self.snapshot(), expected)
+        self.assertFalse(ChangeLog.objects.filter(family_id=self.family.pk).exists())
+        self.assertEqual(report.deleted['budget.Transaction'], 69)
+        self.assertEqual(len(progress), report.batches)
+        self.assertEqual(progress, sorted(progress))
+
+    def test_user_deletion_matches_the_cascade(self):
+        expected = self.cascade(lambda: User.objects.get(pk=self.member.pk).delete())
+
+        report = deletion.delete_user(self.member.pk, batch_size=10)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertFalse(User.objects.filter(pk=self.member.pk).exists())
+        self.assertEqual(report.deleted['auth.User'], 1)
+        self.assertEqual(rollups.find_drift(), [])
+        coffee = BudgetCategory.objects.get(name='Coffee')
+        self.assertIsNone(coffee.parent_id)
+        self.assertEqual(
+            set(CategoryClosure.objects.values_list('ancestor__name', 'descendant__name')),
+            {('Coffee', 'Coffee'), ('Coffee', 'Beans'), ('Beans', 'Beans'), ('Rent', 'Rent')},
+        )
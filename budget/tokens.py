@@ -0,0 +1,56 @@
+import time
+
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import revocation
+from .membership import resolve_membership
+
+# Claims copied into every token so FamilyJWTAuthentication can build the
+# request user (and, usually, the membership) without touching the database.
+USER_CLAIMS = ('username', 'is_staff', 'is_superuser')
+FAMILY_CLAIMS = ('family_id', 'membership_id', 'role', 'claims_at')
+
+
+def add_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    membership = resolve_membership(user.pk)
+    token['family_id'] = membership.family_id if membership else None
+    token['membership_id'] = membership.pk if membership else None
+    token['role'] = membership.role if membership else None
+    # Sub-second issue time, compared with membership.invalidate()'s marker;
+    # ``iat`` is whole seconds and would reject tokens re-issued right after.
+    token['claims_at'] = time.time()
+    return token
+
+
+def issue_tokens(user):
+    """A fresh refresh/access pair for ``user`` with up-to-date family claims."""
+    refresh = add_claims(RefreshToken.for_user(user), user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+class FamilyTokenObtainPairSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class FamilyTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Re-read the family claims on every refresh instead of copying them from
+    the refresh token, so short-lived access tokens pick up membership changes.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        revocation.denylist.refresh()
+        revocation.check(refresh)
+        data = super().validate(attrs)
+        user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]})
+        data['access'] = str(add_claims(refresh.access_token, user))
+        return data
@@ -1,12 +1,16 @@
 ﻿from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from . import views_async
+
 from .views import (
     FamilyMemberViewSet,
     BudgetCategoryViewSet,
     TransactionViewSet,
+    RecurringTransactionViewSet,
     RegisterView,
     MeView,
+    LogoutView,
     InviteCreateView,
     JoinFamilyView,
     CreateFamilyView,
@@ -17,17 +21,22 @@ from .views import (
     LeaveFamilyView,
     DeleteFamilyView,
 AssignHeadView,
+    SyncView,
+    JobStatusView,
+    ResponseCacheStatsView,
 )
 
 router = DefaultRouter()
 router.register(r'familymembers', FamilyMemberViewSet)
 router.register(r'categories', BudgetCategoryViewSet)
 router.register(r'transactions', TransactionViewSet)
+router.register(r'recurring', RecurringTransactionViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('register/', RegisterView.as_view(), name='register'),
     path('me/', MeView.as_view(), name='me'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('invite/', InviteCreateView.as_view(), name='invite-create'),
     path('join/', JoinFamilyView.as_view(), name='join-family'),
     path('family/create/', CreateFamilyView.as_view(), name='create-family'),
@@ -38,5 +47,15 @@ urlpatterns = [
     path('family/leave/', LeaveFamilyView.as_view(), name='leave-family'),
     path('family/delete/', DeleteFamilyView.as_view(), name='delete-family'),
     path('family/assign-head/', AssignHeadView.as_view(), name='assign-head'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('jobs/<int:pk>/', JobStatusView.as_view(), name='job-status'),
+    path('cache/stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+
+    # Async (ASGI) variants of the read-heavy endpoints; same responses as above.
+    path('async/family/me/', views_async.current_family, name='async-family-me'),
+    path('async/family/members/', views_async.family_members, name='async-family-members'),
+    path('async/categories/', views_async.category_list, name='async-category-list'),
+    path('async/transactions/', views_async.transaction_list, name='async-transaction-list'),
+    path('async/transactions/summary/', views_async.transaction_summary, name='async-transaction-summary'),
 
 ]
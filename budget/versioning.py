@@ -0,0 +1,100 @@
+import hashlib
+import time
+from functools import partial, wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .membership import get_membership
+from .models import FamilyMembership
+
+
+def _cache_key(family_id):
+    return f'budget:family-version:{family_id}'
+
+
+def family_version(family_id):
+    version = cache.get(_cache_key(family_id))
+    if version is None:
+        # Start from the clock rather than 0 so that a counter lost to eviction
+        # never repeats a version a client may still hold an ETag for.
+        cache.add(_cache_key(family_id), time.time_ns(), timeout=None)
+        version = cache.get(_cache_key(family_id))
+    return version
+
+
+async def afamily_version(family_id):
+    version = await cache.aget(_cache_key(family_id))
+    if version is None:
+        await cache.aadd(_cache_key(family_id), time.time_ns(), timeout=None)
+        version = await cache.aget(_cache_key(family_id))
+    return version
+
+
+def _bump(family_ids):
+    for family_id in family_ids:
+        try:
+            cache.incr(_cache_key(family_id))
+        except ValueError:
+            cache.add(_cache_key(family_id), time.time_ns(), timeout=None)
+
+
+def bump(*family_ids):
+    family_ids = {family_id for family_id in family_ids if family_id is not None}
+    if not family_ids:
+        return
+    _bump(family_ids)
+    # Bump again at commit: a reader between the first bump and the commit
+    # would otherwise pair the new version with the old data.
+    transaction.on_commit(lambda: _bump(family_ids))
+
+
+def bump_user_families(user_id):
+    bump(*FamilyMembership.objects.filter(user_id=user_id).values_list('family_id', flat=True))
+
+
+def family_etag(request, membership, version=None, extra=None):
+    # ``request`` may also be a plain HttpRequest (async views); pass the
+    # version from afamily_version() there. ``extra`` is anything else the
+    # response depends on.
+    if version is None:
+        version = family_version(membership.family_id)
+    query = getattr(request, 'query_params', request.GET)
+    params = '&'.join(f'{key}={value}' for key, value in sorted(query.lists()))
+    accepted = getattr(request, 'accepted_media_type', '')
+    fingerprint = ':'.join(str(part) for part in (
+        membership.family_id, version, request.user.pk, membership.role, request.path, params, accepted, extra,
+    ))
+    return quote_etag(hashlib.sha1(fingerprint.encode()).hexdigest())
+
+
+def conditional_family_get(view_method=None, vary=None):
+    """
+    ETag a family-scoped GET handler by the family's version counter and
+    answer ``If-None-Match`` hits with 304 before the handler runs, so no
+    queryset or serializer work is done for unchanged data. ``vary(request)``
+    returns what else the response depends on, e.g. a date that defaults to
+    today.
+    """
+    if view_method is None:
+        return partial(conditional_family_get, vary=vary)
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        membership = get_membership(request)
+        if membership is None:
+            return view_method(self, request, *args, **kwargs)
+
+        etag = family_etag(request, membership, extra=vary(request) if vary else None)
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags or '*' in client_etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+    return wrapper
@@ -1,13 +1,26 @@
+import copy
+import io
+from datetime import date, datetime
+from decimal import Decimal
 from uuid import UUID
 
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import OpenApiResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework import viewsets, filters
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.http import StreamingHttpResponse
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters
@@ -20,11 +33,18 @@ from .permissions import IsOwnerOrReadOnly
 
 
 from .models import FamilyMember, BudgetCategory, Transaction
-from .models import InviteCode, Family, FamilyMembership
+from .models import InviteCode, Family, FamilyMembership, BudgetAlert, ChangeLog, Job, RecurringTransaction, currency_code
 from .permissions import IsOwnerOrReadOnly
-from .serializers import FamilyMemberSerializer, BudgetCategorySerializer, TransactionSerializer
+from .serializers import FamilyMemberSerializer, BudgetAlertSerializer, BudgetCategorySerializer, TransactionSerializer
 from .serializers_register import RegisterSerializer
 from .serializers_family import CreateFamilySerializer
+from .serializers_bulk import BulkTransactionSerializer
+from .serializers_export import TransactionExportFilterSerializer
+from .serializers_import import TransactionImportSerializer
+from .serializers_job import JobSerializer
+from .serializers_lean import TRANSACTION_LOOKUPS, LeanTransactionSerializer
+from .serializers_recurring import RecurringTransactionSerializer
+from .renderers import CSVRenderer, NDJSONRenderer
 from rest_framework import serializers
 from rest_framework import viewsets, filters, status
 from django_filters.rest_framework import DjangoFilterBackend
@@ -35,11 +55,102 @@ from rest_framework.exceptions import PermissionDenied
 from .models import Transaction, FamilyMembership
 from .serializers import TransactionSerializer
 from .permissions import IsOwnerOrReadOnly
+from . import categories, checkpoints, export, fx, jobs, limits, recurring, revocation, rollups, series, sync
+from .bulk import apply_bulk
+from .filters import TransactionFilter
+from .importer import RowError, TransactionImporter
+from .membership import get_membership
+from .pagination import LedgerPagination
+from .response_cache import cached_family_response, stats as response_cache_stats
+from .search import FullTextSearchFilter
+from .tokens import issue_tokens
+from .versioning import conditional_family_get
+
+# Most recent budget alerts returned by /api/categories/alerts/.
+ALERTS_SHOWN = 50
+
+
+def _money(value):
+    return format(Decimal(value).quantize(Decimal('0.01')), 'f')
+
+
+def _parse_month(value):
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def summary_params(params):
+    try:
+        start = _parse_month(params['from']) if params.get('from') else None
+        end = _parse_month(params['to']) if params.get('to') else None
+        category_id = int(params['category']) if params.get('category') else None
+    except ValueError:
+        raise ValueError('from/to must be YYYY-MM and category an integer')
+    if start and end and start > end:
+        raise ValueError('from must not be after to')
+    return start, end, category_id
+
+
+def default_today(param):
+    """``conditional_family_get(vary=...)`` for handlers where ``param`` defaults to today."""
+    def vary(request):
+        return None if request.query_params.get(param) else date.today()
+    return vary
+
+
+def series_params(params):
+    interval = params.get('interval') or 'month'
+    if interval not in series.INTERVALS:
+        raise ValueError(f'interval must be one of {", ".join(series.INTERVALS)}')
+    try:
+        start = date.fromisoformat(params['from']) if params.get('from') else None
+        end = date.fromisoformat(params['to']) if params.get('to') else date.today()
+        member_id = int(params['member']) if params.get('member') else None
+    except ValueError:
+        raise ValueError('from/to must be YYYY-MM-DD and member an integer')
+    if start and start > end:
+        raise ValueError('from must not be after to')
+    return interval, start and series.period_start(start, interval), end, member_id
+
+
+def summary_payload(start, end, currency, months, categories, unconverted):
+    income = sum((totals[Transaction.INCOME] for totals in months.values()), Decimal('0'))
+    expense = sum((totals[Transaction.EXPENSE] for totals in months.values()), Decimal('0'))
+    return {
+        'from': start.strftime('%Y-%m') if start else None,
+        'to': end.strftime('%Y-%m') if end else None,
+        'currency': currency,
+        # Foreign currency transactions left out for want of an exchange rate.
+        'unconverted': unconverted,
+        'income': _money(income),
+        'expense': _money(expense),
+        'balance': _money(income - expense),
+        'months': [
+            {
+                'month': month.strftime('%Y-%m'),
+                'income': _money(totals[Transaction.INCOME]),
+                'expense': _money(totals[Transaction.EXPENSE]),
+                'balance': _money(totals[Transaction.INCOME] - totals[Transaction.EXPENSE]),
+            }
+            for month, totals in months.items()
+        ],
+        'categories': [
+            {
+                'category': pk,
+                'category_name': totals['name'],
+                'income': _money(totals[Transaction.INCOME]),
+                'expense': _money(totals[Transaction.EXPENSE]),
+            }
+            for pk, totals in categories.items()
+        ],
+    }
 
 
 class FamilyMemberViewSet(viewsets.ModelViewSet):
     queryset = FamilyMember.objects.all()
     serializer_class = FamilyMemberSerializer
+    # Most SQL queries one request may issue, per action (viewsets) or HTTP
+    # method (APIViews), with cold caches; enforced by QueryBudgetTests.
+    query_budget = {'list': 2, 'retrieve': 1, 'create': 1}
 
     def get_queryset(self):
         return FamilyMember.objects.all().order_by('id')
@@ -47,13 +158,20 @@ class FamilyMemberViewSet(viewsets.ModelViewSet):
 
 class FamilyMembersView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 2}
 
+    @conditional_family_get
+    @cached_family_response()
     def get(self, request):
-        membership = FamilyMembership.objects.filter(user=request.user).select_related('family').first()
+        membership = get_membership(request)
         if not membership:
             return Response({'detail': 'User is not part of any family'}, status=404)
 
-        members = FamilyMembership.objects.filter(family=membership.family).select_related('user')
+        members = (
+            FamilyMembership.objects
+            .filter(family=membership.family, user__is_active=True)
+            .select_related('user')
+        )
         serializer = FamilyMemberDetailSerializer(members, many=True)
         return Response(serializer.data)
 
@@ -71,26 +189,25 @@ class BudgetCategoryViewSet(viewsets.ModelViewSet):
     queryset = BudgetCategory.objects.all()
     serializer_class   = BudgetCategorySerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
-    filter_backends    = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    filter_backends    = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields   = ['name']
     search_fields      = ['name', 'description']
     ordering_fields    = ['id', 'name']
+    pagination_class   = LedgerPagination
+    cursor_ordering    = ('id',)
+    query_budget       = {
+        'list': 1, 'retrieve': 1, 'create': 4, 'partial_update': 4, 'destroy': 10, 'budgets': 3, 'alerts': 1,
+        'tree': 3,
+    }
 
     def get_queryset(self):
-        membership = (
-            FamilyMembership.objects
-            .filter(user=self.request.user)
-            .select_related('family')
-            .first()
-        )
+        membership = get_membership(self.request)
         if not membership:
             return BudgetCategory.objects.none()
 
-        family = membership.family
-
         member_user_ids = (
             FamilyMembership.objects
-            .filter(family=family)
+            .filter(family_id=membership.family_id)
             .values_list('user_id', flat=True)
         )
 
@@ -100,11 +217,107 @@ class BudgetCategoryViewSet(viewsets.ModelViewSet):
             .order_by('id')
         )
 
+    @conditional_family_get
+    @cached_family_response()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        if not FamilyMembership.objects.filter(user=self.request.user).exists():
+        if not get_membership(self.request):
             raise PermissionDenied('You must be part of a family to add categories')
 
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.pk)
+
+    @extend_schema(
+        parameters=[OpenApiParameter('month', OpenApiTypes.STR, description='YYYY-MM, default: current month')],
+        responses={200: OpenApiResponse(description="Spend against each category's monthly limit")},
+    )
+    @action(detail=False, methods=['get'])
+    def budgets(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        try:
+            month = _parse_month(request.query_params['month']) if request.query_params.get('month') else None
+        except ValueError:
+            return Response({'detail': 'month must be YYYY-MM'}, status=400)
+
+        month = month or limits.current_month()
+        currency, rows = limits.spend_report(membership.family_id, month)
+        return Response({
+            'month': month.strftime('%Y-%m'),
+            'currency': currency,
+            'categories': [
+                {
+                    **row,
+                    'monthly_limit': None if row['monthly_limit'] is None else _money(row['monthly_limit']),
+                    'spent': _money(row['spent']),
+                    'remaining': None if row['remaining'] is None else _money(row['remaining']),
+                }
+                for row in rows
+            ],
+        })
+
+    @extend_schema(responses=BudgetAlertSerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def alerts(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        alerts = (
+            BudgetAlert.objects
+            .filter(family_id=membership.family_id)
+            .select_related('category')
+            .order_by('-created_at', '-id')[:ALERTS_SHOWN]
+        )
+        return Response(BudgetAlertSerializer(alerts, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('from', OpenApiTypes.STR, description='YYYY-MM, first month'),
+            OpenApiParameter('to', OpenApiTypes.STR, description='YYYY-MM, last month'),
+            OpenApiParameter('category', OpenApiTypes.INT, description='Only this category and its descendants'),
+        ],
+        responses={
+            200: OpenApiResponse(description="Own and subtree income/expense of every category"),
+            400: OpenApiResponse(description="Invalid month range"),
+        },
+    )
+    @action(detail=False, methods=['get'])
+    @conditional_family_get
+    def tree(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        try:
+            start, end, category_id = summary_params(request.query_params)
+        except ValueError as error:
+            return Response({'detail': str(error)}, status=400)
+
+        base = fx.base_currency(membership.family_id)
+        totals, unconverted = categories.tree_totals(membership.family_id, base, start, end, category_id)
+        income, expense = Transaction.INCOME, Transaction.EXPENSE
+        return Response({
+            'from': start.strftime('%Y-%m') if start else None,
+            'to': end.strftime('%Y-%m') if end else None,
+            'currency': base,
+            'unconverted': unconverted,
+            'categories': [
+                {
+                    'category': pk,
+                    'name': name,
+                    'parent': parent_id,
+                    'income': _money(totals[pk][income][0]),
+                    'expense': _money(totals[pk][expense][0]),
+                    'subtree_income': _money(totals[pk][income][1]),
+                    'subtree_expense': _money(totals[pk][expense][1]),
+                }
+                for pk, name, parent_id in categories.family_categories(membership.family_id, category_id)
+            ],
+        })
 
 
 class TransactionViewSet(viewsets.ModelViewSet):
@@ -112,35 +325,274 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
     serializer_class   = TransactionSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
-    filter_backends    = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
-    filterset_fields   = ['amount', 'date', 'category']
+    filter_backends    = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
+    filterset_class    = TransactionFilter
     search_fields      = ['description']
     ordering_fields    = ['amount', 'date']
+    pagination_class   = LedgerPagination
+    cursor_ordering    = ('date', 'id')
+    query_budget       = {
+        'list': 3, 'retrieve': 1, 'create': 10, 'partial_update': 4, 'destroy': 8,
+        'summary': 3, 'balance_series': 2, 'balance': 3, 'export': 1, 'import_statement': 14, 'bulk': 10,
+    }
 
     def get_queryset(self):
-        membership = (
-            FamilyMembership.objects
-            .filter(user=self.request.user)
-            .select_related('family')
-            .first()
-        )
+        membership = get_membership(self.request)
         if not membership:
             return Transaction.objects.none()
 
         return (
             Transaction.objects
-            .filter(member__family=membership.family)
+            .filter(family_id=membership.family_id)
+            .select_related('category', 'user')
             .order_by('date', 'id')
         )
 
+    @conditional_family_get
+    @cached_family_response()
+    def list(self, request, *args, **kwargs):
+        # Read path that skips model instances and ModelSerializer: one joined
+        # values() query per page, rendered to the same JSON as the serializer.
+        queryset = self.filter_queryset(self.get_queryset()).values(*TRANSACTION_LOOKUPS)
+        serializer = LeanTransactionSerializer()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
+
     def perform_create(self, serializer):
-        membership = FamilyMembership.objects.filter(user=self.request.user).first()
+        membership = get_membership(self.request)
+        if not membership:
+            raise PermissionDenied('You must be part of a family to add transactions')
+        serializer.save(user_id=self.request.user.pk, member=membership, family_id=membership.family_id)
+
+    def perform_update(self, serializer):
+        member = serializer.validated_data.get('member')
+        if member is not None:
+            serializer.save(family_id=member.family_id)
+        else:
+            serializer.save()
+
+    @extend_schema(
+        parameters=[TransactionExportFilterSerializer],
+        responses={
+            (200, 'text/csv'): OpenApiResponse(response=OpenApiTypes.STR, description="Family ledger as CSV"),
+            (200, 'application/x-ndjson'): OpenApiResponse(
+                response=OpenApiTypes.STR, description="Family ledger as NDJSON, one object per line",
+            ),
+        }
+    )
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        params = TransactionExportFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type, chunks = export.FORMATS[request.accepted_renderer.format]
+        rows = export.iter_rows(export.export_queryset(membership.family_id, **params.validated_data))
+        response = StreamingHttpResponse(chunks(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="transactions.{request.accepted_renderer.format}"'
+        return response
+
+    @extend_schema(
+        request={'multipart/form-data': TransactionImportSerializer},
+        responses={
+            200: OpenApiResponse(description="Import report: inserted, duplicates, rejects, rows/sec"),
+            400: OpenApiResponse(description="Invalid upload or column mapping"),
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_statement(self, request):
+        membership = get_membership(request)
+        if not membership:
+            raise PermissionDenied('You must be part of a family to add transactions')
+
+        serializer = TransactionImportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        importer = TransactionImporter(
+            membership, request.user,
+            columns=data['columns'], date_format=data['date_format'], delimiter=data['delimiter'],
+        )
+        stream = io.TextIOWrapper(data['file'].file, encoding=data['encoding'], newline='')
+        try:
+            report = importer.run(stream)
+        except (RowError, UnicodeDecodeError) as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.as_dict())
+
+    @extend_schema(
+        request=BulkTransactionSerializer,
+        responses={
+            200: OpenApiResponse(description="Per-item results for create, update and delete"),
+            400: OpenApiResponse(description="Malformed payload, or an item failed with all_or_nothing"),
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        membership = get_membership(request)
         if not membership:
             raise PermissionDenied('You must be part of a family to add transactions')
-        serializer.save(user=self.request.user, member=membership)
+
+        serializer = BulkTransactionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result = apply_bulk(membership, request.user, **serializer.validated_data)
+        if result.failed and serializer.validated_data['all_or_nothing']:
+            return Response(result.results, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.results)
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(description="Income/expense totals per month and category"),
+            400: OpenApiResponse(description="Invalid month range"),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditional_family_get
+    def summary(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        try:
+            start, end, category_id = summary_params(request.query_params)
+        except ValueError as error:
+            return Response({'detail': str(error)}, status=400)
+
+        summary = rollups.summarize(membership.family_id, start, end, category_id)
+        return Response(summary_payload(start, end, *summary))
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('date', OpenApiTypes.DATE, description='End of this day; default: today'),
+            OpenApiParameter('member', OpenApiTypes.INT, description='Only this family member\'s transactions'),
+        ],
+        responses={
+            200: OpenApiResponse(description="Balance as of the date"),
+            400: OpenApiResponse(description="Invalid date or member"),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditional_family_get(vary=default_today('date'))
+    def balance(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        params = request.query_params
+        try:
+            day = date.fromisoformat(params['date']) if params.get('date') else date.today()
+            member_id = int(params['member']) if params.get('member') else None
+        except ValueError:
+            return Response({'detail': 'date must be YYYY-MM-DD and member an integer'}, status=400)
+
+        currency = fx.base_currency(membership.family_id)
+        balance, checkpoint = checkpoints.balance_on(membership.family_id, day, member_id, currency)
+        return Response({
+            'date': day.isoformat(),
+            'member': member_id,
+            'currency': currency,
+            'balance': _money(balance),
+            'checkpoint': checkpoint.isoformat() if checkpoint else None,
+        })
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('interval', OpenApiTypes.STR, enum=tuple(series.INTERVALS), description='Default: month'),
+            OpenApiParameter('from', OpenApiTypes.DATE, description='Snapped to the start of its period'),
+            OpenApiParameter('to', OpenApiTypes.DATE, description='Default: today'),
+            OpenApiParameter('member', OpenApiTypes.INT, description='Only this family member\'s transactions'),
+        ],
+        responses={
+            200: OpenApiResponse(description="Running balance per period, gaps filled"),
+            400: OpenApiResponse(description="Invalid range, interval or member"),
+        }
+    )
+    @action(detail=False, methods=['get'], url_path='balance-series')
+    @conditional_family_get(vary=default_today('to'))
+    def balance_series(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        try:
+            interval, start, end, member_id = series_params(request.query_params)
+            currency = fx.base_currency(membership.family_id)
+            rows = series.series_queryset(membership.family_id, currency, interval, start, end, member_id)
+            opening, points, unconverted = series.fill_gaps(rows, interval, start, end)
+        except ValueError as error:
+            return Response({'detail': str(error)}, status=400)
+
+        return Response({
+            'interval': interval,
+            'from': start.isoformat() if start else None,
+            'to': end.isoformat(),
+            'member': member_id,
+            'currency': currency,
+            'unconverted': unconverted,
+            'opening': _money(opening),
+            'points': [
+                {
+                    'period': point['period'].isoformat(),
+                    'income': _money(point['income']),
+                    'expense': _money(point['expense']),
+                    'balance': _money(point['balance']),
+                }
+                for point in points
+            ],
+        })
+
+
+class RecurringTransactionViewSet(viewsets.ModelViewSet):
+    queryset = RecurringTransaction.objects.all()
+    serializer_class   = RecurringTransactionSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    query_budget       = {'list': 2, 'retrieve': 1, 'create': 3, 'partial_update': 3, 'destroy': 3}
+
+    def get_queryset(self):
+        membership = get_membership(self.request)
+        if not membership:
+            return RecurringTransaction.objects.none()
+
+        return (
+            RecurringTransaction.objects
+            .filter(family_id=membership.family_id)
+            .select_related('category')
+            .order_by('id')
+        )
+
+    def perform_create(self, serializer):
+        membership = get_membership(self.request)
+        if not membership:
+            raise PermissionDenied('You must be part of a family to add recurring transactions')
+        start = serializer.validated_data['start_date']
+        serializer.save(
+            user_id=self.request.user.pk, member=membership, family_id=membership.family_id, next_date=start,
+        )
+
+    def perform_update(self, serializer):
+        changes = serializer.validated_data
+        if not {'start_date', 'end_date', 'frequency', 'interval'} & set(changes):
+            serializer.save()
+            return
+
+        # A new schedule applies from today on; earlier dates stay as they were.
+        template = copy.copy(serializer.instance)
+        for name, value in changes.items():
+            setattr(template, name, value)
+        serializer.save(next_date=recurring.first_on_or_after(template, max(template.start_date, date.today())))
 
 
 class RegisterView(APIView):
+    query_budget = {'post': 5}
 
     @extend_schema(
         request=RegisterSerializer,
@@ -154,20 +606,26 @@ class RegisterView(APIView):
         if serializer.is_valid():
             user = serializer.save()
 
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            }, status=status.HTTP_201_CREATED)
+            return Response(issue_tokens(user), status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _account(request):
+    # The authenticated user is usually built from token claims alone; views
+    # that show or change the account itself need the full row.
+    user_model = get_user_model()
+    if isinstance(request.user, user_model):
+        return request.user
+    return user_model.objects.get(pk=request.user.pk)
+
+
 class MeView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 1, 'patch': 5, 'delete': 8}
 
     def get(self, request):
-        user = request.user
+        user = _account(request)
         return Response({
             "id": user.id,
             "username": user.username,
@@ -175,7 +633,7 @@ class MeView(APIView):
         })
 
     def patch(self, request):
-        user = request.user
+        user = _account(request)
         data = request.data
         if 'username' in data:
             user.username = data['username']
@@ -189,13 +647,49 @@ class MeView(APIView):
         })
 
     def delete(self, request):
-        user = request.user
-        user.delete()
-        return Response({"message": "User deleted"}, status=status.HTTP_204_NO_CONTENT)
+        user = _account(request)
+        # The account is disabled now; a worker deletes it and everything in it.
+        job = jobs.schedule_user_deletion(user)
+        return Response({"message": "User deleted", "job": job.pk}, status=status.HTTP_202_ACCEPTED)
+
+
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = {'post': 4}
+
+    @extend_schema(
+        request={
+            'application/json': {
+                'type': 'object',
+                'properties': {
+                    'refresh': {'type': 'string', 'description': 'Refresh token to revoke as well'},
+                },
+            }
+        },
+        responses={
+            200: OpenApiResponse(description="Tokens revoked"),
+            400: OpenApiResponse(description="Invalid refresh token"),
+        }
+    )
+    def post(self, request):
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                refresh = RefreshToken(refresh)
+            except TokenError:
+                return Response({'detail': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            if refresh.get(api_settings.USER_ID_CLAIM) != request.user.pk:
+                return Response({'detail': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            revocation.revoke_token(refresh)
+
+        if request.auth is not None:
+            revocation.revoke_token(request.auth)
+        return Response({'detail': 'Logged out'})
 
 
 class InviteCreateView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 1}
 
     @extend_schema(
         responses={
@@ -204,25 +698,21 @@ class InviteCreateView(APIView):
         }
     )
     def post(self, request):
-        membership = FamilyMembership.objects.filter(
-            user=request.user,
-            role='owner'
-        ).select_related('family').first()
+        membership = get_membership(request)
 
-        if not membership:
+        if not membership or membership.role != 'owner':
             return Response(
                 {'detail': 'Только владелец (owner) семьи может генерировать приглашения'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        family = membership.family
-
-        invite = InviteCode.objects.create(family=family)
+        invite = InviteCode.objects.create(family_id=membership.family_id)
         return Response({'code': str(invite.code)}, status=status.HTTP_201_CREATED)
 
 
 class JoinFamilyView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 7}
 
     def post(self, request):
         code = request.data.get('code')
@@ -230,26 +720,27 @@ class JoinFamilyView(APIView):
             return Response({'detail': 'Invite code is required'}, status=400)
 
         try:
-            invite = InviteCode.objects.get(code=UUID(code), is_used=False)
+            invite = InviteCode.objects.get(code=UUID(code), is_used=False, family__deleted_at__isnull=True)
         except InviteCode.DoesNotExist:
             return Response({'detail': 'Invalid or used code'}, status=400)
 
-        if FamilyMembership.objects.filter(user=request.user, family=invite.family).exists():
+        if FamilyMembership.objects.filter(user_id=request.user.pk, family_id=invite.family_id).exists():
             return Response({'detail': 'Already a member of this family'}, status=400)
 
         FamilyMembership.objects.create(
-            user=request.user,
-            family=invite.family,
+            user_id=request.user.pk,
+            family_id=invite.family_id,
             role='member'
         )
         invite.is_used = True
         invite.save()
 
-        return Response({'detail': 'Successfully joined the family!'})
+        return Response({'detail': 'Successfully joined the family!', **issue_tokens(request.user)})
 
 
 class CreateFamilyView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 5}
 
     @extend_schema(
         request=CreateFamilySerializer,
@@ -259,25 +750,31 @@ class CreateFamilyView(APIView):
         serializer = CreateFamilySerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             family = serializer.save()
-            FamilyMembership.objects.create(user=request.user, family=family, role='owner')
-            return Response({"detail": "Family created", "family_id": family.id}, status=201)
+            FamilyMembership.objects.create(user_id=request.user.pk, family=family, role='owner')
+            return Response(
+                {"detail": "Family created", "family_id": family.id, **issue_tokens(request.user)}, status=201,
+            )
         return Response(serializer.errors, status=400)
 
 
 class CurrentFamilyView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 2, 'patch': 5}
 
     @extend_schema(
         responses={200: OpenApiResponse(description="Current family info")},
     )
+    @conditional_family_get
+    @cached_family_response(per_user=True)
     def get(self, request):
-        membership = FamilyMembership.objects.filter(user=request.user).select_related('family').first()
+        membership = get_membership(request)
         if not membership:
             return Response({'detail': 'User is not part of any family'}, status=404)
 
         return Response({
             'id': membership.family.id,
             'name': membership.family.name,
+            'base_currency': membership.family.base_currency,
             'created_by': membership.family.created_by.username,
             'role': membership.role,
         })
@@ -288,14 +785,14 @@ class CurrentFamilyView(APIView):
                 'type': 'object',
                 'properties': {
                     'name': {'type': 'string', 'description': 'New family name'},
+                    'base_currency': {'type': 'string', 'description': 'ISO 4217 code reports convert into'},
                 },
-                'required': ['name'],
             }
         },
-        responses={200: OpenApiResponse(description="Family renamed")},
+        responses={200: OpenApiResponse(description="Family updated")},
     )
     def patch(self, request):
-        membership = FamilyMembership.objects.filter(user=request.user).select_related('family').first()
+        membership = get_membership(request)
         if not membership:
             return Response({'detail': 'User is not part of any family'}, status=404)
 
@@ -303,16 +800,28 @@ class CurrentFamilyView(APIView):
             return Response({'detail': 'Only the head can update family'}, status=403)
 
         new_name = request.data.get('name')
-        if not new_name:
+        base_currency = request.data.get('base_currency')
+        if not new_name and not base_currency:
             return Response({'detail': 'New name is required'}, status=400)
 
-        membership.family.name = new_name
-        membership.family.save()
-        return Response({'detail': 'Family updated', 'name': new_name})
+        family = membership.family
+        if base_currency:
+            try:
+                currency_code(base_currency)
+            except DjangoValidationError as error:
+                return Response({'base_currency': error.messages}, status=400)
+            family.base_currency = base_currency
+        if new_name:
+            family.name = new_name
+        with transaction.atomic():
+            # Blank-currency rows are stamped with the old base in the same transaction.
+            family.save()
+        return Response({'detail': 'Family updated', 'name': family.name, 'base_currency': family.base_currency})
 
 
 class RemoveFamilyMemberView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 9}
 
     @extend_schema(
         request={
@@ -340,9 +849,8 @@ class RemoveFamilyMemberView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            current_membership = FamilyMembership.objects.get(user=request.user)
-        except FamilyMembership.DoesNotExist:
+        current_membership = get_membership(request)
+        if not current_membership:
             return Response(
                 {'detail': 'You are not part of any family'},
                 status=status.HTTP_404_NOT_FOUND
@@ -363,7 +871,7 @@ class RemoveFamilyMemberView(APIView):
         try:
             membership_to_remove = FamilyMembership.objects.get(
                 pk=membership_id,
-                family=current_membership.family
+                family_id=current_membership.family_id
             )
         except FamilyMembership.DoesNotExist:
             return Response(
@@ -372,6 +880,8 @@ class RemoveFamilyMemberView(APIView):
             )
 
         membership_to_remove.delete()
+        # Their tokens still name this family; log them out everywhere.
+        revocation.revoke_user(membership_to_remove.user_id)
         return Response(
             {'detail': 'Member removed successfully'},
             status=status.HTTP_200_OK
@@ -380,6 +890,7 @@ class RemoveFamilyMemberView(APIView):
 
 class ChangeFamilyMemberRoleView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 3}
 
     @extend_schema(
         request={
@@ -415,9 +926,8 @@ class ChangeFamilyMemberRoleView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            current_membership = FamilyMembership.objects.get(user=request.user)
-        except FamilyMembership.DoesNotExist:
+        current_membership = get_membership(request)
+        if not current_membership:
             return Response(
                 {'detail': 'You are not part of any family'},
                 status=status.HTTP_404_NOT_FOUND
@@ -438,7 +948,7 @@ class ChangeFamilyMemberRoleView(APIView):
         try:
             target_membership = FamilyMembership.objects.get(
                 pk=membership_id,
-                family=current_membership.family
+                family_id=current_membership.family_id
             )
         except FamilyMembership.DoesNotExist:
             return Response(
@@ -450,14 +960,24 @@ class ChangeFamilyMemberRoleView(APIView):
             current_membership.role = 'member'
             current_membership.save()
 
+        demoted = target_membership.role == 'owner' and new_role == 'member'
         target_membership.role = new_role
         target_membership.save()
 
-        return Response({'detail': 'Role updated'}, status=status.HTTP_200_OK)
+        # A demoted owner's tokens still claim the owner role.
+        if demoted:
+            revocation.revoke_user(target_membership.user_id)
+        payload = {'detail': 'Role updated'}
+        if new_role == 'owner':
+            # Handing over ownership changed the caller's own role claim too.
+            revocation.revoke_user(request.user.pk)
+            payload.update(issue_tokens(request.user))
+        return Response(payload, status=status.HTTP_200_OK)
 
 
 class LeaveFamilyView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 9}
 
     @extend_schema(
         responses={
@@ -467,9 +987,7 @@ class LeaveFamilyView(APIView):
         }
     )
     def post(self, request):
-        user = request.user
-
-        membership = FamilyMembership.objects.filter(user=user).first()
+        membership = get_membership(request)
         if not membership:
             return Response({'detail': 'You are not in any family'}, status=404)
 
@@ -477,11 +995,15 @@ class LeaveFamilyView(APIView):
             return Response({'detail': 'Head of family cannot leave. Assign new head first.'}, status=403)
 
         membership.delete()
-        return Response({'detail': 'You have left the family'}, status=200)
+        # Tokens issued so far still name this family, and other processes
+        # would trust those claims; log out everywhere but this response.
+        revocation.revoke_user(request.user.pk)
+        return Response({'detail': 'You have left the family', **issue_tokens(request.user)}, status=200)
 
 
 class DeleteFamilyView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'delete': 4}
 
     @extend_schema(
         responses={
@@ -491,21 +1013,21 @@ class DeleteFamilyView(APIView):
         }
     )
     def delete(self, request):
-        user = request.user
-
-        membership = FamilyMembership.objects.filter(user=user).select_related('family').first()
+        membership = get_membership(request)
         if not membership:
             return Response({'detail': 'You are not in any family'}, status=404)
 
         if membership.role != 'owner':
             return Response({'detail': 'Only the head can delete the family'}, status=403)
 
-        membership.family.delete()
-        return Response({'detail': 'Family deleted'}, status=200)
+        # The family is hidden now; a worker deletes it and everything in it.
+        job = jobs.schedule_family_deletion(membership.family_id, user_id=request.user.pk)
+        return Response({'detail': 'Family deleted', 'job': job.pk, **issue_tokens(request.user)}, status=200)
 
 
 class AssignHeadView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 8}
 
     @extend_schema(
         request={
@@ -524,15 +1046,16 @@ class AssignHeadView(APIView):
         }
     )
     def post(self, request):
-        current_user = request.user
         new_head_id = request.data.get('user_id')
 
-        current_membership = FamilyMembership.objects.filter(user=current_user).select_related('family').first()
+        current_membership = get_membership(request)
         if not current_membership or current_membership.role != 'owner':
             return Response({'detail': 'Only the head can assign a new head'}, status=403)
 
         try:
-            new_head_membership = FamilyMembership.objects.get(user_id=new_head_id, family=current_membership.family)
+            new_head_membership = FamilyMembership.objects.select_related('user').get(
+                user_id=new_head_id, family_id=current_membership.family_id,
+            )
         except FamilyMembership.DoesNotExist:
             return Response({'detail': 'User not found in your family'}, status=404)
 
@@ -542,4 +1065,114 @@ class AssignHeadView(APIView):
         new_head_membership.role = 'owner'
         new_head_membership.save()
 
-        return Response({'detail': f'User {new_head_membership.user.username} is now the head'})
+        # The caller's other tokens still claim the owner role.
+        revocation.revoke_user(request.user.pk)
+        return Response({
+            'detail': f'User {new_head_membership.user.username} is now the head',
+            **issue_tokens(request.user),
+        })
+
+
+class SyncView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5}
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('since', OpenApiTypes.INT, description='Cursor from the previous response'),
+            OpenApiParameter('limit', OpenApiTypes.INT, description=f'Changes per page, at most {sync.MAX_BATCH_SIZE}'),
+        ],
+        responses={
+            200: OpenApiResponse(description="Changes after the cursor, or reset: download everything again"),
+            400: OpenApiResponse(description="Invalid cursor or limit"),
+            404: OpenApiResponse(description="User not in a family"),
+        }
+    )
+    @conditional_family_get
+    def get(self, request):
+        membership = get_membership(request)
+        if not membership:
+            return Response({'detail': 'User is not part of any family'}, status=404)
+
+        params = request.query_params
+        try:
+            since = int(params['since']) if params.get('since') else None
+            limit = int(params['limit']) if params.get('limit') else sync.BATCH_SIZE
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers'}, status=400)
+        if not 1 <= limit <= sync.MAX_BATCH_SIZE:
+            return Response({'detail': f'limit must be between 1 and {sync.MAX_BATCH_SIZE}'}, status=400)
+
+        family_id = membership.family_id
+        floor = Family.objects.filter(pk=family_id).values_list('sync_floor', flat=True).first()
+        if since is None or since < floor:
+            # No cursor, or one older than the compacted log: the client must
+            # download everything and continue from here.
+            return Response({'reset': True, 'cursor': sync.cursor(family_id), 'more': False, 'changes': []})
+
+        changes, cursor, more = sync.changes_since(family_id, since, limit)
+        upserts = {}
+        for model, object_id, deleted, _ in changes:
+            if not deleted:
+                upserts.setdefault(model, []).append(object_id)
+        data = {}
+        if ChangeLog.TRANSACTION in upserts:
+            rows = sync.visible(family_id, ChangeLog.TRANSACTION, upserts[ChangeLog.TRANSACTION])
+            data[ChangeLog.TRANSACTION] = LeanTransactionSerializer().to_representation(
+                rows.values(*TRANSACTION_LOOKUPS),
+            )
+        if ChangeLog.CATEGORY in upserts:
+            rows = sync.visible(family_id, ChangeLog.CATEGORY, upserts[ChangeLog.CATEGORY])
+            data[ChangeLog.CATEGORY] = BudgetCategorySerializer(rows, many=True).data
+        if ChangeLog.MEMBERSHIP in upserts:
+            rows = sync.visible(family_id, ChangeLog.MEMBERSHIP, upserts[ChangeLog.MEMBERSHIP])
+            data[ChangeLog.MEMBERSHIP] = FamilyMemberDetailSerializer(rows, many=True).data
+        current = {(model, item['id']): item for model, items in data.items() for item in items}
+
+        return Response({
+            'reset': False,
+            'cursor': cursor,
+            'more': more,
+            'changes': [
+                {
+                    'id': entry_id,
+                    'model': model,
+                    'object_id': object_id,
+                    # Upserted objects the family can no longer see are gone for it.
+                    'deleted': deleted or (model, object_id) not in current,
+                    'data': None if deleted else current.get((model, object_id)),
+                }
+                for model, object_id, deleted, entry_id in changes
+            ],
+        })
+
+
+class JobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = {'get': 1}
+
+    @extend_schema(
+        responses={
+            200: JobSerializer,
+            404: OpenApiResponse(description="No such job of yours"),
+        }
+    )
+    def get(self, request, pk):
+        queryset = Job.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(user_id=request.user.pk)
+        job = queryset.filter(pk=pk).first()
+        if job is None:
+            return Response({'detail': 'Job not found'}, status=404)
+        return Response(JobSerializer(job).data)
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+    query_budget = {'get': 0}
+
+    @extend_schema(
+        responses={200: OpenApiResponse(description="Response cache hit/miss counters")},
+    )
+    def get(self, request):
+        return Response(response_cache_stats())
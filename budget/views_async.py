@@ -0,0 +1,166 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import rollups
+from .authentication import AsyncJWTAuthentication
+from .membership import aresolve_membership
+from .models import BudgetCategory, FamilyMembership, Transaction
+from .pagination import KeysetPagination
+from .serializers import BudgetCategorySerializer
+from .serializers_lean import TRANSACTION_LOOKUPS, LeanTransactionSerializer
+from .versioning import afamily_version, family_etag
+from .views import (
+    BudgetCategoryViewSet,
+    FamilyMemberDetailSerializer,
+    TransactionViewSet,
+    summary_params,
+    summary_payload,
+)
+
+# Query parameters the async list endpoints serve themselves; anything else
+# (search, filters, ordering, page numbers, ?format=) is handed to the
+# synchronous viewset so the response is always the same as /api/<list>/.
+KEYSET_PARAMS = {KeysetPagination.cursor_query_param, KeysetPagination.page_size_query_param}
+
+_transaction_list = sync_to_async(TransactionViewSet.as_view({'get': 'list'}))
+_category_list = sync_to_async(BudgetCategoryViewSet.as_view({'get': 'list'}))
+
+
+def _render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+def async_family_get(view):
+    """
+    Authenticate a JWT, resolve the family membership and answer
+    ``If-None-Match`` from the family version counter, all without leaving
+    the event loop. The view is called as ``view(request, membership)``;
+    membership may be None.
+    """
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return _render(
+                {'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED,
+            )
+
+        authenticator = AsyncJWTAuthentication()
+        try:
+            result = await authenticator.aauthenticate(request)
+        except exceptions.AuthenticationFailed as error:
+            result, detail = None, error.detail
+        else:
+            detail = exceptions.NotAuthenticated.default_detail
+        if result is None:
+            response = _render(
+                detail if isinstance(detail, dict) else {'detail': detail}, status.HTTP_401_UNAUTHORIZED,
+            )
+            response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+        request.user, _ = result
+
+        membership = await aresolve_membership(request.user.pk)
+        if membership is None:
+            return await view(request, None, *args, **kwargs)
+
+        etag = family_etag(request, membership, await afamily_version(membership.family_id))
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags or '*' in client_etags:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        response = await view(request, membership, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+    return wrapper
+
+
+async def _keyset_page(request, queryset, ordering, represent):
+    paginator = KeysetPagination()
+    paginator.ordering = ordering
+    try:
+        page = await paginator.apaginate_queryset(queryset, Request(request))
+    except exceptions.ParseError as error:
+        return _render({'detail': error.detail}, error.status_code)
+    return _render(paginator.get_paginated_response(represent(page)).data)
+
+
+@async_family_get
+async def current_family(request, membership):
+    if not membership:
+        return _render({'detail': 'User is not part of any family'}, status.HTTP_404_NOT_FOUND)
+
+    return _render({
+        'id': membership.family.id,
+        'name': membership.family.name,
+        'base_currency': membership.family.base_currency,
+        'created_by': membership.family.created_by.username,
+        'role': membership.role,
+    })
+
+
+@async_family_get
+async def family_members(request, membership):
+    if not membership:
+        return _render({'detail': 'User is not part of any family'}, status.HTTP_404_NOT_FOUND)
+
+    members = (
+        FamilyMembership.objects
+        .filter(family_id=membership.family_id, user__is_active=True)
+        .select_related('user')
+    )
+    return _render(FamilyMemberDetailSerializer([member async for member in members], many=True).data)
+
+
+@async_family_get
+async def transaction_list(request, membership):
+    if set(request.GET) - KEYSET_PARAMS:
+        return await _transaction_list(request)
+    if not membership:
+        queryset = Transaction.objects.none()
+    else:
+        queryset = Transaction.objects.filter(family_id=membership.family_id)
+    serializer = LeanTransactionSerializer()
+    return await _keyset_page(
+        request, queryset.values(*TRANSACTION_LOOKUPS), TransactionViewSet.cursor_ordering,
+        serializer.to_representation,
+    )
+
+
+@async_family_get
+async def category_list(request, membership):
+    if set(request.GET) - KEYSET_PARAMS:
+        return await _category_list(request)
+    if not membership:
+        queryset = BudgetCategory.objects.none()
+    else:
+        member_user_ids = FamilyMembership.objects.filter(family_id=membership.family_id).values('user_id')
+        queryset = BudgetCategory.objects.filter(user__in=member_user_ids)
+    return await _keyset_page(
+        request, queryset, BudgetCategoryViewSet.cursor_ordering,
+        lambda page: BudgetCategorySerializer(page, many=True).data,
+    )
+
+
+@async_family_get
+async def transaction_summary(request, membership):
+    if not membership:
+        return _render({'detail': 'User is not part of any family'}, status.HTTP_404_NOT_FOUND)
+
+    try:
+        start, end, category_id = summary_params(request.GET)
+    except ValueError as error:
+        return _render({'detail': str(error)}, status.HTTP_400_BAD_REQUEST)
+
+    summary = await rollups.asummarize(membership.family_id, start, end, category_id)
+    return _render(summary_payload(start, end, *summary))
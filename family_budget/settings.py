@@ -102,7 +102,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'budget.authentication.FamilyJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -131,9 +131,48 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+# Access tokens carry the user's family and role (see budget.tokens) and are
+# trusted without a database lookup, so they are kept short-lived; clients
+# renew them through /api/token/refresh/, which re-reads the claims.
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=60),
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=14),
+    'TOKEN_OBTAIN_SERIALIZER': 'budget.tokens.FamilyTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'budget.tokens.FamilyTokenRefreshSerializer',
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Family membership and version counters live in 'default'; rendered read
+# responses in 'responses'. Local memory is per process, so deployments with
+# several worker processes should point both at a shared backend, e.g.
+# 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# directory, or Redis/Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'budget-default',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'budget-responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+BUDGET_RESPONSE_CACHE_MAX_BYTES = 512 * 1024
+
+# Currency every ExchangeRate.rate is quoted against (units per one unit of it).
+BUDGET_FX_PIVOT = 'EUR'
+
+# Days tombstones stay in the sync change log; older cursors must download everything again.
+BUDGET_SYNC_TOMBSTONE_DAYS = 90
+
+# Background jobs (manage.py run_workers): seconds before the first retry, doubled
+# after each further failure, and before a running job is taken for a dead worker's.
+BUDGET_JOBS_BACKOFF = 30
+BUDGET_JOBS_TIMEOUT = 3600